@@ -0,0 +1,225 @@
+"""
+Run many (repo_url, feature_description) jobs from a JSONL file.
+
+Each input line is a JSON object with "repo_url" and "feature_description",
+and optionally "id" and "ref" (branch, tag or commit to check out). One result
+record per job is appended to the results file. Jobs that already have a
+successful record are skipped, so a crashed batch can be restarted with the
+same arguments; the per-job stage checkpoints and the completion cache make
+the jobs it re-runs cheap.
+
+A job that failed and is re-run on resume appends a second record, so the
+results file can hold several records per job id. The last one wins: read
+the file with latest_results() rather than line by line.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from pipeline import fingerprint
+from repo_pool import RepoPool, get_default_repo_pool
+
+DEFAULT_BATCH_WORKERS = 4
+
+
+def load_jobs(jobs_path: Path) -> List[Dict]:
+    """Parse a JSONL job file, assigning ids to jobs that lack one and dropping duplicates"""
+    jobs = OrderedDict()
+    with open(jobs_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{jobs_path}:{line_number}: invalid JSON: {str(e)}")
+            if not job.get('repo_url') or not job.get('feature_description'):
+                raise ValueError(f"{jobs_path}:{line_number}: repo_url and feature_description are required")
+            job_id = str(job.get('id') or fingerprint(job['repo_url'], job['feature_description'], job.get('ref'))[:16])
+            jobs[job_id] = dict(job, id=job_id)
+    return list(jobs.values())
+
+
+def latest_results(results_path: Path) -> Dict[str, Dict]:
+    """The last result record of every job in a results file, by job id"""
+    latest = {}
+    try:
+        with open(results_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash
+                    continue
+                latest[record.get('job_id')] = record
+    except FileNotFoundError:
+        pass
+    return latest
+
+
+def completed_job_ids(results_path: Path) -> set:
+    """Ids of jobs whose latest result record succeeded"""
+    return {job_id for job_id, record in latest_results(results_path).items() if record.get('status') == 'succeeded'}
+
+
+class BatchRunner:
+    """
+    Runs jobs on a bounded pool of workers. Jobs for the same repository run one
+    after another (they share its mirror, worktree and warm test worker) while
+    different repositories run in parallel; all jobs share one LLM client, so
+    throughput grows with workers until the provider's rate limit is reached.
+    """
+
+    def __init__(self, results_path: Path, workers: int = DEFAULT_BATCH_WORKERS,
+                 state_dir: Optional[Path] = None, together_api_key: Optional[str] = None,
+                 repo_pool: Optional[RepoPool] = None):
+        self.results_path = Path(results_path)
+        self.workers = workers
+        self.state_dir = Path(state_dir) if state_dir else self.results_path.with_suffix('.state')
+        self.together_api_key = together_api_key or os.environ.get("TOGETHER_API_KEY")
+        self.repo_pool = repo_pool or get_default_repo_pool()
+        self.logger = logging.getLogger(__name__)
+        self._results_lock = threading.Lock()
+
+    def _write_result(self, record: Dict):
+        with self._results_lock:
+            self.results_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.results_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _save_artifacts(self, job_dir: Path, repo_path: Path, paths: List[Path]) -> List[str]:
+        """Copy a job's outputs out of the worktree before it is returned to the pool"""
+        saved = []
+        for path in paths:
+            if not path.exists():
+                continue
+            rel = path.relative_to(repo_path)
+            target = job_dir / 'artifacts' / rel
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(path, target)
+            saved.append(str(target))
+        return saved
+
+    def run_job(self, job: Dict) -> Dict:
+        """Generate tests and implement the feature for one job; never raises"""
+        # The agents pull in the LLM client and the codebase tooling; loading them here keeps
+        # resuming a finished batch fast
+        from test_generation_agent import TestCaseGenerator
+        from code_generation_agent import FeatureImplementer
+
+        job_dir = self.state_dir / job['id']
+        record = {
+            'job_id': job['id'], 'repo_url': job['repo_url'], 'feature_description': job['feature_description'],
+            'ref': job.get('ref'), 'status': 'failed', 'error': None, 'started_at': time.time(),
+            'stage_timings': {}, 'artifacts': [],
+        }
+        start = time.perf_counter()
+        lease = None
+        try:
+            checkout_start = time.perf_counter()
+            lease = self.repo_pool.lease(job['repo_url'], job.get('ref'))
+            record['stage_timings']['checkout'] = time.perf_counter() - checkout_start
+            record.update(worktree=str(lease.path), commit=lease.commit)
+
+            generator = TestCaseGenerator(
+                job['repo_url'], job['feature_description'], self.together_api_key,
+                checkpoint_path=job_dir / 'generate_tests.json', repo_path=lease.path, repo_pool=self.repo_pool,
+            )
+            try:
+                generator.generate_and_run_tests()
+            finally:
+                record['stage_timings']['generate_tests'] = generator.stage_timings
+            if generator.test_report is not None:
+                record['generated_tests'] = generator.test_report.counts
+
+            implementer = FeatureImplementer(
+                job['repo_url'], job['feature_description'], self.together_api_key,
+                checkpoint_path=job_dir / 'implement_features.json', repo_path=lease.path, repo_pool=self.repo_pool,
+            )
+            try:
+                implementer.implement_features()
+            finally:
+                record['stage_timings']['implement_features'] = implementer.stage_timings
+            if implementer.test_report is not None:
+                record['baseline_tests'] = implementer.test_report.counts
+            record['output_tokens'] = implementer.output_tokens
+
+            outputs = ([generator.test_file] if generator.test_file else []) + implementer.written_files
+            record['artifacts'] = self._save_artifacts(job_dir, lease.path, outputs)
+            record['status'] = 'succeeded'
+        except Exception as e:
+            self.logger.error(f"Job {job['id']} failed: {str(e)}")
+            record['error'] = f"{type(e).__name__}: {str(e)}"
+        finally:
+            if lease is not None:
+                lease.release()
+            record['duration'] = time.perf_counter() - start
+            self._write_result(record)
+        return record
+
+    def run(self, jobs: List[Dict]) -> Dict[str, int]:
+        """Run every job that has not already succeeded; returns counts by status"""
+        from test_worker import close_test_worker
+
+        done = completed_job_ids(self.results_path)
+        queues: Dict[str, deque] = OrderedDict()
+        for job in jobs:
+            if job['id'] not in done:
+                queues.setdefault(job['repo_url'], deque()).append(job)
+        pending = sum(len(queue) for queue in queues.values())
+        self.logger.info(
+            f"Running {pending} jobs across {len(queues)} repositories with {self.workers} workers "
+            f"({len(jobs) - pending} already completed)"
+        )
+
+        counts = {'succeeded': 0, 'failed': 0, 'skipped': len(jobs) - pending}
+        start = time.perf_counter()
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='batch') as pool:
+            while queues or running:
+                # Start the next job of every idle repository while workers are free
+                busy = set(running.values())
+                for repo_url in list(queues):
+                    if len(running) >= self.workers:
+                        break
+                    if repo_url in busy:
+                        continue
+                    job = queues[repo_url].popleft()
+                    if not queues[repo_url]:
+                        del queues[repo_url]
+                    running[pool.submit(self.run_job, job)] = repo_url
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    repo_url = running.pop(future)
+                    counts[future.result()['status']] += 1
+                    if repo_url not in queues:
+                        # No more jobs for this repository: free its warm test worker
+                        for worktree in self.repo_pool.worktree_paths(repo_url):
+                            close_test_worker(worktree)
+
+        self.logger.info(
+            f"Batch finished in {time.perf_counter() - start:.1f}s: {counts['succeeded']} succeeded, "
+            f"{counts['failed']} failed, {counts['skipped']} skipped"
+        )
+        return counts
+
+
+def main():
+    from cli import main as cli_main
+    cli_main(['run-batch'] + sys.argv[1:])
+
+
+if __name__ == "__main__":
+    main()
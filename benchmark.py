@@ -0,0 +1,335 @@
+"""
+Offline end-to-end benchmark of both agents.
+
+Builds a synthetic git repository of the requested size, serves canned model
+responses from a local FakeLLMServer and runs TestCaseGenerator followed by
+FeatureImplementer against it, recording the wall time of every stage. Results
+are written as JSON; pass an earlier results file with --compare to print the
+per-stage change and (with --fail-on-regression) fail on slowdowns.
+
+    python benchmark.py --files 200 --file-lines 300 --tests 40 --repeats 3 --output bench.json
+    python benchmark.py ... --output new.json --compare bench.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fake_llm_server import FakeLLMServer
+from llm_cache import CompletionCache
+from llm_client import LLMClient
+from repo_pool import RepoPool
+from test_cache import TestResultCache
+from test_worker import close_test_worker
+from test_generation_agent import CODER_MODEL, THOUGHT_MODEL, TestCaseGenerator
+from code_generation_agent import FeatureImplementer
+
+RESULTS_VERSION = 1
+FEATURE_DESCRIPTION = "Add a feature_total(values) helper to mod_0 that sums func_0_0 over the values."
+# Prompt text that tells the fake server which agent is asking. The think prompt is the
+# test prompt plus a suffix, so it is told apart by model (rules match in order)
+TEST_PROMPT_MARKER = "test-driven development"
+IMPLEMENTATION_PROMPT_MARKER = "implement the necessary changes"
+THOUGHT_RESPONSE = "The tests should import the existing helpers and check feature_total on a few inputs."
+# Lines per synthetic function, blank line included
+FUNCTION_LINES = 5
+# Stage time differences below this are noise, whatever the relative change
+MIN_REGRESSION_SECONDS = 0.005
+DEFAULT_REGRESSION_THRESHOLD = 0.2
+# Wall time allowed for a CLI invocation that does no work, interpreter start included
+STARTUP_BUDGET_SECONDS = 0.2
+STARTUP_SAMPLES = 7
+
+
+def _module_source(index: int, lines: int) -> str:
+    functions = []
+    for j in range(max(1, lines // FUNCTION_LINES)):
+        functions.append(
+            f"def func_{index}_{j}(x):\n"
+            f"    \"\"\"Return x scaled by {j + 1} and offset by {index}\"\"\"\n"
+            f"    value = x * {j + 1}\n"
+            f"    return value + {index}\n"
+        )
+    return f'"""Synthetic module {index}"""\n\n\n' + '\n\n'.join(functions)
+
+
+def make_synthetic_repo(repo_path: Path, files: int, file_lines: int) -> Path:
+    """Create a committed git repository of `files` flat modules of about `file_lines` lines each"""
+    repo_path = Path(repo_path)
+    repo_path.mkdir(parents=True, exist_ok=True)
+    for i in range(files):
+        (repo_path / f"mod_{i}.py").write_text(_module_source(i, file_lines), encoding='utf-8')
+    (repo_path / 'README.md').write_text("Synthetic benchmark repository\n", encoding='utf-8')
+    git = ['git', '-c', 'user.name=benchmark', '-c', 'user.email=benchmark@localhost', '-c', 'init.defaultBranch=main']
+    subprocess.run(git + ['init', '-q'], cwd=repo_path, check=True)
+    subprocess.run(git + ['add', '-A'], cwd=repo_path, check=True)
+    subprocess.run(git + ['commit', '-q', '-m', 'Synthetic repository'], cwd=repo_path, check=True)
+    return repo_path
+
+
+def synthetic_tests(files: int, tests: int) -> str:
+    """Canned test file: tests - 1 passing tests over the modules and one for the missing feature"""
+    lines = ["import pytest", ""]
+    for k in range(max(0, tests - 1)):
+        index = k % files
+        lines += [
+            f"def test_func_{index}_0_case_{k}():",
+            f"    from mod_{index} import func_{index}_0",
+            f"    assert func_{index}_0({k}) == {k + index}",
+            "",
+        ]
+    lines += [
+        "def test_feature_total():",
+        "    from mod_0 import feature_total",
+        "    assert feature_total([1, 2, 3]) == 6",
+        "",
+    ]
+    return "```python\n" + "\n".join(lines) + "```\n"
+
+
+def synthetic_implementation(file_lines: int) -> str:
+    """Canned implementation: mod_0 with feature_total added"""
+    source = _module_source(0, file_lines) + (
+        "\n\ndef feature_total(values):\n"
+        "    \"\"\"Sum of func_0_0 over values\"\"\"\n"
+        "    return sum(func_0_0(v) for v in values)\n"
+    )
+    return f"```python:mod_0.py\n{source}```\n"
+
+
+def _environment() -> Dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {'python': sys.version.split()[0], 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'agent_commit': commit}
+
+
+def _stats(values: List[float]) -> Dict[str, float]:
+    return {'min': min(values), 'median': statistics.median(values), 'mean': statistics.fmean(values),
+            'max': max(values)}
+
+
+def summarize_runs(runs: List[Dict]) -> Dict[str, Dict[str, float]]:
+    """Timing statistics over the runs for every pipeline total and stage, keyed 'pipeline' or 'pipeline.stage'"""
+    samples: Dict[str, List[float]] = {}
+    for run in runs:
+        for pipeline in ('generate_tests', 'implement_features'):
+            samples.setdefault(pipeline, []).append(run[pipeline]['total'])
+            for stage, seconds in run[pipeline]['stages'].items():
+                samples.setdefault(f"{pipeline}.{stage}", []).append(seconds)
+    return {name: _stats(values) for name, values in samples.items()}
+
+
+def measure_startup(samples: int = STARTUP_SAMPLES) -> Dict[str, Dict[str, float]]:
+    """
+    Wall time of CLI invocations that should return without loading the agents: the help
+    texts and a batch whose jobs have all succeeded. Each sample is a fresh interpreter.
+    """
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli.py')
+    with tempfile.TemporaryDirectory(prefix='agent-bench-startup-') as tmp:
+        jobs, results = os.path.join(tmp, 'jobs.jsonl'), os.path.join(tmp, 'results.jsonl')
+        with open(jobs, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'id': 'done', 'repo_url': 'file:///nonexistent', 'feature_description': 'noop'}) + '\n')
+        with open(results, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'job_id': 'done', 'status': 'succeeded'}) + '\n')
+        commands = {
+            'help': ['--help'],
+            'implement_help': ['implement', '--help'],
+            'run_batch_noop': ['--log-level', 'WARNING', 'run-batch', jobs, '--results', results],
+        }
+        timings = {}
+        for name, args in commands.items():
+            values = []
+            for _ in range(samples):
+                start = time.perf_counter()
+                subprocess.run([sys.executable, cli] + args, check=True, stdout=subprocess.DEVNULL)
+                values.append(time.perf_counter() - start)
+            timings[name] = _stats(values)
+    return timings
+
+
+def over_startup_budget(startup: Dict[str, Dict[str, float]], budget: float = STARTUP_BUDGET_SECONDS) -> List[str]:
+    """Startup commands whose median exceeds the budget"""
+    return [name for name, stats in startup.items() if stats['median'] > budget]
+
+
+def make_fake_server(files: int, file_lines: int, tests: int, latency: float = 0.0,
+                     chunk_chars: int = 16, chunk_delay: float = 0.0) -> FakeLLMServer:
+    """Fake model server answering the think, test and implementation prompts of a synthetic run"""
+    server = FakeLLMServer(default_response=THOUGHT_RESPONSE, latency=latency,
+                           chunk_chars=chunk_chars, chunk_delay=chunk_delay)
+    server.add_rule(TEST_PROMPT_MARKER, THOUGHT_RESPONSE, model=THOUGHT_MODEL)
+    server.add_rule(IMPLEMENTATION_PROMPT_MARKER, synthetic_implementation(file_lines), model=CODER_MODEL)
+    server.add_rule(TEST_PROMPT_MARKER, synthetic_tests(files, tests), model=CODER_MODEL)
+    return server
+
+
+def run_benchmark(files: int = 20, file_lines: int = 100, tests: int = 10, repeats: int = 3,
+                  latency: float = 0.0, chunk_chars: int = 16, chunk_delay: float = 0.0, warm: bool = False,
+                  work_dir: Optional[Path] = None) -> Dict:
+    """
+    Run both agents `repeats` times against a synthetic repository and return the results.
+    Cold runs (the default) give every repeat empty caches and checkpoints, so every stage
+    does its full work; warm runs share them, measuring the cached paths after the first.
+    """
+    logger = logging.getLogger(__name__)
+    config = {'files': files, 'file_lines': file_lines, 'tests': tests, 'repeats': repeats, 'latency': latency,
+              'chunk_chars': chunk_chars, 'chunk_delay': chunk_delay, 'warm': warm}
+    own_work_dir = work_dir is None
+    work_dir = Path(work_dir or tempfile.mkdtemp(prefix='agent-bench-'))
+    server = make_fake_server(files, file_lines, tests, latency, chunk_chars, chunk_delay)
+    server.start()
+    # No client-side rate limit: the benchmark measures the agents, not the provider
+    client = LLMClient(api_key='benchmark', base_url=server.base_url, requests_per_second=1000.0, max_concurrency=16)
+    runs = []
+    try:
+        repo_url = make_synthetic_repo(work_dir / 'repo', files, file_lines).resolve().as_uri()
+        for repeat in range(repeats):
+            state = work_dir / ('state' if warm else f"state-{repeat}")
+            cache = CompletionCache(cache_dir=str(state / 'llm'), mode='use')
+            test_cache = TestResultCache(cache_dir=str(state / 'tests'), mode='use')
+            pool = RepoPool(root=str(state / 'repos'))
+            requests_before = len(server.requests)
+            run = {'repeat': repeat}
+
+            generator = TestCaseGenerator(
+                repo_url, FEATURE_DESCRIPTION, 'benchmark', cache=cache, client=client,
+                checkpoint_path=state / 'generate_tests.json', repo_pool=pool, test_cache=test_cache,
+            )
+            start = time.perf_counter()
+            generator.generate_and_run_tests()
+            run['generate_tests'] = {
+                'total': time.perf_counter() - start, 'stages': dict(generator.stage_timings),
+                'tests': generator.test_report.counts if generator.test_report else None,
+            }
+
+            implementer = FeatureImplementer(
+                repo_url, FEATURE_DESCRIPTION, 'benchmark', cache=cache, client=client,
+                checkpoint_path=state / 'implement_features.json', repo_path=generator.temp_dir,
+                repo_pool=pool, test_cache=test_cache,
+            )
+            start = time.perf_counter()
+            try:
+                implementer.implement_features()
+            finally:
+                close_test_worker(Path(generator.temp_dir))
+                generator.lease.release()
+            run['implement_features'] = {
+                'total': time.perf_counter() - start, 'stages': dict(implementer.stage_timings),
+                'tests': implementer.test_report.counts if implementer.test_report else None,
+                'written_files': len(implementer.written_files),
+            }
+            run['llm_requests'] = len(server.requests) - requests_before
+            runs.append(run)
+            logger.info(f"Benchmark repeat {repeat + 1}/{repeats}: generate_tests "
+                        f"{run['generate_tests']['total']:.2f}s, implement_features {run['implement_features']['total']:.2f}s")
+    finally:
+        client.close()
+        server.stop()
+        if own_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'version': RESULTS_VERSION,
+        'created': time.time(),
+        'environment': _environment(),
+        'config': config,
+        'runs': runs,
+        'summary': summarize_runs(runs),
+    }
+
+
+def compare_results(baseline: Dict, current: Dict, threshold: float = DEFAULT_REGRESSION_THRESHOLD) -> List[Dict]:
+    """
+    Median change of every timing present in both results. A timing regressed when it is
+    more than `threshold` (relative) and MIN_REGRESSION_SECONDS (absolute) slower.
+    """
+    if baseline.get('config') != current.get('config'):
+        logging.getLogger(__name__).warning("Comparing benchmark results taken with different configurations")
+    rows = []
+    for name, stats in current['summary'].items():
+        if name not in baseline['summary']:
+            continue
+        before, after = baseline['summary'][name]['median'], stats['median']
+        change = (after - before) / before if before else 0.0
+        rows.append({
+            'name': name, 'baseline': before, 'current': after, 'change': change,
+            'regressed': after - before > MIN_REGRESSION_SECONDS and change > threshold,
+        })
+    return rows
+
+
+def format_comparison(rows: List[Dict]) -> str:
+    width = max([len(row['name']) for row in rows] + [len('timing')])
+    lines = [f"{'timing'.ljust(width)}  {'baseline':>9}  {'current':>9}  {'change':>8}"]
+    for row in rows:
+        flag = "  REGRESSED" if row['regressed'] else ""
+        lines.append(f"{row['name'].ljust(width)}  {row['baseline']:>8.3f}s  {row['current']:>8.3f}s  "
+                     f"{row['change'] * 100:>+7.1f}%{flag}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time both agents end to end against a local fake LLM server")
+    parser.add_argument('--files', type=int, default=20, help="Python modules in the synthetic repository")
+    parser.add_argument('--file-lines', type=int, default=100, help="Approximate lines per module")
+    parser.add_argument('--tests', type=int, default=10, help="Tests in the canned generated test file")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.0, help="Fake model latency before each response (s)")
+    parser.add_argument('--chunk-chars', type=int, default=16, help="Characters per streamed event")
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help="Delay between streamed events (s)")
+    parser.add_argument('--warm', action='store_true', help="Share caches and checkpoints between repeats")
+    parser.add_argument('--output', default='benchmark.json', help="Results file to write")
+    parser.add_argument('--compare', default=None, help="Earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help="Relative slowdown of a median timing that counts as a regression")
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help="Exit with status 1 on any regression or a CLI startup over its budget")
+    parser.add_argument('--startup-only', action='store_true', help="Only measure CLI startup time")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.getLogger(__name__).setLevel(logging.INFO)
+    if args.startup_only:
+        results = {'version': RESULTS_VERSION, 'created': time.time(), 'environment': _environment(),
+                   'config': {'startup_only': True}, 'runs': [], 'summary': {}}
+    else:
+        results = run_benchmark(files=args.files, file_lines=args.file_lines, tests=args.tests, repeats=args.repeats,
+                                latency=args.latency, chunk_chars=args.chunk_chars, chunk_delay=args.chunk_delay,
+                                warm=args.warm)
+    results['startup'] = measure_startup()
+    results['summary'].update({f"startup.{name}": stats for name, stats in results['startup'].items()})
+    slow_startup = over_startup_budget(results['startup'])
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    for name, stats in results['summary'].items():
+        print(f"{name}: median {stats['median']:.3f}s (min {stats['min']:.3f}s, max {stats['max']:.3f}s)")
+    print(f"Results written to {args.output}")
+    for name in slow_startup:
+        print(f"CLI startup '{name}' took {results['startup'][name]['median'] * 1000:.0f}ms, "
+              f"over the {STARTUP_BUDGET_SECONDS * 1000:.0f}ms budget")
+
+    regressed = bool(slow_startup)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            rows = compare_results(json.load(f), results, args.threshold)
+        print(format_comparison(rows))
+        regressed = regressed or any(row['regressed'] for row in rows)
+    if args.fail_on_regression and regressed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Command line entry point for both agents and batch runs.
+
+    python cli.py generate-tests REPO_URL "feature description"
+    python cli.py implement REPO_URL "feature description" [--candidates 3]
+    python cli.py run-batch jobs.jsonl --results results.jsonl
+
+Only the standard library is imported up front; each command imports the agent
+modules (and through them httpx, GitPython and the codebase tooling) when it
+runs, so --help and commands with nothing to do return at once. The API key is
+read from TOGETHER_API_KEY when a command runs.
+"""
+import os
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(threadName)s - %(message)s'
+
+
+def _api_key() -> Optional[str]:
+    """TOGETHER_API_KEY, required unless LLM_API_BASE points somewhere else"""
+    key = os.environ.get("TOGETHER_API_KEY")
+    if not key and not os.environ.get("LLM_API_BASE"):
+        raise SystemExit("TOGETHER_API_KEY is not set (or set LLM_API_BASE for an endpoint without keys)")
+    return key
+
+
+def _options(args: argparse.Namespace, names: Dict[str, str]) -> Dict:
+    """Constructor keyword arguments for the options given on the command line; the rest keep their defaults"""
+    return {param: getattr(args, dest) for dest, param in names.items() if getattr(args, dest) is not None}
+
+
+def generate_tests(args: argparse.Namespace) -> int:
+    from test_generation_agent import TestCaseGenerator
+
+    generator = TestCaseGenerator(args.repo_url, args.feature_description, _api_key(), **_options(args, {
+        'repo_path': 'repo_path', 'context_budget': 'context_token_budget', 'test_workers': 'test_workers',
+        'test_timeout': 'test_timeout', 'static_repairs': 'static_repairs',
+    }))
+    try:
+        generator.generate_and_run_tests()
+    finally:
+        # Return the worktree to the pool so the next run for this repository reuses it
+        if generator.lease is not None:
+            generator.lease.release()
+    if generator.temp_dir:
+        # Pass this to `implement --repo-path` to work on exactly this checkout
+        print(f"Checkout: {generator.temp_dir}")
+    if generator.test_file:
+        print(f"Test file: {generator.test_file}")
+    if generator.static_issues:
+        print(f"Static check: {len(generator.static_issues)} issue(s) remain; tests were not run")
+        return 1
+    if generator.test_report is not None:
+        print(f"Tests: {generator.test_report.summary()}")
+    return 0
+
+
+def implement(args: argparse.Namespace) -> int:
+    from code_generation_agent import FeatureImplementer
+
+    options = _options(args, {
+        'repo_path': 'repo_path', 'context_budget': 'context_token_budget', 'test_workers': 'test_workers',
+        'test_timeout': 'test_timeout', 'candidates': 'candidates', 'max_repairs': 'max_repairs',
+        'edit_format': 'edit_format',
+    })
+    if args.force_full_tests:
+        options['force_full_tests'] = True
+    if args.no_test_impact:
+        options['test_impact'] = False
+    if args.no_warm_worker:
+        options['warm_test_worker'] = False
+    try:
+        implementer = FeatureImplementer(args.repo_url, args.feature_description, _api_key(), **options)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    implementer.implement_features()
+    for path in implementer.written_files:
+        print(f"Wrote {path}")
+    return 0
+
+
+def run_batch(args: argparse.Namespace) -> int:
+    from batch_runner import BatchRunner, completed_job_ids, load_jobs
+
+    jobs = load_jobs(Path(args.jobs))
+    results_path = Path(args.results)
+    done = completed_job_ids(results_path)
+    if all(job['id'] in done for job in jobs):
+        logging.getLogger(__name__).info(f"All {len(jobs)} jobs in {args.jobs} already succeeded; nothing to run")
+        return 0
+    runner = BatchRunner(results_path, state_dir=args.state_dir, together_api_key=_api_key(),
+                         **_options(args, {'workers': 'workers'}))
+    counts = runner.run(jobs)
+    return 1 if counts['failed'] else 0
+
+
+def _add_agent_options(parser: argparse.ArgumentParser):
+    parser.add_argument('repo_url', help="Repository to work on (any URL or path git can clone)")
+    parser.add_argument('feature_description', help="The feature to write tests for or implement")
+    parser.add_argument('--repo-path', default=None,
+                        help="Existing checkout to use instead of leasing one from the repository pool")
+    parser.add_argument('--context-budget', type=int, default=None, help="Token budget for codebase context")
+    parser.add_argument('--test-workers', type=int, default=None, help="Parallel pytest processes (default: cores)")
+    parser.add_argument('--test-timeout', type=float, default=None, help="Per-test timeout in seconds")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='code-agent', description="Generate tests for and implement features in a repository")
+    parser.add_argument('--log-level', default='INFO', help="Logging level (default INFO)")
+    parser.add_argument('--trace-file', default=None, help="Append tracing spans to this JSONL file")
+    parser.add_argument('--trace-summary', action='store_true', help="Log a table of each pipeline's spans")
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND', required=True)
+
+    generate = commands.add_parser('generate-tests', help="Generate pytest tests for a feature and run them")
+    _add_agent_options(generate)
+    generate.add_argument('--static-repairs', type=int, default=None,
+                          help="Follow-up requests to fix a test file that fails the static check")
+    generate.set_defaults(handler=generate_tests)
+
+    impl = commands.add_parser('implement', help="Implement a feature against the generated tests")
+    _add_agent_options(impl)
+    impl.add_argument('--candidates', type=int, default=None, help="Implementations to generate concurrently")
+    impl.add_argument('--max-repairs', type=int, default=None, help="Follow-up attempts per failing candidate")
+    impl.add_argument('--edit-format', default=None, help="'full' (complete files, default) or 'patch' (edit blocks)")
+    impl.add_argument('--force-full-tests', action='store_true', help="Run every test instead of only affected ones")
+    impl.add_argument('--no-test-impact', action='store_true', help="Do not record per-test coverage")
+    impl.add_argument('--no-warm-worker', action='store_true', help="Start a new interpreter for every test run")
+    impl.set_defaults(handler=implement)
+
+    batch = commands.add_parser('run-batch', help="Run the jobs of a JSONL file")
+    batch.add_argument('jobs', help="JSONL file with repo_url and feature_description per line")
+    batch.add_argument('--results', default='results.jsonl', help="JSONL file result records are appended to")
+    batch.add_argument('--workers', type=int, default=None, help="Jobs to run at once (default 4)")
+    batch.add_argument('--state-dir', default=None,
+                       help="Per-job checkpoints and artifacts (default: next to the results file)")
+    batch.set_defaults(handler=run_batch)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format=LOG_FORMAT)
+    if args.trace_file or args.trace_summary:
+        import tracing
+        tracing.configure_tracing(args.trace_file, args.trace_summary)
+    raise SystemExit(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import logging
+from pathlib import PurePosixPath, PureWindowsPath
+from typing import Callable, List, Optional
+
+FENCE = '```'
+PYTHON_FENCE = '```python'
+
+
+class CodeBlockStreamParser:
+    """
+    Incremental parser for fenced code blocks in an LLM response.
+
+    Feed it text deltas as they arrive. Every time a ```python or ```python:path
+    block closes, on_block(path, content) is called with path=None for unnamed
+    blocks. Absolute paths and paths with '..' components are logged and treated
+    as unnamed. Only the current partial line and the open block are held in memory.
+    """
+
+    def __init__(self, on_block: Callable[[Optional[str], str], None]):
+        self.on_block = on_block
+        self.logger = logging.getLogger(__name__)
+        self.blocks_closed = 0
+        self._partial = ''
+        self._in_block = False
+        self._path = None
+        self._lines: List[str] = []
+
+    def feed(self, text: str):
+        """Consume a chunk of the response"""
+        if not text:
+            return
+        data = self._partial + text
+        lines = data.split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self._handle_line(line)
+
+    def close(self):
+        """Flush the last line; an unterminated block at the end is dropped"""
+        if self._partial:
+            self._handle_line(self._partial)
+            self._partial = ''
+        if self._in_block:
+            self.logger.warning(f"Response ended inside an unterminated code block ({self._path or 'unnamed'})")
+            self._in_block = False
+            self._lines = []
+
+    def _emit(self):
+        content = '\n'.join(self._lines)
+        self._lines = []
+        self._in_block = False
+        self.blocks_closed += 1
+        self.on_block(self._path, content)
+
+    def _safe_path(self, path: str) -> Optional[str]:
+        if not path:
+            return None
+        if PurePosixPath(path).is_absolute() or PureWindowsPath(path).is_absolute() \
+                or '..' in PurePosixPath(path.replace('\\', '/')).parts:
+            self.logger.warning(f"Ignoring code block path outside the repository: {path}")
+            return None
+        return path
+
+    def _handle_line(self, line: str):
+        stripped = line.strip()
+        if stripped.startswith(PYTHON_FENCE):
+            # A new python fence while a block is open implicitly closes the previous one
+            if self._in_block:
+                self._emit()
+            rest = stripped[len(PYTHON_FENCE):]
+            self._path = self._safe_path(rest[1:].strip()) if rest.startswith(':') else None
+            self._in_block = True
+            return
+        if stripped.startswith(FENCE):
+            if self._in_block:
+                self._emit()
+            return
+        if self._in_block:
+            self._lines.append(line)
+
+
+def check_syntax(path: str, content: str) -> Optional[str]:
+    """Compile content without executing it; returns an error message or None"""
+    try:
+        compile(content, path, 'exec', dont_inherit=True)
+    except SyntaxError as e:
+        return f"{path}:{e.lineno}:{e.offset}: {e.msg}"
+    except ValueError as e:
+        return f"{path}: {str(e)}"
+    return None
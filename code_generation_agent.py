@@ -1,19 +1,85 @@
 import os
+import sys
 from pathlib import Path
 import logging
-from typing import List, Dict
-from together import Together
-import dspy
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Dict, Optional, Union
+from llm_cache import CompletionCache, get_default_cache
+from llm_client import LLMClient, get_default_client
+from code_blocks import CodeBlockStreamParser, check_syntax
+import tracing
+from pipeline import StageGraph, StopPipeline, default_checkpoint_path, fingerprint, load_stage_output
+from test_runner import DEFAULT_TEST_TIMEOUT, ShardedTestRunner, TestReport
+from test_summary import DEFAULT_DIGEST_TOKENS, summarize_failures
+from codebase_index import MAX_SOURCE_FILE_BYTES, get_codebase_index
+from context_selector import CHARS_PER_TOKEN, ContextBuilder, ContextSelector, DEFAULT_TOKEN_BUDGET
+from code_search import get_code_search_index, retrieval_seeds
+from repo_pool import RepoPool, get_default_repo_pool
+from speculative import SpeculativeSearch, format_code_blocks, parse_code_blocks
+from edit_blocks import (EDIT_FORMAT_INSTRUCTIONS, apply_edits, contained_path, fallback_prompt, parse_edit_response,
+                         write_files)
+from test_worker import get_test_worker
+from test_cache import TestResultCache, get_default_test_cache
+from test_impact import get_test_impact_map
+from static_check import StaticChecker, StaticIssue, blocking_issues, format_issues
 
-together_client = Together(api_key="09e8f3626baed45a43804f875e0f422d71ed78320343857bf09ce90bb6d00ae8")
+CODER_MODEL = "Qwen/Qwen2.5-Coder-32B-Instruct"
+# 'full': complete files written as new_* copies; 'patch': search/replace edits applied in place
+EDIT_FORMATS = ('full', 'patch')
 
 class FeatureImplementer:
-    def __init__(self, repo_url: str, feature_description: str, together_api_key: str, model: str = "Qwen/Qwen2.5-7B-Instruct-Turbo"):
+    def __init__(self, repo_url: str, feature_description: str, together_api_key: str, model: str = "Qwen/Qwen2.5-7B-Instruct-Turbo",
+                 cache: Optional[CompletionCache] = None, context_token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 retrieval_top_k: int = 10, client: Optional[LLMClient] = None,
+                 checkpoint_path: Optional[Path] = None, test_workers: Optional[int] = None,
+                 test_timeout: float = DEFAULT_TEST_TIMEOUT, warm_test_worker: bool = True,
+                 failure_digest_tokens: int = DEFAULT_DIGEST_TOKENS, repo_path: Optional[Path] = None,
+                 repo_pool: Optional[RepoPool] = None, candidates: int = 1, max_repairs: int = 1,
+                 edit_format: str = 'full', test_cache: Optional[TestResultCache] = None,
+                 test_impact: bool = True, force_full_tests: bool = False,
+                 max_file_bytes: int = MAX_SOURCE_FILE_BYTES, max_context_chars: Optional[int] = None):
+        if edit_format not in EDIT_FORMATS:
+            raise ValueError(f"edit_format must be one of {EDIT_FORMATS}, got {edit_format!r}")
         self.repo_url = repo_url
         self.feature_description = feature_description
         self.together_api_key = together_api_key
         self.model = model
         self.temp_dir = None
+        self.cache = cache or get_default_cache()
+        self.client = client or get_default_client()
+        self.syntax_errors = []
+        self.context_token_budget = context_token_budget
+        self.context_report = None
+        # Caps on what one prompt can hold, whatever the size of the repository
+        self.max_file_bytes = max_file_bytes
+        self.max_context_chars = max_context_chars
+        self.retrieval_top_k = retrieval_top_k
+        self.checkpoint_path = checkpoint_path
+        self.stage_timings = {}
+        self.test_workers = test_workers
+        self.test_timeout = test_timeout
+        # Repeated test runs fork from a worker with the repo's dependencies already imported
+        self.warm_test_worker = warm_test_worker
+        self.test_report: Optional[TestReport] = None
+        # Unchanged checkout and test file: the previous report is reused instead of running pytest again
+        self.test_cache = test_cache or get_default_test_cache()
+        # Record per-test coverage and re-run only the tests a candidate's changes can affect
+        self.test_impact = test_impact
+        self.force_full_tests = force_full_tests
+        self.written_files: List[Path] = []
+        self.failure_digest_tokens = failure_digest_tokens
+        # The checkout the test generator worked on; looked up in the pool when not given
+        self.repo_path = repo_path
+        self.repo_pool = repo_pool or get_default_repo_pool()
+        # candidates > 1 generates that many implementations concurrently and keeps the first to pass
+        self.candidates = candidates
+        self.max_repairs = max_repairs
+        self.candidate_results: List[Dict] = []
+        # Speculative candidates always answer with complete files
+        self.edit_format = edit_format
+        # Estimated output tokens of the implementation responses, by format ('full' includes patch fallbacks)
+        self.output_tokens: Dict[str, int] = {}
+        self.static_issues: List[StaticIssue] = []
         self.logger = logging.getLogger(__name__)
         
     def setup_logging(self):
@@ -34,66 +100,84 @@ class FeatureImplementer:
             return f.read()
 
     def analyze_codebase(self, repo_path: Path) -> List[Dict]:
-        """Analyze all Python files in the repository"""
+        """
+        Analyze all Python files in the repository.
+        Uses the shared persistent index, so only files changed since the last scan are re-read;
+        file contents are loaded lazily through each entry's 'content' key.
+        """
         self.logger.info(f"Starting codebase analysis in {repo_path}")
-        all_files = []
-        
-        for file_path in repo_path.rglob("*.py"):
-            # Skip test file itself
-            if file_path.name == 'generated_test_cases.py' or file_path.name == 'raw_llm_output.py':
-                self.logger.debug(f"Skipping file: {file_path.name}")
-                continue
-                
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    self.logger.debug(f"Successfully read file: {file_path}")
-                    all_files.append({
-                        'path': str(file_path.relative_to(repo_path)),
-                        'content': content
-                    })
-            except Exception as e:
-                self.logger.warning(f"Error reading file {file_path}: {str(e)}")
-        
+        # Skip test file itself and the agents' raw LLM output
+        all_files = get_codebase_index(repo_path).scan(
+            exclude_names=('generated_test_cases.py', 'raw_llm_output.py', 'raw_code.py')
+        )
         self.logger.info(f"Completed codebase analysis. Found {len(all_files)} Python files")
         return all_files
 
     def run_test_cases(self, repo_path: Path) -> str:
-        """Run the test cases and capture their output"""
-        import subprocess
-        import sys
-        
+        """
+        Run the test cases in isolated, sharded pytest processes.
+        Returns a size-capped digest of the failures; the full report is kept in self.test_report.
+        A test file that fails the static check is not run; its issues are returned instead.
+        """
         self.logger.info("Starting test case execution")
         test_file = repo_path / 'generated_test_cases.py'
         if not test_file.exists():
             self.logger.error(f"Test file not found at {test_file}")
             raise FileNotFoundError(f"Test file not found at {test_file}")
+
+        issues = StaticChecker(repo_path).check_files({test_file.name: test_file.read_text(encoding='utf-8')})
+        for issue in issues:
+            if not issue.blocking:
+                self.logger.info(f"Test file: {issue.format()}")
+        # Imports of modules the feature has not created yet still let the baseline run
+        issues = blocking_issues(issues)
+        if issues:
+            self.logger.warning(f"Test file failed the static check with {len(issues)} issue(s); not running it")
+            self.test_report = None
+            return format_issues(issues)
         
         try:
-            self.logger.debug(f"Running pytest with command: pytest {str(test_file)} -v")
-            # Run pytest with detailed output
-            result = subprocess.run(
-                [sys.executable, "-m", "pytest", str(test_file), "-v", "--capture=no"],
-                capture_output=True,
-                text=True
-            )
+            runner = ShardedTestRunner(repo_path, workers=self.test_workers, per_test_timeout=self.test_timeout,
+                                       warm_worker=self.warm_test_worker, cache=self.test_cache,
+                                       impact=get_test_impact_map(repo_path) if self.test_impact else None,
+                                       force_full=self.force_full_tests)
+            self.test_report = runner.run(test_file)
             self.logger.info("Test execution completed")
-            return result.stdout + "\n" + result.stderr
+            return summarize_failures(self.test_report, self.failure_digest_tokens)
         except Exception as e:
             self.logger.error(f"Error running tests: {str(e)}")
             return str(e)
 
-    def construct_prompt(self, all_files: List[Dict], test_cases: str) -> str:
-        """Construct the prompt for the LLM with codebase files and test cases"""
+    def construct_prompt(self, all_files: List[Dict], test_cases: str, test_output: Optional[str] = None) -> str:
+        """
+        Construct the prompt for the LLM with codebase files and test cases.
+        Runs the test cases for their failure digest unless it is passed in.
+        """
         self.logger.info("Starting prompt construction")
-        
-        context = ""
-        for file in all_files:
-            context += f"\nFile: {file['path']}\n```python\n{file['content']}\n```\n"
 
         # Run test cases and get output
         repo_path = Path(self.temp_dir)
-        test_output = self.run_test_cases(repo_path)
+        if test_output is None:
+            test_output = self.run_test_cases(repo_path)
+
+        # Look up code matching the concepts in the feature description
+        search_index = get_code_search_index(repo_path)
+        search_index.update(all_files, self.max_file_bytes)
+        seeds, symbols = retrieval_seeds(search_index.search(self.feature_description, k=self.retrieval_top_k))
+
+        # Pack the code reachable from the tests, failures and feature description into the budget
+        sections, self.context_report = ContextSelector(all_files, self.context_token_budget, self.max_file_bytes).select(
+            test_source=test_cases,
+            test_output=test_output,
+            feature_description=self.feature_description,
+            extra_seeds=seeds,
+            extra_symbols=symbols
+        )
+        builder = ContextBuilder(self.max_context_chars, self.max_file_bytes, self.context_token_budget)
+        for file in sections:
+            builder.add_section(file)
+        context = builder.build()
+        self.context_report.update(builder.report())
         
         self.logger.debug("Adding feature description and test cases to prompt")
         prompt = f"""You are an expert Python developer. Given the following Python codebase and test cases, 
@@ -111,7 +195,7 @@ class FeatureImplementer:
         ```
 
         3. **Test Execution Output:**
-        The following is the output from running the test cases, showing which tests are failing and need to be fixed:
+        The following summarizes the test run: each distinct failure with the tests it affects, the error, and the relevant traceback frames:
         ```
         {test_output}
         ```
@@ -129,51 +213,41 @@ class FeatureImplementer:
         6. Focus on fixing the failing tests shown in the test execution output
 
         **Response Format:**
-        Provide the complete implementation code for each file that needs to be modified or created. 
-        Each file's code should be enclosed in triple backticks with the file path specified.
-        Example:
-        ```python:path/to/file.py
-        # Implementation code here
-        ```
+        {self.response_format()}
         """
         
         self.logger.info("Prompt construction completed")
+        if tracing.tracing_enabled():
+            tracing.current_span().set_attribute('prompt.bytes', len(prompt.encode('utf-8')))
         return prompt
 
+    def response_format(self) -> str:
+        """Response format section of the prompt for the configured edit format"""
+        if self.edit_format == 'patch' and self.candidates <= 1:
+            return EDIT_FORMAT_INSTRUCTIONS + """
+        Files shown as signatures only are abbreviated: edit them only with SEARCH text that appears verbatim above."""
+        return """Provide the complete implementation code for each file that needs to be modified or created. 
+        Each file's code should be enclosed in triple backticks with the file path specified.
+        Example:
+        ```python:path/to/file.py
+        # Implementation code here
+        ```"""
+
+    def _count_output_tokens(self, edit_format: str, chars: int):
+        """Add the estimated tokens of chars characters of output (same estimate as estimate_tokens)"""
+        tokens = (chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        self.output_tokens[edit_format] = self.output_tokens.get(edit_format, 0) + tokens
+
     def implement_features_with_llm(self, prompt: str) -> Dict:
         """Generate implementation code using the LLM"""
         try:
             self.logger.info("Starting LLM implementation generation")
             self.logger.debug(f"Using model: {self.model}")
-            
-            # First get the thought process
-            self.logger.debug("Generating thought process with DeepSeek-R1")
-            # thought = together_client.chat.completions.create(
-            #     model="deepseek-ai/DeepSeek-R1",
-            #     messages=[
-            #         {"role": "user", "content": prompt}
-            #     ],
-            #     max_tokens=25000,
-            #     stop=['</think>']
-            # )
-            # print(thought.choices[0].message.content)
-            # self.logger.debug("Generating implementation with Qwen model")
-            # # Add thought process to prompt and generate implementation
-            # prompt_with_thought = prompt + f"""
-            # Consider this analysis when implementing the feature:
-            # <think>
-            # {thought.choices[0].message.content}
-            # </think>
-            # """
-            
-            lm = dspy.LM("openai/Qwen/Qwen2.5-Coder-32B-Instruct", 
-                        api_key=self.together_api_key,
-                        api_base="https://api.together.xyz/v1",
-                        max_tokens=20000)
-            dspy.configure(lm=lm)
-            
-            # result = lm(prompt_with_thought)[0]
-            result = lm(prompt)[0]
+
+            result = self.cache.get_or_compute(
+                CODER_MODEL, prompt, 20000, None,
+                lambda: self.client.complete(CODER_MODEL, prompt, 20000, api_key=self.together_api_key).text
+            )
             self.logger.info("LLM implementation generation completed successfully")
             return result
             
@@ -181,58 +255,222 @@ class FeatureImplementer:
             self.logger.error(f"Error generating implementation: {str(e)}")
             raise
 
-    def write_implementation_files(self, repo_path: Path, implementation: str):
-        """Write the generated implementation to files"""
+    def stream_implementation(self, prompt: str) -> Iterator[str]:
+        """Stream the implementation from the LLM, yielding text as it is generated"""
+        self.logger.info("Starting streamed LLM implementation generation")
+        return self.cache.stream_or_compute(
+            CODER_MODEL, prompt, 20000, None,
+            lambda: self.client.stream(CODER_MODEL, prompt, 20000, api_key=self.together_api_key)
+        )
+
+    def stream_candidate(self, prompt: str, temperature: float) -> Iterator[str]:
+        """Stream one speculative candidate sampled at the given temperature"""
+        return self.cache.stream_or_compute(
+            CODER_MODEL, prompt, 20000, None,
+            lambda: self.client.stream(CODER_MODEL, prompt, 20000, temperature=temperature,
+                                       api_key=self.together_api_key),
+            temperature=temperature
+        )
+
+    def implement_speculatively(self, repo_path: Path, prompt: str) -> List[Path]:
+        """
+        Generate several candidates concurrently, test each in a scratch copy of the checkout
+        and write the first one that passes (or the best one, if none does) as new_* files
+        """
+        worker = get_test_worker(repo_path) if self.warm_test_worker and hasattr(os, 'fork') else None
+        search = SpeculativeSearch(
+            repo_path, 'generated_test_cases.py', self.stream_candidate,
+            candidates=self.candidates, max_repairs=self.max_repairs, test_timeout=self.test_timeout,
+            worker=worker, digest_tokens=self.failure_digest_tokens, checker=StaticChecker(repo_path),
+            impact=get_test_impact_map(repo_path) if self.test_impact else None
+        )
+        best = search.run(prompt)
+        self.candidate_results = [candidate.to_dict() for candidate in search.candidates]
+        if best is None:
+            raise RuntimeError("No candidate implementation contained any files")
+        return self.write_implementation_files(repo_path, format_code_blocks(best.files))
+
+    def apply_implementation_edits(self, repo_path: Path, prompt: str,
+                                   implementation: Union[str, Iterable[str]]) -> List[Path]:
+        """
+        Apply a response of search/replace edit blocks to the checkout in place.
+        Files whose edits do not all match are requested again as complete files
+        in one follow-up request; files it still leaves out are not changed.
+        """
+        self.logger.info("Applying implementation edits")
+        deltas = [implementation] if isinstance(implementation, str) else implementation
+        with open(repo_path / 'raw_code.py', 'w', encoding='utf-8') as raw:
+            pieces = []
+            for delta in deltas:
+                raw.write(delta)
+                pieces.append(delta)
+        text = ''.join(pieces)
+        self._count_output_tokens('patch', len(text))
+
+        edits, files = parse_edit_response(text, repo_path)
+        updated, failed = apply_edits(repo_path, edits)
+        # Complete files the model sent anyway (typically new modules) are taken as they are
+        for path, content in files.items():
+            if contained_path(repo_path, path) is None:
+                failed.setdefault(path, [])
+                continue
+            updated[path] = content
+            failed.pop(path, None)
+        # Paths outside the checkout are dropped rather than requested again
+        for path in [path for path in failed if contained_path(repo_path, path) is None]:
+            self.logger.error(f"Ignoring output for {path}: it is outside the checkout")
+            del failed[path]
+
+        if failed:
+            self.logger.warning(f"Edits did not apply to {len(failed)} file(s), requesting them whole: {', '.join(failed)}")
+            contents = {}
+            for path in failed:
+                try:
+                    contents[path] = (repo_path / path).read_text(encoding='utf-8')
+                except FileNotFoundError:
+                    contents[path] = ''
+            response = self.implement_features_with_llm(fallback_prompt(prompt, failed, contents))
+            self._count_output_tokens('full', len(response))
+            regenerated = parse_code_blocks(response)
+            for path in failed:
+                if path in regenerated:
+                    updated[path] = regenerated[path]
+                else:
+                    self.logger.error(f"No usable output for {path}; leaving it unchanged")
+
+        written = write_files(repo_path, updated)
+        self.static_issues = StaticChecker(repo_path).check_files(updated)
+        self.syntax_errors = [issue.format() for issue in self.static_issues if issue.kind == 'syntax']
+        for issue in self.static_issues:
+            self.logger.warning(f"Edited file: {issue.format()}")
+        self.logger.info(
+            f"Applied {len(edits)} edits to {len(written)} files "
+            f"({len(failed)} regenerated whole); output tokens: {self.output_tokens}"
+        )
+        return written
+
+    def write_implementation_files(self, repo_path: Path, implementation: Union[str, Iterable[str]]) -> List[Path]:
+        """
+        Write the generated implementation to files.
+        Accepts the full response or a stream of deltas; each file is written as soon as
+        its code block closes and syntax-checked while the rest of the response arrives.
+        """
         self.logger.info("Starting to write implementation files")
+        # Module path -> the new_* file standing in for it; a repeated path overwrites its file
+        written: Dict[str, Path] = {}
+        syntax_checks = {}
+        executor = ThreadPoolExecutor(max_workers=2)
+
+        def write_block(path: Optional[str], content: str):
+            if path is None:
+                return
+            current_file = "new_" + path
+            file_path = contained_path(repo_path, current_file)
+            if contained_path(repo_path, path) is None or file_path is None:
+                self.logger.error(f"Skipping generated file outside the checkout: {path}")
+                return
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            self.logger.debug(f"Written file: {current_file}")
+            written[path] = repo_path / current_file
+            syntax_checks[path] = executor.submit(check_syntax, current_file, content)
+
+        deltas = [implementation] if isinstance(implementation, str) else implementation
+        parser = CodeBlockStreamParser(write_block)
+        # Only a running size is kept, so the response is never held in memory as a whole
+        chars = 0
         #raw output to the file
-        with open(repo_path / 'raw_code.py', 'w', encoding='utf-8') as f:
-            f.write(implementation)
-        # Parse the implementation response to extract file contents
-        lines = implementation.split('\n')
-        current_file = None
-        current_content = []
-        files_written = 0
-        
-        for line in lines:
-            if line.startswith('```python:'):
-                if current_file:
-                    # Write the previous file
-                    file_path = repo_path / current_file
-                    file_path.parent.mkdir(parents=True, exist_ok=True)
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write('\n'.join(current_content))
-                    self.logger.debug(f"Written file: {current_file}")
-                    files_written += 1
-                
-                # Start new file
-                current_file = "new_" + line[10:].strip()
-                current_content = []
-            elif line.startswith('```'):
-                if current_file:
-                    # Write the last file
-                    file_path = repo_path / current_file
-                    file_path.parent.mkdir(parents=True, exist_ok=True)
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write('\n'.join(current_content))
-                    self.logger.debug(f"Written file: {current_file}")
-                    files_written += 1
-                current_file = None
-                current_content = []
-            elif current_file:
-                current_content.append(line)
-        
-        self.logger.info(f"Completed writing implementation files. Total files written: {files_written}")
+        with executor, open(repo_path / 'raw_code.py', 'w', encoding='utf-8') as raw:
+            for delta in deltas:
+                raw.write(delta)
+                parser.feed(delta)
+                chars += len(delta)
+            parser.close()
+        self._count_output_tokens('full', chars)
+
+        self.syntax_errors = [error for error in (check.result() for check in syntax_checks.values()) if error]
+        for error in self.syntax_errors:
+            self.logger.warning(f"Generated file has a syntax error: {error}")
+        if written:
+            # Each new_* file stands in for the module it is named after
+            generated = {path: file_path.read_text(encoding='utf-8') for path, file_path in written.items()}
+            self.static_issues = [issue for issue in StaticChecker(repo_path).check_files(generated)
+                                  if issue.kind != 'syntax']
+            for issue in self.static_issues:
+                self.logger.warning(f"Generated file: {issue.format()}")
+        self.logger.info(f"Completed writing implementation files. Total files written: {len(written)}")
+        return list(written.values())
+
+    def build_pipeline(self, repo_path: Path) -> StageGraph:
+        """
+        Stage graph for feature implementation. Reading the tests, scanning the codebase and
+        the baseline test run are independent and run concurrently before the prompt is built.
+        """
+        graph = StageGraph(
+            "implement_features",
+            checkpoint_path=self.checkpoint_path or default_checkpoint_path(
+                "implement_features", self.repo_url, self.feature_description
+            )
+        )
+
+        def scan() -> List[Dict]:
+            all_files = self.analyze_codebase(repo_path)
+            tracing.add_counts({'files.scanned': len(all_files)})
+            if not all_files:
+                raise StopPipeline("No files found for analysis")
+            return all_files
+
+        def generate(prompt: str) -> List[str]:
+            if self.candidates > 1:
+                written = self.implement_speculatively(repo_path, prompt)
+            elif self.edit_format == 'patch':
+                written = self.apply_implementation_edits(repo_path, prompt, self.stream_implementation(prompt))
+            else:
+                written = self.write_implementation_files(repo_path, self.stream_implementation(prompt))
+            return [str(path) for path in written]
+
+        graph.add("read_tests", lambda: self.read_test_cases(repo_path))
+        graph.add("scan", scan)
+        graph.add("baseline_tests", lambda: self.run_test_cases(repo_path))
+        graph.add("prompt", self.construct_prompt, deps=["scan", "read_tests", "baseline_tests"])
+        # An unchanged prompt means the previous implementation can be reused as long as its files remain
+        graph.add("generate", generate, deps=["prompt"],
+                  key=lambda prompt: fingerprint(str(repo_path), CODER_MODEL, prompt, self.candidates, self.max_repairs),
+                  is_valid=lambda written: all(Path(path).exists() for path in written))
+        return graph
+
+    def generator_checkout(self) -> Optional[Path]:
+        """
+        Checkout the test generator recorded in its checkpoint for this repository and
+        feature, if its generated test file is still there
+        """
+        generated = load_stage_output(
+            default_checkpoint_path("generate_tests", self.repo_url, self.feature_description), "generate"
+        )
+        if not isinstance(generated, dict) or not generated.get('checkout'):
+            return None
+        checkout = Path(generated['checkout'])
+        if not Path(generated.get('test_file') or checkout / 'generated_test_cases.py').exists():
+            self.logger.warning(f"The test generator's checkout {checkout} no longer has its test file")
+            return None
+        return checkout
 
     def implement_features(self):
         """Main method to orchestrate the feature implementation process"""
+        graph = None
         try:
             self.setup_logging()
             
-            # Use the temp directory created by Agent 1
-            repo_name = self.repo_url.split('/')[-1]
-            # import time
-            # timestamp = time.strftime("%Y%m%d_%H%M%S")
-            self.temp_dir = os.path.join(os.getcwd(), f"{repo_name}")
+            # Use the checkout created by Agent 1: the one passed in, else the one its checkpoint
+            # records, else the latest pooled worktree not leased by another job, else a clone
+            # in the current directory
+            repo_path = self.repo_path or self.generator_checkout() or self.repo_pool.latest(self.repo_url)
+            if repo_path is None:
+                repo_name = self.repo_url.split('/')[-1]
+                repo_path = os.path.join(os.getcwd(), f"{repo_name}")
+            self.temp_dir = str(repo_path)
+            self.logger.info(f"Using checkout {self.temp_dir}")
             
             if not os.path.exists(self.temp_dir):
                 self.logger.error(f"Directory not found: {self.temp_dir}")
@@ -240,36 +478,27 @@ class FeatureImplementer:
                 
             repo_path = Path(self.temp_dir)
             
-            # Read test cases and analyze codebase
-            test_cases = self.read_test_cases(repo_path)
-            all_files = self.analyze_codebase(repo_path)
-            
-            if not all_files:
-                self.logger.warning("No files found for analysis")
-                return
-            
-            # Generate and write implementation
-            prompt = self.construct_prompt(all_files, test_cases)
-            implementation = self.implement_features_with_llm(prompt)
-            self.write_implementation_files(repo_path, implementation)
+            # Read test cases, analyze codebase, run the tests, then generate and write implementation
+            graph = self.build_pipeline(repo_path)
+            results = graph.run()
+            self.written_files = [Path(path) for path in results.get('generate') or []]
             
             self.logger.info(f"Implementation completed. Files updated in {self.temp_dir}")
             
         except Exception as e:
             self.logger.error(f"Error in feature implementation process: {str(e)}")
             raise
+        finally:
+            if graph:
+                self.stage_timings = dict(graph.timings)
+                graph.log_timings(self.logger)
+            self.cache.log_stats(self.logger)
+            self.test_cache.log_stats(self.logger)
 
 def main():
-    # Example usage
-    repo_url = "https://github.com/ChidambaramG/demand_forecasting_XGBoost"
-    feature_description = """
-    Modify the approach to include rolling means as one of the features when training the model.
-    """
-    together_api_key = "09e8f3626baed45a43804f875e0f422d71ed78320343857bf09ce90bb6d00ae8"
-    model = "together_ai/togethercomputer/Qwen/Qwen2.5-Coder-32B-Instruct"
-    
-    implementer = FeatureImplementer(repo_url, feature_description, together_api_key, model)
-    implementer.implement_features()
+    # Same as `python cli.py implement REPO_URL FEATURE_DESCRIPTION`; the API key comes from TOGETHER_API_KEY
+    from cli import main as cli_main
+    cli_main(['implement'] + sys.argv[1:])
 
 if __name__ == "__main__":
     main()
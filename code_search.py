@@ -0,0 +1,251 @@
+import os
+import re
+import ast
+import json
+import math
+import heapq
+import logging
+import threading
+from pathlib import Path
+from collections import Counter
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from codebase_index import MAX_SOURCE_FILE_BYTES, STATE_DIR_NAME, ensure_state_dir, source_size
+from context_selector import split_identifier
+
+INDEX_FILE_NAME = 'bm25_index.json'
+INDEX_VERSION = 1
+
+# Standard Okapi BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Classes longer than this are indexed method by method
+MAX_CLASS_CHUNK_LINES = 80
+
+_TOKEN_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_STOPWORDS = {
+    'the', 'and', 'for', 'with', 'when', 'into', 'from', 'that', 'this', 'one', 'are', 'was',
+    'self', 'return', 'def', 'class', 'import', 'none', 'true', 'false', 'not', 'else', 'elif',
+    'use', 'using', 'should', 'include', 'modify', 'approach', 'make', 'add',
+}
+
+
+def _stem(word: str) -> str:
+    # Deliberately tiny: just enough to match "means" with "mean" and "features" with "feature"
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased, identifier-split, lightly stemmed terms for indexing and querying"""
+    terms = []
+    for token in _TOKEN_RE.findall(text):
+        for word in split_identifier(token):
+            if len(word) > 1 and word not in _STOPWORDS:
+                terms.append(_stem(word))
+    return terms
+
+
+def chunk_source(path: str, source: str) -> List[Dict]:
+    """Split a module into function- and class-level chunks (plus a module-level chunk)"""
+    lines = source.splitlines()
+    try:
+        tree = ast.parse(source, filename=path)
+    except (SyntaxError, ValueError):
+        return [{'name': '<module>', 'kind': 'module', 'start': 1, 'end': len(lines), 'text': source}]
+
+    chunks = []
+    covered: Set[int] = set()
+
+    def add(name, kind, node):
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        covered.update(range(start, node.end_lineno + 1))
+        chunks.append({
+            'name': name, 'kind': kind, 'start': start, 'end': node.end_lineno,
+            'text': '\n'.join(lines[start - 1:node.end_lineno]),
+        })
+
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            add(node.name, 'function', node)
+        elif isinstance(node, ast.ClassDef):
+            if node.end_lineno - node.lineno < MAX_CLASS_CHUNK_LINES:
+                add(node.name, 'class', node)
+                continue
+            methods = [n for n in node.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+            for method in methods:
+                add(f"{node.name}.{method.name}", 'method', method)
+            # Class header, docstring and attributes outside the methods
+            header = [
+                lines[i - 1] for i in range(node.lineno, node.end_lineno + 1) if i not in covered
+            ]
+            covered.update(range(node.lineno, node.end_lineno + 1))
+            chunks.append({'name': node.name, 'kind': 'class', 'start': node.lineno,
+                           'end': node.end_lineno, 'text': '\n'.join(header)})
+
+    rest = [line for i, line in enumerate(lines, 1) if i not in covered]
+    if any(line.strip() for line in rest):
+        chunks.append({'name': '<module>', 'kind': 'module', 'start': 1, 'end': len(lines),
+                       'text': path + '\n' + '\n'.join(rest)})
+    return chunks
+
+
+class CodeSearchIndex:
+    """
+    Incremental BM25 index over function/class chunks of a checkout.
+
+    Term frequencies are persisted per file alongside the file's content hash, so
+    re-indexing only re-chunks files whose hash changed. The inverted index is
+    rebuilt in memory from the stored term frequencies, which is cheap.
+    """
+
+    def __init__(self, repo_path: Path, index_path: Optional[Path] = None):
+        self.repo_path = Path(repo_path).resolve()
+        self.index_path = Path(index_path) if index_path else self.repo_path / STATE_DIR_NAME / INDEX_FILE_NAME
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._files: Dict[str, Dict] = self._load()
+        # (chunks, postings, average chunk length), replaced as a whole by _build so
+        # search() can read it without the lock while update() runs
+        self._view: Optional[Tuple[List[Tuple[str, Dict]], Dict[str, List[Tuple[int, int]]], float]] = None
+
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable search index {self.index_path}: {str(e)}")
+            return {}
+        if data.get('version') != INDEX_VERSION:
+            return {}
+        return data.get('files', {})
+
+    def _save(self):
+        if self.index_path.parent.name == STATE_DIR_NAME:
+            ensure_state_dir(self.index_path.parent.parent)
+        else:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'files': self._files}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def update(self, files: Iterable[Mapping], max_file_bytes: int = MAX_SOURCE_FILE_BYTES) -> int:
+        """
+        Bring the index in line with the given codebase entries ({'path', 'sha256', 'content'}).
+        Files over max_file_bytes are left out. Returns the number of files that had to be re-chunked.
+        """
+        with self._lock:
+            current = {}
+            rechunked = 0
+            for file in files:
+                path = file['path']
+                sha = file.get('sha256')
+                previous = self._files.get(path)
+                if previous and sha and previous['sha256'] == sha:
+                    current[path] = previous
+                    continue
+                if source_size(file) > max_file_bytes:
+                    continue
+                try:
+                    source = file['content']
+                except (OSError, UnicodeDecodeError) as e:
+                    self.logger.warning(f"Error reading file {path}: {str(e)}")
+                    continue
+                chunks = []
+                for chunk in chunk_source(path, source):
+                    terms = Counter(tokenize(chunk['name'].replace('<module>', path) + '\n' + chunk['text']))
+                    chunks.append({
+                        'name': chunk['name'], 'kind': chunk['kind'],
+                        'start': chunk['start'], 'end': chunk['end'],
+                        'length': sum(terms.values()), 'tf': dict(terms),
+                    })
+                current[path] = {'sha256': sha, 'chunks': chunks}
+                rechunked += 1
+
+            dirty = rechunked or set(current) != set(self._files)
+            self._files = current
+            if dirty or self._view is None:
+                self._build()
+            if dirty:
+                self._save()
+
+        self.logger.info(
+            f"Search index covers {len(self._view[0])} chunks in {len(current)} files "
+            f"({rechunked} files re-indexed)"
+        )
+        return rechunked
+
+    def _build(self):
+        chunks = []
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        total_length = 0
+        for path in sorted(self._files):
+            for chunk in self._files[path]['chunks']:
+                idx = len(chunks)
+                chunks.append((path, chunk))
+                total_length += chunk['length']
+                for term, tf in chunk['tf'].items():
+                    postings.setdefault(term, []).append((idx, tf))
+        self._view = (chunks, postings, total_length / len(chunks) if chunks else 0.0)
+
+    def search(self, query: str, k: int = 10) -> List[Dict]:
+        """Top-k chunks for a free-text query, best first"""
+        if self._view is None:
+            return []
+        chunks, all_postings, avg_length = self._view
+        if not chunks:
+            return []
+        n = len(chunks)
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = all_postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for idx, tf in postings:
+                length = chunks[idx][1]['length']
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_length or 1))
+                scores[idx] = scores.get(idx, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        results = []
+        for idx, score in heapq.nlargest(k, scores.items(), key=lambda item: item[1]):
+            path, chunk = chunks[idx]
+            results.append({
+                'path': path, 'name': chunk['name'], 'kind': chunk['kind'],
+                'start': chunk['start'], 'end': chunk['end'], 'score': score,
+            })
+        return results
+
+
+_indexes: Dict[Path, CodeSearchIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_code_search_index(repo_path: Path) -> CodeSearchIndex:
+    """Return the shared search index for a checkout"""
+    key = Path(repo_path).resolve()
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = CodeSearchIndex(key)
+        return _indexes[key]
+
+
+def retrieval_seeds(hits: List[Dict]) -> Tuple[Dict[str, float], Dict[str, Set[str]]]:
+    """Turn search hits into ContextSelector seeds: per-file relevance and wanted symbols"""
+    seeds: Dict[str, float] = {}
+    symbols: Dict[str, Set[str]] = {}
+    if not hits:
+        return seeds, symbols
+    best = hits[0]['score'] or 1.0
+    for hit in hits:
+        seeds[hit['path']] = max(seeds.get(hit['path'], 0.0), 0.85 * hit['score'] / best)
+        if hit['kind'] != 'module':
+            symbols.setdefault(hit['path'], set()).add(hit['name'].split('.')[0])
+    return seeds, symbols
@@ -0,0 +1,297 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from collections.abc import Mapping
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Per-checkout directory holding the agents' persistent state (indexes, caches)
+STATE_DIR_NAME = '.code_agent'
+INDEX_FILE_NAME = 'file_index.json'
+INDEX_VERSION = 1
+# Source files larger than this (generated or minified code) are indexed, but their
+# content is never read into the search index or a prompt
+MAX_SOURCE_FILE_BYTES = 512 * 1024
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# Directories that never contain first-party code worth sending to the model
+SKIP_DIRS = {
+    '.git', '.hg', '.svn', STATE_DIR_NAME, '__pycache__', '.venv', 'venv', 'env',
+    'node_modules', 'site-packages', 'dist-packages', 'vendor', 'vendored', 'third_party',
+    '.tox', '.nox', '.eggs', 'build', 'dist', '.mypy_cache', '.pytest_cache', '.ruff_cache',
+}
+
+
+def source_size(file: Mapping) -> int:
+    """Size in bytes of a codebase entry, from the index when known so the file is not read"""
+    size = file.get('size')
+    return size if size is not None else len(file['content'].encode('utf-8'))
+
+
+def _hash_file(path: Path) -> str:
+    """sha256 of a file, read in chunks so huge files do not have to fit in memory"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def ensure_state_dir(repo_path: Path) -> Path:
+    """Create the agent state directory inside a checkout, ignored by git"""
+    state_dir = Path(repo_path) / STATE_DIR_NAME
+    state_dir.mkdir(parents=True, exist_ok=True)
+    gitignore = state_dir / '.gitignore'
+    if not gitignore.exists():
+        gitignore.write_text('*\n', encoding='utf-8')
+    return state_dir
+
+
+def _translate_glob(pattern: str) -> str:
+    """Translate a gitignore glob into a regular expression body"""
+    result = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern[i:i + 2] == '**':
+                if pattern[i + 2:i + 3] == '/':
+                    result.append('(?:.*/)?')
+                    i += 3
+                else:
+                    result.append('.*')
+                    i += 2
+                continue
+            result.append('[^/]*')
+        elif c == '?':
+            result.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 1)
+            if end == -1:
+                result.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                result.append(f"[{body}]")
+                i = end
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            result.append(re.escape(pattern[i]))
+        else:
+            result.append(re.escape(c))
+        i += 1
+    return ''.join(result)
+
+
+class GitIgnore:
+    """Subset of .gitignore semantics: globs, '**', anchoring, dir-only and negation"""
+
+    def __init__(self):
+        # (base dir relative to repo root, compiled regex, negate, dir_only, anchored)
+        self.rules: List[Tuple[str, re.Pattern, bool, bool, bool]] = []
+
+    def load(self, gitignore_path: Path, base: str):
+        try:
+            lines = gitignore_path.read_text(encoding='utf-8', errors='replace').splitlines()
+        except OSError:
+            return
+        for line in lines:
+            line = line.rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+            anchored = '/' in line
+            line = line.lstrip('/')
+            regex = re.compile(_translate_glob(line) + r'\Z')
+            self.rules.append((base, regex, negate, dir_only, anchored))
+
+    def is_ignored(self, rel_path: str, is_dir: bool) -> bool:
+        ignored = False
+        name = rel_path.rsplit('/', 1)[-1]
+        for base, regex, negate, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if base:
+                if not rel_path.startswith(base + '/'):
+                    continue
+                candidate = rel_path[len(base) + 1:]
+            else:
+                candidate = rel_path
+            if regex.match(candidate if anchored else name):
+                ignored = not negate
+        return ignored
+
+
+class IndexedFile(Mapping):
+    """
+    Index entry for one source file. Behaves like the {'path', 'content'} dicts
+    the agents have always used, but the content is read from disk on access.
+    """
+
+    __slots__ = ('repo_path', 'path', 'size', 'mtime_ns', 'sha256')
+    _keys = ('path', 'size', 'mtime_ns', 'sha256', 'content')
+
+    def __init__(self, repo_path: Path, path: str, size: int, mtime_ns: int, sha256: str):
+        self.repo_path = repo_path
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.sha256 = sha256
+
+    @property
+    def abspath(self) -> Path:
+        return self.repo_path / self.path
+
+    @property
+    def content(self) -> str:
+        with open(self.abspath, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return f"IndexedFile({self.path!r}, size={self.size}, sha256={self.sha256[:12]})"
+
+
+class CodebaseIndex:
+    """Persistent (path, size, mtime, content hash) index of a checkout's Python files"""
+
+    def __init__(self, repo_path: Path, index_path: Optional[Path] = None):
+        self.repo_path = Path(repo_path).resolve()
+        self.index_path = Path(index_path) if index_path else self.repo_path / STATE_DIR_NAME / INDEX_FILE_NAME
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = self._load()
+        self.changed: List[str] = []
+        self.removed: List[str] = []
+
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable index {self.index_path}: {str(e)}")
+            return {}
+        if data.get('version') != INDEX_VERSION:
+            return {}
+        return data.get('files', {})
+
+    def _save(self):
+        if self.index_path.parent.name == STATE_DIR_NAME:
+            ensure_state_dir(self.index_path.parent.parent)
+        else:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'files': self._entries}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def iter_source_paths(self, suffix: str = '.py') -> Iterable[Tuple[str, os.stat_result]]:
+        """Walk the checkout, honoring .gitignore and skipping vendored/virtualenv dirs"""
+        ignore = GitIgnore()
+        for dirpath, dirnames, filenames in os.walk(self.repo_path):
+            rel_dir = os.path.relpath(dirpath, self.repo_path).replace(os.sep, '/')
+            rel_dir = '' if rel_dir == '.' else rel_dir
+            if '.gitignore' in filenames:
+                ignore.load(Path(dirpath) / '.gitignore', rel_dir)
+
+            kept = []
+            for name in sorted(dirnames):
+                rel = f"{rel_dir}/{name}" if rel_dir else name
+                if name in SKIP_DIRS or name.endswith('.egg-info'):
+                    continue
+                if os.path.exists(os.path.join(dirpath, name, 'pyvenv.cfg')):
+                    continue
+                if ignore.is_ignored(rel, is_dir=True):
+                    continue
+                kept.append(name)
+            dirnames[:] = kept
+
+            for name in sorted(filenames):
+                if not name.endswith(suffix):
+                    continue
+                rel = f"{rel_dir}/{name}" if rel_dir else name
+                if ignore.is_ignored(rel, is_dir=False):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(dirpath, name))
+                except OSError:
+                    continue
+                yield rel, stat
+
+    def scan(self, exclude_names: Iterable[str] = ()) -> List[IndexedFile]:
+        """
+        Refresh the index and return entries for every Python file.
+        Only files whose size or mtime changed since the last scan are re-read.
+        """
+        exclude_names = set(exclude_names)
+        with self._lock:
+            entries = {}
+            changed = []
+            for rel, stat in self.iter_source_paths():
+                previous = self._entries.get(rel)
+                if previous and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+                    entries[rel] = previous
+                    continue
+                try:
+                    digest = _hash_file(self.repo_path / rel)
+                except OSError as e:
+                    self.logger.warning(f"Error reading file {rel}: {str(e)}")
+                    continue
+                entries[rel] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+                if not previous or previous['sha256'] != digest:
+                    changed.append(rel)
+
+            removed = [rel for rel in self._entries if rel not in entries]
+            dirty = changed or removed or any(
+                entries[rel] is not self._entries.get(rel) for rel in entries
+            )
+            self._entries = entries
+            self.changed = changed
+            self.removed = removed
+            if dirty:
+                self._save()
+
+        self.logger.info(
+            f"Indexed {len(entries)} Python files in {self.repo_path} "
+            f"({len(changed)} changed, {len(removed)} removed)"
+        )
+        return [
+            IndexedFile(self.repo_path, rel, entry['size'], entry['mtime_ns'], entry['sha256'])
+            for rel, entry in entries.items()
+            if rel.rsplit('/', 1)[-1] not in exclude_names
+        ]
+
+
+_indexes: Dict[Path, CodebaseIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_codebase_index(repo_path: Path) -> CodebaseIndex:
+    """Return the shared index for a checkout, so both agents reuse one in-memory copy"""
+    key = Path(repo_path).resolve()
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = CodebaseIndex(key)
+        return _indexes[key]
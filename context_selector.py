@@ -0,0 +1,448 @@
+import re
+import ast
+import heapq
+import logging
+from pathlib import PurePosixPath
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from codebase_index import MAX_SOURCE_FILE_BYTES, source_size
+
+DEFAULT_TOKEN_BUDGET = 12000
+CHARS_PER_TOKEN = 4
+# Files cut down by the context builder keep at least this many characters; with less room they are skipped
+MIN_FILE_CHARS = 200
+
+# How much relevance survives one hop along the import graph. Modules a seed
+# imports matter more than modules that import the seed.
+IMPORT_DECAY = 0.5
+REVERSE_IMPORT_DECAY = 0.3
+
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z0-9]*")
+_PATH_RE = re.compile(r"[\w./\\-]+\.py\b")
+_STOPWORDS = {
+    'the', 'and', 'for', 'with', 'when', 'into', 'from', 'that', 'this', 'one', 'use', 'using',
+    'add', 'new', 'include', 'modify', 'approach', 'make', 'should', 'model', 'feature', 'features',
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for budgeting"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_identifier(name: str) -> List[str]:
+    """Split snake_case / CamelCase identifiers into lowercase words"""
+    words = []
+    for part in re.split(r"[_\W]+", name):
+        words.extend(w.lower() for w in re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+", part))
+    return words
+
+
+def _first_doc_line(node) -> Optional[str]:
+    doc = ast.get_docstring(node)
+    if doc:
+        line = doc.strip().splitlines()[0].strip()
+        return line.replace('"""', "'''")
+    return None
+
+
+def _stub_function(node, indent: str) -> List[str]:
+    lines = [f"{indent}@{ast.unparse(d)}" for d in node.decorator_list]
+    prefix = 'async def' if isinstance(node, ast.AsyncFunctionDef) else 'def'
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ''
+    lines.append(f"{indent}{prefix} {node.name}({ast.unparse(node.args)}){returns}:")
+    doc = _first_doc_line(node)
+    if doc:
+        lines.append(f'{indent}    """{doc}"""')
+    lines.append(f"{indent}    ...")
+    return lines
+
+
+def _stub_class(node, indent: str = '') -> List[str]:
+    lines = [f"{indent}@{ast.unparse(d)}" for d in node.decorator_list]
+    bases = [ast.unparse(b) for b in node.bases] + [ast.unparse(k) for k in node.keywords]
+    lines.append(f"{indent}class {node.name}({', '.join(bases)}):" if bases else f"{indent}class {node.name}:")
+    doc = _first_doc_line(node)
+    if doc:
+        lines.append(f'{indent}    """{doc}"""')
+    body = []
+    for child in node.body:
+        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            body.extend(_stub_function(child, indent + '    '))
+        elif isinstance(child, ast.ClassDef):
+            body.extend(_stub_class(child, indent + '    '))
+        elif isinstance(child, (ast.Assign, ast.AnnAssign)):
+            body.append(f"{indent}    {ast.unparse(child).splitlines()[0][:120]}")
+    lines.extend(body or [f"{indent}    ..."])
+    return lines
+
+
+class ModuleInfo:
+    """Import edges, top-level symbols and a signatures-only stub for one file"""
+
+    def __init__(self, path: str, names: List[str]):
+        self.path = path
+        self.names = names
+        self.imports: Set[str] = set()
+        self.imported_names: Dict[str, Set[str]] = {}
+        # symbol name -> (first line, last line), 1-based inclusive
+        self.symbols: Dict[str, Tuple[int, int]] = {}
+        self.words: Set[str] = set()
+        self.stub = ''
+        self.full_tokens = 0
+        self.parsed = False
+        # Too large to read; never sent, not even as a stub
+        self.oversized = False
+
+
+class ContextSelector:
+    """
+    Pick the code worth sending to the model under a token budget.
+
+    Builds an import/symbol graph of the repository, seeds it from the test file,
+    the test output and the feature description, ranks modules by graph distance
+    from the seeds and packs whole files, then individual symbols, then
+    signature stubs until the budget is spent.
+    """
+
+    def __init__(self, files: Iterable[Mapping], token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 max_file_bytes: int = MAX_SOURCE_FILE_BYTES):
+        self.files = {f['path']: f for f in files}
+        self.token_budget = token_budget
+        self.max_file_bytes = max_file_bytes
+        self.logger = logging.getLogger(__name__)
+        self.modules: Dict[str, ModuleInfo] = {}
+        self.module_names: Dict[str, str] = {}
+        self.oversized: List[str] = []
+        self._build_graph()
+
+    @staticmethod
+    def _module_names(path: str, package_dirs: Set[str]) -> List[str]:
+        parts = list(PurePosixPath(path).with_suffix('').parts)
+        if parts and parts[-1] == '__init__':
+            parts = parts[:-1]
+        names = ['.'.join(parts)] if parts else []
+        # Also register the name relative to the nearest import root, i.e. the
+        # closest ancestor directory that is not itself a package (src/ layouts)
+        for i in range(len(parts) - 1, 0, -1):
+            if '/'.join(parts[:i]) not in package_dirs:
+                names.append('.'.join(parts[i:]))
+                break
+        return names
+
+    def _build_graph(self):
+        package_dirs = {
+            str(PurePosixPath(p).parent) for p in self.files if PurePosixPath(p).name == '__init__.py'
+        }
+        for path in self.files:
+            info = ModuleInfo(path, self._module_names(path, package_dirs))
+            self.modules[path] = info
+            for name in info.names:
+                self.module_names.setdefault(name, path)
+
+        for path, info in self.modules.items():
+            size = source_size(self.files[path])
+            if size > self.max_file_bytes:
+                # Typically generated or minified; reading and parsing it would dominate memory
+                info.oversized = True
+                info.full_tokens = size // CHARS_PER_TOKEN
+                self.oversized.append(path)
+                continue
+            try:
+                source = self.files[path]['content']
+            except (OSError, UnicodeDecodeError) as e:
+                self.logger.warning(f"Error reading file {path}: {str(e)}")
+                continue
+            info.full_tokens = estimate_tokens(source)
+            try:
+                tree = ast.parse(source, filename=path)
+            except (SyntaxError, ValueError):
+                self.logger.debug(f"Could not parse {path}; it will only be sent whole")
+                continue
+            self._index_module(info, tree)
+
+    def resolve_module(self, name: str) -> Optional[str]:
+        """Map a dotted module name (or the longest repo-local prefix of it) to a file path"""
+        parts = name.split('.')
+        for i in range(len(parts), 0, -1):
+            path = self.module_names.get('.'.join(parts[:i]))
+            if path:
+                return path
+        return None
+
+    def _resolve_relative(self, info: ModuleInfo, module: Optional[str], level: int) -> str:
+        # Both pkg/mod.py and pkg/__init__.py resolve '.' against the pkg directory
+        package = list(PurePosixPath(info.path).parent.parts)
+        if level > 1:
+            package = package[:max(len(package) - (level - 1), 0)]
+        return '.'.join(package + ([module] if module else []))
+
+    def _index_module(self, info: ModuleInfo, tree: ast.Module):
+        info.parsed = True
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    target = self.resolve_module(alias.name)
+                    if target and target != info.path:
+                        info.imports.add(target)
+            elif isinstance(node, ast.ImportFrom):
+                base = self._resolve_relative(info, node.module, node.level) if node.level else (node.module or '')
+                for alias in node.names:
+                    target = self.resolve_module(f"{base}.{alias.name}") if base else None
+                    target = target or self.resolve_module(base)
+                    if target and target != info.path:
+                        info.imports.add(target)
+                        info.imported_names.setdefault(target, set()).add(alias.name)
+
+        stub = []
+        assigned = set()
+        doc = _first_doc_line(tree)
+        if doc:
+            stub.append(f'"""{doc}"""')
+        for node in tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                first = min([node.lineno] + [d.lineno for d in node.decorator_list])
+                info.symbols[node.name] = (first, node.end_lineno)
+                info.words.update(split_identifier(node.name))
+                stub.extend(_stub_class(node) if isinstance(node, ast.ClassDef) else _stub_function(node, ''))
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    if isinstance(target, ast.Name) and target.id not in assigned:
+                        assigned.add(target.id)
+                        info.words.update(split_identifier(target.id))
+                        stub.append(f"{target.id} = ...")
+        for name in info.names:
+            info.words.update(split_identifier(name))
+        info.stub = '\n'.join(stub)
+
+    def _seed(self, test_source: Optional[str], test_output: Optional[str],
+              feature_description: Optional[str], extra_seeds: Optional[Dict[str, float]],
+              extra_symbols: Optional[Dict[str, Set[str]]]) -> Tuple[Dict[str, float], Dict[str, Set[str]]]:
+        """Initial relevance per module and the symbols explicitly referenced in each"""
+        scores: Dict[str, float] = {}
+        wanted: Dict[str, Set[str]] = {}
+
+        def bump(path, score):
+            scores[path] = max(scores.get(path, 0.0), score)
+
+        if test_source:
+            probe = ModuleInfo('generated_test_cases.py', [])
+            try:
+                self._index_module(probe, ast.parse(test_source))
+            except (SyntaxError, ValueError):
+                pass
+            for path in probe.imports:
+                bump(path, 1.0)
+            for path, names in probe.imported_names.items():
+                wanted.setdefault(path, set()).update(
+                    n for n in names if n in self.modules[path].symbols
+                )
+
+        if test_output:
+            normalized = test_output.replace('\\', '/')
+            for match in set(_PATH_RE.findall(normalized)):
+                for path in self.modules:
+                    if match == path or match.endswith('/' + path):
+                        bump(path, 0.9)
+
+        if feature_description:
+            words = {w.lower() for w in _WORD_RE.findall(feature_description)}
+            words = {w for w in words if len(w) > 2 and w not in _STOPWORDS}
+            if words:
+                for path, info in self.modules.items():
+                    overlap = len(words & info.words)
+                    if overlap:
+                        bump(path, min(0.8, 0.3 + 0.1 * overlap))
+
+        for path, score in (extra_seeds or {}).items():
+            if path in self.modules:
+                bump(path, score)
+        for path, names in (extra_symbols or {}).items():
+            if path in self.modules:
+                wanted.setdefault(path, set()).update(n for n in names if n in self.modules[path].symbols)
+        return scores, wanted
+
+    def _propagate(self, seeds: Dict[str, float]) -> Dict[str, float]:
+        """Max-product relevance propagation along import edges"""
+        importers: Dict[str, Set[str]] = {path: set() for path in self.modules}
+        for path, info in self.modules.items():
+            for target in info.imports:
+                importers[target].add(path)
+
+        scores = dict(seeds)
+        heap = [(-score, path) for path, score in seeds.items()]
+        heapq.heapify(heap)
+        while heap:
+            neg_score, path = heapq.heappop(heap)
+            score = -neg_score
+            if score < scores.get(path, 0.0):
+                continue
+            neighbours = [(t, IMPORT_DECAY) for t in self.modules[path].imports]
+            neighbours += [(t, REVERSE_IMPORT_DECAY) for t in importers[path]]
+            for target, decay in neighbours:
+                candidate = score * decay
+                if candidate > scores.get(target, 0.0) + 1e-9:
+                    scores[target] = candidate
+                    heapq.heappush(heap, (-candidate, target))
+        return scores
+
+    def _symbol_source(self, path: str, names: Set[str]) -> str:
+        lines = self.files[path]['content'].splitlines()
+        chunks = []
+        for name in sorted(names, key=lambda n: self.modules[path].symbols[n][0]):
+            first, last = self.modules[path].symbols[name]
+            chunks.append('\n'.join(lines[first - 1:last]))
+        return '\n\n'.join(chunks)
+
+    def select(self, test_source: Optional[str] = None, test_output: Optional[str] = None,
+               feature_description: Optional[str] = None,
+               extra_seeds: Optional[Dict[str, float]] = None,
+               extra_symbols: Optional[Dict[str, Set[str]]] = None) -> Tuple[List[Dict], Dict]:
+        """
+        Return (sections, report). Each section is {'path', 'kind', 'content'} where kind is
+        'full', 'partial' (referenced symbols plus stubs) or 'stub' (signatures only).
+        extra_seeds/extra_symbols let callers add relevance from other sources, e.g. retrieval hits.
+        """
+        seeds, wanted = self._seed(test_source, test_output, feature_description, extra_seeds, extra_symbols)
+        if not seeds:
+            # Nothing to anchor on: every module is a candidate, preferring the ones
+            # the rest of the repo depends on
+            seeds = {path: 0.01 for path in self.modules}
+            for info in self.modules.values():
+                for target in info.imports:
+                    seeds[target] += 0.01
+        scores = self._propagate(seeds)
+
+        ranked = sorted(self.modules, key=lambda p: (-scores.get(p, 0.0), self.modules[p].full_tokens, p))
+        remaining = self.token_budget
+        chosen: Dict[str, Dict] = {}
+        total_tokens = sum(info.full_tokens for info in self.modules.values())
+
+        # First pass: whole files, or just the referenced symbols when the file is too big
+        for path in ranked:
+            if scores.get(path, 0.0) <= 0:
+                break
+            info = self.modules[path]
+            if info.oversized:
+                continue
+            if info.full_tokens <= remaining:
+                chosen[path] = {'path': path, 'kind': 'full', 'content': self.files[path]['content'],
+                                'tokens': info.full_tokens}
+                remaining -= info.full_tokens
+            elif wanted.get(path):
+                content = self._symbol_source(path, wanted[path])
+                if info.stub:
+                    content += "\n\n# Other definitions (signatures only)\n" + info.stub
+                tokens = estimate_tokens(content)
+                if tokens <= remaining:
+                    chosen[path] = {'path': path, 'kind': 'partial', 'content': content, 'tokens': tokens}
+                    remaining -= tokens
+
+        # Second pass: signatures-only stubs for everything else, most relevant first
+        for path in ranked:
+            info = self.modules[path]
+            if path in chosen or not info.stub:
+                continue
+            tokens = estimate_tokens(info.stub)
+            if tokens <= remaining:
+                chosen[path] = {'path': path, 'kind': 'stub', 'content': info.stub, 'tokens': tokens}
+                remaining -= tokens
+
+        sections = [chosen[path] for path in ranked if path in chosen]
+        included = sum(s['tokens'] for s in sections)
+        full_included = sum(self.modules[s['path']].full_tokens for s in sections if s['kind'] == 'full')
+        report = {
+            'token_budget': self.token_budget,
+            'included_tokens': included,
+            'dropped_tokens': total_tokens - full_included,
+            'full_files': sum(1 for s in sections if s['kind'] == 'full'),
+            'partial_files': sum(1 for s in sections if s['kind'] == 'partial'),
+            'stub_files': sum(1 for s in sections if s['kind'] == 'stub'),
+            'omitted_files': len(self.modules) - len(sections),
+            'oversized_files': sorted(self.oversized),
+        }
+        self.logger.info(
+            f"Packed context: {report['included_tokens']}/{self.token_budget} tokens included "
+            f"({report['full_files']} full, {report['partial_files']} partial, {report['stub_files']} stubs), "
+            f"{report['dropped_tokens']} tokens of source dropped, {report['omitted_files']} files omitted"
+        )
+        if self.oversized:
+            self.logger.warning(
+                f"Skipped {len(self.oversized)} files over {self.max_file_bytes} bytes: "
+                f"{', '.join(sorted(self.oversized)[:5])}{' ...' if len(self.oversized) > 5 else ''}"
+            )
+        return sections, report
+
+
+class ContextBuilder:
+    """
+    Single-pass assembly of the codebase context of a prompt. Pieces are collected
+    and joined once at the end. Each file is capped at max_file_bytes of UTF-8 (the
+    unit of the index's MAX_SOURCE_FILE_BYTES), cut at a line boundary with a marker,
+    and files that no longer fit in max_total_chars characters are skipped. Both are
+    listed in report().
+    """
+
+    LABELS = {'full': '', 'partial': ' (excerpt)', 'stub': ' (signatures only)'}
+
+    def __init__(self, max_total_chars: Optional[int] = None, max_file_bytes: int = MAX_SOURCE_FILE_BYTES,
+                 token_budget: int = DEFAULT_TOKEN_BUDGET):
+        # By default twice the selector's budget, leaving room for headers and estimate error
+        self.max_total_chars = max_total_chars or 2 * token_budget * CHARS_PER_TOKEN
+        self.max_file_bytes = max_file_bytes
+        self.size = 0
+        self.files = 0
+        self.truncated: List[str] = []
+        self.skipped: List[str] = []
+        self.logger = logging.getLogger(__name__)
+        self._parts: List[str] = []
+
+    def add_text(self, text: str) -> bool:
+        """Append text unless it would exceed the total cap"""
+        if self.size + len(text) > self.max_total_chars:
+            return False
+        self._parts.append(text)
+        self.size += len(text)
+        return True
+
+    def add_file(self, path: str, content: str, label: str = '') -> bool:
+        """Append one file as a fenced block, truncated or skipped to respect the caps"""
+        header = f"\nFile: {path}{label}\n```python\n"
+        footer = "\n```\n"
+        room = self.max_total_chars - self.size - len(header) - len(footer)
+        # Characters that fit in the per-file byte cap; only encoded when it could be exceeded
+        if len(content) > self.max_file_bytes // 4:
+            encoded = content.encode('utf-8')
+            if len(encoded) > self.max_file_bytes:
+                room = min(room, len(encoded[:self.max_file_bytes].decode('utf-8', errors='ignore')))
+        if len(content) > room:
+            # Leave space for the truncation marker
+            room -= 80
+            if room < MIN_FILE_CHARS:
+                self.skipped.append(path)
+                return False
+            cut = content.rfind('\n', 0, room)
+            cut = cut if cut > 0 else room
+            content = f"{content[:cut]}\n# ... truncated, {len(content) - cut} more characters not shown"
+            self.truncated.append(path)
+        self._parts.extend((header, content, footer))
+        self.size += len(header) + len(content) + len(footer)
+        self.files += 1
+        return True
+
+    def add_section(self, section: Dict) -> bool:
+        """Append a section from ContextSelector.select()"""
+        return self.add_file(section['path'], section['content'], self.LABELS.get(section['kind'], ''))
+
+    def build(self) -> str:
+        return ''.join(self._parts)
+
+    def report(self) -> Dict:
+        if self.truncated or self.skipped:
+            self.logger.warning(
+                f"Context over its caps ({self.max_file_bytes} bytes per file, {self.max_total_chars} characters in total): "
+                f"{len(self.truncated)} files truncated, {len(self.skipped)} skipped"
+            )
+        return {'context_chars': self.size, 'context_files': self.files,
+                'truncated_files': list(self.truncated), 'skipped_files': list(self.skipped)}
@@ -0,0 +1,298 @@
+import re
+import difflib
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from code_blocks import CodeBlockStreamParser
+
+SEARCH_MARKER = re.compile(r'^\s*<{5,9} ?SEARCH\s*$')
+DIVIDER_MARKER = re.compile(r'^\s*={5,9}\s*$')
+REPLACE_MARKER = re.compile(r'^\s*>{5,9} ?REPLACE\s*$')
+# Minimum similarity for a fuzzy hunk match, and the work limit for attempting one
+FUZZY_THRESHOLD = 0.85
+FUZZY_MAX_COMPARISONS = 200000
+
+EDIT_FORMAT_INSTRUCTIONS = """Describe every change as a search/replace edit block: the file path on its own line directly
+above the block, then
+path/to/file.py
+<<<<<<< SEARCH
+the exact lines to change, copied from the current file
+=======
+the lines that replace them
+>>>>>>> REPLACE
+The SEARCH part must match the existing code, including indentation, and contain just enough
+lines to be unique in the file; a SEARCH part that matches more than one place is rejected.
+Prefer several small blocks over one large one. To create a new file, leave the SEARCH part
+empty. Do not repeat unchanged code outside the blocks."""
+
+
+class EditBlock:
+    """One search/replace edit of a file"""
+
+    def __init__(self, path: str, search: str, replace: str):
+        self.path = path
+        self.search = search
+        self.replace = replace
+
+    def format(self) -> str:
+        return f"{self.path}\n<<<<<<< SEARCH\n{self.search}\n=======\n{self.replace}\n>>>>>>> REPLACE\n"
+
+    def __repr__(self):
+        return f"EditBlock({self.path!r}, {len(self.search.splitlines())} -> {len(self.replace.splitlines())} lines)"
+
+
+def _path_from_line(line: str, repo_path: Optional[Path] = None) -> Optional[str]:
+    """
+    File path named on the line before an edit block, e.g. 'pkg/mod.py' or '```python:pkg/mod.py'.
+    Only Python files, or files that exist under repo_path, are taken as paths.
+    """
+    candidate = line.strip().strip('`*#').strip()
+    if candidate.startswith('python:'):
+        candidate = candidate[len('python:'):]
+    candidate = candidate.rstrip(':').strip()
+    if not candidate or ' ' in candidate or candidate in ('python', 'py'):
+        return None
+    if candidate.endswith('.py'):
+        return candidate
+    if repo_path is not None and (Path(repo_path) / candidate).is_file():
+        return candidate
+    return None
+
+
+def _is_fence(line: str) -> bool:
+    """A code fence line without a path, e.g. '```' or '```python'"""
+    return bool(re.match(r'^\s*```\s*(python|py)?\s*$', line))
+
+
+def parse_edit_response(text: str, repo_path: Optional[Path] = None) -> Tuple[List[EditBlock], Dict[str, str]]:
+    """
+    Edit blocks in a response, plus any whole files it sent as ```python:path
+    blocks (the model may still do that for new files).
+
+    A block's path is read from the last line before its SEARCH marker (an opening
+    code fence in between is skipped). A block that directly follows another one,
+    with nothing but blank or fence lines between them, may leave the path out and
+    edits the same file. Blocks without a path are dropped.
+    """
+    logger = logging.getLogger(__name__)
+    edits = []
+    path = None
+    # Path of the previous block while only blank or fence lines have followed it
+    previous_path = None
+    # Last non-blank line before a SEARCH marker, and the one before it
+    last_line, before_last = None, None
+    state = 'text'
+    search: List[str] = []
+    replace: List[str] = []
+    for line in text.splitlines():
+        if state == 'text':
+            if SEARCH_MARKER.match(line):
+                state = 'search'
+                search = []
+                path = _path_from_line(last_line, repo_path) if last_line is not None else None
+                if path is None and last_line is not None and _is_fence(last_line) and before_last is not None:
+                    path = _path_from_line(before_last, repo_path)
+                path = path or previous_path
+            elif line.strip():
+                before_last, last_line = last_line, line
+                if not _is_fence(line):
+                    previous_path = None
+        elif state == 'search':
+            if DIVIDER_MARKER.match(line):
+                state = 'replace'
+                replace = []
+            else:
+                search.append(line)
+        elif REPLACE_MARKER.match(line):
+            state = 'text'
+            last_line, before_last = None, None
+            if path:
+                edits.append(EditBlock(path, '\n'.join(search), '\n'.join(replace)))
+            else:
+                logger.warning("Dropping an edit block that is not preceded by a file path")
+            previous_path = path
+        else:
+            replace.append(line)
+
+    files = {}
+
+    def on_block(block_path: Optional[str], content: str):
+        if block_path and not any(SEARCH_MARKER.match(line) for line in content.splitlines()):
+            files[block_path] = content
+
+    parser = CodeBlockStreamParser(on_block)
+    parser.feed(text)
+    parser.close()
+    return edits, files
+
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _trim_blank(lines: List[str]) -> List[str]:
+    start, end = 0, len(lines)
+    while start < end and not lines[start].strip():
+        start += 1
+    while end > start and not lines[end - 1].strip():
+        end -= 1
+    return lines[start:end]
+
+
+def _reindent(lines: List[str], search_indent: str, file_indent: str) -> List[str]:
+    """Shift replacement lines by the indentation difference between the SEARCH text and the file"""
+    if search_indent == file_indent:
+        return lines
+    result = []
+    for line in lines:
+        if line.strip() and line.startswith(search_indent):
+            line = file_indent + line[len(search_indent):]
+        result.append(line)
+    return result
+
+
+def _find(lines: List[str], search: List[str]) -> Tuple[Optional[int], str]:
+    """
+    Start of the hunk matching search, and how it was matched ('exact', 'whitespace', 'fuzzy').
+    SEARCH text that matches more than one place is rejected as 'ambiguous' rather than
+    applied to the first one.
+    """
+    n = len(search)
+    for normalize, kind in ((str.rstrip, 'exact'), (str.strip, 'whitespace')):
+        wanted = [normalize(line) for line in search]
+        starts = [i for i in range(len(lines) - n + 1) if [normalize(line) for line in lines[i:i + n]] == wanted]
+        if len(starts) > 1:
+            return None, 'ambiguous'
+        if starts:
+            return starts[0], kind
+    if len(lines) * n > FUZZY_MAX_COMPARISONS:
+        return None, ''
+    target = '\n'.join(line.strip() for line in search)
+    best, best_ratio, tied = None, FUZZY_THRESHOLD, False
+    matcher = difflib.SequenceMatcher(autojunk=False)
+    matcher.set_seq2(target)
+    for i in range(len(lines) - n + 1):
+        matcher.set_seq1('\n'.join(line.strip() for line in lines[i:i + n]))
+        if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+            continue
+        ratio = matcher.ratio()
+        if ratio > best_ratio:
+            best, best_ratio, tied = i, ratio, False
+        elif ratio == best_ratio and best is not None and i >= best + n:
+            # An equally similar hunk that does not overlap the best one
+            tied = True
+    if tied:
+        return None, 'ambiguous'
+    return best, 'fuzzy' if best is not None else ''
+
+
+def apply_edit(content: str, edit: EditBlock) -> Tuple[Optional[str], str]:
+    """
+    Apply one edit to a file's content. Tries an exact match, then one that ignores
+    indentation (re-indenting the replacement), then the most similar hunk of the
+    same length. Returns (new content or None if nothing or more than one hunk
+    matched, match kind).
+    """
+    search = _trim_blank(edit.search.splitlines())
+    replace = edit.replace.splitlines()
+    if not search:
+        # Empty SEARCH: create the file, or append to it
+        separator = '' if not content or content.endswith('\n') else '\n'
+        return content + separator + '\n'.join(replace) + '\n', 'append'
+
+    newline = '\r\n' if '\r\n' in content else '\n'
+    lines = content.splitlines()
+    start, kind = _find(lines, search)
+    if start is None:
+        return None, kind
+
+    matched = lines[start:start + len(search)]
+    if kind != 'exact':
+        search_first = next(line for line in search if line.strip())
+        file_first = next((line for line in matched if line.strip()), search_first)
+        replace = _reindent(replace, _indent(search_first), _indent(file_first))
+    new_lines = lines[:start] + replace + lines[start + len(search):]
+    trailing = newline if content.endswith(('\n', '\r')) else ''
+    return newline.join(new_lines) + trailing, kind
+
+
+def fallback_prompt(prompt: str, failed: Dict[str, List[EditBlock]], contents: Dict[str, str]) -> str:
+    """Follow-up asking for whole files in place of edits that did not apply"""
+    sections = ''.join(
+        f"\nCurrent content of {path}:\n```python\n{contents.get(path, '')}\n```\n"
+        f"Edits that did not match it:\n```\n{''.join(edit.format() for edit in edits)}```\n"
+        for path, edits in failed.items()
+    )
+    return f"""{prompt}
+
+The SEARCH part of some of your edit blocks did not match the files they edit, or matched more than one place.
+{sections}
+Reply with the complete updated code of each of these files instead, with your changes applied.
+Enclose each file in triple backticks with its path, e.g.
+```python:path/to/file.py
+# Complete file content here
+```
+"""
+
+
+def contained_path(repo_path: Path, path: str) -> Optional[Path]:
+    """path resolved under repo_path, or None if it is absolute or resolves outside it"""
+    if not path or Path(path).is_absolute():
+        return None
+    root = Path(repo_path).resolve()
+    target = (root / path).resolve()
+    return target if root in target.parents else None
+
+
+def write_files(repo_path: Path, files: Dict[str, str]) -> List[Path]:
+    """Write files under repo_path, refusing paths that resolve outside it"""
+    written = []
+    for path, content in files.items():
+        target = contained_path(repo_path, path)
+        if target is None:
+            raise ValueError(f"Refusing to write outside the checkout: {path}")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(target, 'w', encoding='utf-8') as f:
+            f.write(content)
+        written.append(target)
+    return written
+
+
+def apply_edits(repo_path: Path, edits: List[EditBlock]) -> Tuple[Dict[str, str], Dict[str, List[EditBlock]]]:
+    """
+    Apply edits to the files under repo_path in memory. Returns the new content
+    of every file whose edits all applied, and the edits of files where at least
+    one did not (those files are left out of the first result). Edits to paths
+    outside repo_path are never read or applied and count as failed.
+    """
+    logger = logging.getLogger(__name__)
+    updated: Dict[str, str] = {}
+    failed: Dict[str, List[EditBlock]] = {}
+    for edit in edits:
+        if edit.path in failed:
+            failed[edit.path].append(edit)
+            continue
+        if edit.path not in updated:
+            target = contained_path(repo_path, edit.path)
+            if target is None:
+                logger.warning(f"Edit to {edit.path} is outside the checkout; not applying it")
+                failed[edit.path] = [e for e in edits if e.path == edit.path]
+                continue
+            try:
+                updated[edit.path] = target.read_text(encoding='utf-8')
+            except FileNotFoundError:
+                updated[edit.path] = ''
+        content, kind = apply_edit(updated[edit.path], edit)
+        if content is None:
+            if kind == 'ambiguous':
+                logger.warning(f"Edit to {edit.path} matches more than one place in the file")
+            else:
+                logger.warning(f"Edit to {edit.path} did not match the file")
+            failed[edit.path] = [e for e in edits if e.path == edit.path]
+            del updated[edit.path]
+            continue
+        if kind in ('whitespace', 'fuzzy'):
+            logger.info(f"Applied edit to {edit.path} with {kind} matching")
+        updated[edit.path] = content
+    return updated, failed
@@ -0,0 +1,206 @@
+"""
+Local OpenAI/Together-compatible chat completion server returning canned responses.
+
+Used by benchmark.py to run both agents end to end without network access or
+API costs. Point the agents at it with LLMClient(base_url=server.base_url) or
+LLM_API_BASE. Latency and streaming behavior are configurable, so the agents'
+own overhead can be measured with or without realistic model timings.
+"""
+import json
+import time
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_RESPONSE = "Canned response from the fake LLM server."
+
+
+def _count_tokens(text: str) -> int:
+    # Same ~4 characters per token estimate as the context selector
+    return max(1, len(text) // 4) if text else 0
+
+
+class FakeLLMServer:
+    """
+    Serves POST /v1/chat/completions (plain and server-sent events) in a background thread.
+
+    The response to a request is the text of the first rule whose substring occurs in
+    the prompt (optionally restricted to a model), else default_response.
+
+    Timing: every response waits latency seconds before its first byte; streamed
+    responses then send chunk_chars characters per event with chunk_delay seconds
+    between events, and report token usage at the end when include_usage is set.
+
+    Errors queued with fail_next() answer the next requests instead, in order.
+    """
+
+    def __init__(self, rules: Sequence[Tuple[str, str]] = (), default_response: str = DEFAULT_RESPONSE,
+                 latency: float = 0.0, chunk_chars: int = 16, chunk_delay: float = 0.0,
+                 include_usage: bool = True, host: str = '127.0.0.1', port: int = 0):
+        self.rules: List[Tuple[str, Optional[str], str]] = []
+        for rule in rules:
+            self.add_rule(*rule)
+        self.default_response = default_response
+        self.latency = latency
+        self.chunk_chars = max(1, chunk_chars)
+        self.chunk_delay = chunk_delay
+        self.include_usage = include_usage
+        self.host = host
+        self.port = port
+        # One entry per request: model, stream flag, prompt size and the rule that answered
+        self.requests: List[Dict] = []
+        self.failures: List[Tuple[int, Optional[str]]] = []
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def add_rule(self, marker: str, response: str, model: Optional[str] = None):
+        """Answer prompts containing marker (for model, or any model) with response"""
+        self.rules.append((marker, model, response))
+
+    def fail_next(self, status: int, times: int = 1, retry_after: Optional[str] = None):
+        """Answer the next `times` requests with HTTP status (and a Retry-After header if given)"""
+        with self._lock:
+            self.failures.extend([(status, retry_after)] * times)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def respond(self, model: str, prompt: str) -> Tuple[str, Optional[str]]:
+        """The canned text for a request and the marker of the rule that chose it"""
+        for marker, rule_model, response in self.rules:
+            if (rule_model is None or rule_model == model) and marker in prompt:
+                return response, marker
+        return self.default_response, None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                server.logger.debug(format % args)
+
+            def _send_json(self, status: int, body: Dict, headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_event(self, data: str):
+                chunk = f"data: {data}\n\n".encode('utf-8')
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.flush()
+
+            def do_POST(self):
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self._send_json(404, {'error': {'message': f"Unknown path {self.path}"}})
+                    return
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                    model = request['model']
+                    prompt = '\n'.join(m.get('content') or '' for m in request['messages'])
+                except (ValueError, KeyError, TypeError) as e:
+                    self._send_json(400, {'error': {'message': f"Bad request: {str(e)}"}})
+                    return
+
+                text, marker = server.respond(model, prompt)
+                stream = bool(request.get('stream'))
+                with server._lock:
+                    failure = server.failures.pop(0) if server.failures else None
+                    server.requests.append({'model': model, 'stream': stream, 'prompt_bytes': len(prompt.encode('utf-8')),
+                                            'rule': marker, 'status': failure[0] if failure else 200})
+                if failure is not None:
+                    status, retry_after = failure
+                    self._send_json(status, {'error': {'message': f"Injected HTTP {status}"}},
+                                    {'Retry-After': retry_after} if retry_after is not None else None)
+                    return
+                usage = {'prompt_tokens': _count_tokens(prompt), 'completion_tokens': _count_tokens(text)}
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if not stream:
+                    self._send_json(200, {
+                        'id': 'fake', 'object': 'chat.completion', 'model': model,
+                        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text},
+                                     'finish_reason': 'stop'}],
+                        'usage': usage,
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for i in range(0, len(text), server.chunk_chars):
+                    if i and server.chunk_delay:
+                        time.sleep(server.chunk_delay)
+                    self._send_event(json.dumps({'choices': [{'index': 0, 'delta': {'content': text[i:i + server.chunk_chars]}}]}))
+                self._send_event(json.dumps({'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}))
+                if server.include_usage:
+                    self._send_event(json.dumps({'choices': [], 'usage': usage}))
+                self._send_event('[DONE]')
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def start(self) -> 'FakeLLMServer':
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_port
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-llm-server', daemon=True)
+        self._thread.start()
+        self.logger.info(f"Fake LLM server listening on {self.base_url}")
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self) -> 'FakeLLMServer':
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve canned chat completions on an OpenAI-compatible endpoint")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds before each response starts")
+    parser.add_argument('--chunk-chars', type=int, default=16, help="Characters per streamed event")
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help="Seconds between streamed events")
+    parser.add_argument('--rules', default=None,
+                        help="JSON file with a list of {marker, response, model?} objects, tried in order")
+    parser.add_argument('--default-response', default=DEFAULT_RESPONSE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = FakeLLMServer(default_response=args.default_response, latency=args.latency,
+                           chunk_chars=args.chunk_chars, chunk_delay=args.chunk_delay, port=args.port)
+    if args.rules:
+        with open(args.rules, 'r', encoding='utf-8') as f:
+            for rule in json.load(f):
+                server.add_rule(rule['marker'], rule['response'], rule.get('model'))
+    server.start()
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import tracing
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "code_generation_agent", "llm")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 3600
+
+# "use" reads and writes the cache, "refresh" skips reads but stores fresh
+# completions, "bypass" neither reads nor writes.
+CACHE_MODES = ("use", "refresh", "bypass")
+
+
+class DiskStore:
+    """Content-addressed JSON store with size/age based LRU eviction"""
+
+    def __init__(self, root: str, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    def _entry_path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the stored value for key, or None if missing or expired"""
+        path = self._entry_path(key)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+
+        if self.max_age_seconds and time.time() - stat.st_mtime > self.max_age_seconds:
+            self._remove(path, stat.st_size)
+            return None
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Dropping unreadable cache entry {path}: {str(e)}")
+            self._remove(path, stat.st_size)
+            return None
+
+        # Bump the mtime so eviction treats this entry as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key: str, value: Dict):
+        """Atomically store value under key and evict old entries if over budget"""
+        path = self._entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(value).encode('utf-8')
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        try:
+            previous_size = path.stat().st_size
+        except FileNotFoundError:
+            previous_size = 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_total()
+            else:
+                self._total_bytes += len(data) - previous_size
+            over_budget = self.max_bytes and self._total_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def _remove(self, path: Path, size: int):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes -= size
+
+    def _entries(self) -> List[Tuple[Path, os.stat_result]]:
+        entries = []
+        if not self.root.exists():
+            return entries
+        for path in self.root.glob("*/*.json"):
+            try:
+                entries.append((path, path.stat()))
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def _scan_total(self) -> int:
+        return sum(stat.st_size for _, stat in self._entries())
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        entries = sorted(self._entries(), key=lambda item: item[1].st_mtime)
+        now = time.time()
+        total = sum(stat.st_size for _, stat in entries)
+        removed = 0
+
+        for path, stat in entries:
+            expired = self.max_age_seconds and now - stat.st_mtime > self.max_age_seconds
+            over_budget = self.max_bytes and total > self.max_bytes
+            if not (expired or over_budget):
+                continue
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            total -= stat.st_size
+            removed += 1
+
+        with self._lock:
+            self._total_bytes = total
+        if removed:
+            self.logger.debug(f"Evicted {removed} entries from {self.root}")
+        return removed
+
+
+class CompletionCache:
+    """On-disk cache of LLM completions shared by the agents"""
+
+    def __init__(self, cache_dir: Optional[str] = None, mode: Optional[str] = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES, max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS):
+        cache_dir = cache_dir or os.environ.get("LLM_CACHE_DIR", DEFAULT_CACHE_DIR)
+        mode = mode or os.environ.get("LLM_CACHE_MODE", "use")
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}, expected one of {CACHE_MODES}")
+
+        self.mode = mode
+        self.store = DiskStore(cache_dir, max_bytes=max_bytes, max_age_seconds=max_age_seconds)
+        self.logger = logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model: str, prompt: str, max_tokens: Optional[int], stop: Optional[List[str]],
+                 temperature: Optional[float] = None) -> str:
+        """Hash everything that influences the completion into a cache key"""
+        request = {
+            'model': model,
+            'prompt': prompt,
+            'max_tokens': max_tokens,
+            'stop': list(stop) if stop else None,
+        }
+        # Only part of the key when set, so entries made at the provider default stay valid
+        if temperature is not None:
+            request['temperature'] = temperature
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _lookup(self, key: str, model: str) -> Optional[Dict]:
+        if self.mode != "use":
+            return None
+        entry = self.store.get(key)
+        if entry is not None:
+            with self._lock:
+                self.hits += 1
+                self.saved_seconds += entry.get('latency', 0.0)
+            self.logger.info(f"LLM cache hit for {model} (key {key[:12]})")
+            tracing.add_counts({'llm.cache_hits': 1})
+        return entry
+
+    def _record(self, key: str, model: str, max_tokens: Optional[int], stop: Optional[List[str]],
+                completion: str, latency: float):
+        if self.mode == "bypass":
+            return
+        self.store.put(key, {
+            'model': model,
+            'max_tokens': max_tokens,
+            'stop': list(stop) if stop else None,
+            'completion': completion,
+            'latency': latency,
+            'created': time.time(),
+        })
+
+    def get_or_compute(self, model: str, prompt: str, max_tokens: Optional[int],
+                       stop: Optional[List[str]], compute: Callable[[], str],
+                       temperature: Optional[float] = None) -> str:
+        """Return a cached completion, calling compute() and storing its result on a miss"""
+        key = self.make_key(model, prompt, max_tokens, stop, temperature)
+        entry = self._lookup(key, model)
+        if entry is not None:
+            return entry['completion']
+
+        with self._lock:
+            self.misses += 1
+        start = time.perf_counter()
+        completion = compute()
+        self._record(key, model, max_tokens, stop, completion, time.perf_counter() - start)
+        return completion
+
+    def stream_or_compute(self, model: str, prompt: str, max_tokens: Optional[int],
+                          stop: Optional[List[str]], open_stream: Callable[[], Iterable[str]],
+                          temperature: Optional[float] = None) -> Iterator[str]:
+        """
+        Streaming counterpart of get_or_compute: yields the cached completion on a hit,
+        otherwise yields deltas from open_stream() as they arrive and stores the
+        joined completion once the stream finishes. Closing the iterator early
+        closes the underlying stream and stores nothing.
+        """
+        key = self.make_key(model, prompt, max_tokens, stop, temperature)
+        entry = self._lookup(key, model)
+        if entry is not None:
+            yield entry['completion']
+            return
+
+        with self._lock:
+            self.misses += 1
+        start = time.perf_counter()
+        keep = self.mode != "bypass"
+        pieces = []
+        stream = open_stream()
+        try:
+            for delta in stream:
+                if keep:
+                    pieces.append(delta)
+                yield delta
+        except GeneratorExit:
+            if hasattr(stream, 'close'):
+                stream.close()
+            raise
+        self._record(key, model, max_tokens, stop, ''.join(pieces), time.perf_counter() - start)
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and the LLM latency avoided by cache hits"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'mode': self.mode,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'saved_seconds': round(self.saved_seconds, 3),
+            }
+
+    def log_stats(self, logger: Optional[logging.Logger] = None):
+        stats = self.stats()
+        (logger or self.logger).info(
+            f"LLM cache ({stats['mode']}): {stats['hits']} hits, {stats['misses']} misses, "
+            f"saved {stats['saved_seconds']:.1f}s of LLM latency"
+        )
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> CompletionCache:
+    """Process-wide cache shared by TestCaseGenerator and FeatureImplementer"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = CompletionCache()
+        return _default_cache
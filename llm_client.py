@@ -0,0 +1,444 @@
+import os
+import json
+import time
+import queue
+import random
+import asyncio
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional
+
+import tracing
+
+if TYPE_CHECKING:
+    import httpx
+
+TOGETHER_API_BASE = "https://api.together.xyz/v1"
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Raised when a completion request fails after all retries"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class Completion:
+    """Text and token usage of a single chat completion"""
+
+    def __init__(self, text: str, model: str, prompt_tokens: int = 0, completion_tokens: int = 0,
+                 finish_reason: Optional[str] = None):
+        self.text = text
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.finish_reason = finish_reason
+
+    def __repr__(self):
+        return (f"Completion(model={self.model!r}, prompt_tokens={self.prompt_tokens}, "
+                f"completion_tokens={self.completion_tokens}, finish_reason={self.finish_reason!r})")
+
+
+class CompletionStream:
+    """
+    Iterator over the text deltas of a streamed completion. Token usage and the
+    finish reason are filled in once the stream is exhausted.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.finish_reason = None
+        self._queue = queue.Queue()
+        self._future = None
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            item = self._queue.get()
+            if item is _END_OF_STREAM:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self):
+        """Abandon the stream and cancel the underlying request"""
+        if self._future is not None:
+            self._future.cancel()
+
+
+class _RetryableError(Exception):
+    def __init__(self, error: LLMError, retry_after: Optional[float] = None):
+        super().__init__(str(error))
+        self.error = error
+        self.retry_after = retry_after
+
+
+_END_OF_STREAM = object()
+
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket limiting request starts. The refill rate is halved whenever the
+    provider throttles us (and paused for Retry-After), then recovers additively
+    on successful requests, up to the configured rate.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, min_rate: float = 0.05):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
+
+    def on_throttle(self, retry_after: Optional[float]):
+        now = time.monotonic()
+        self._refill(now)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMClient:
+    """
+    Shared OpenAI-compatible chat completion client.
+
+    All requests go through one keep-alive connection pool owned by a background
+    event loop, so synchronous callers on any thread and asyncio callers share
+    the same connections, concurrency limit and adaptive rate limiter.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 max_concurrency: Optional[int] = None, requests_per_second: Optional[float] = None,
+                 max_retries: int = 4, timeout: float = 600.0, backoff_base: float = 1.0,
+                 backoff_cap: float = 30.0, transport: Optional['httpx.AsyncBaseTransport'] = None):
+        self.api_key = api_key
+        self.base_url = (base_url or os.environ.get("LLM_API_BASE", TOGETHER_API_BASE)).rstrip('/')
+        self.max_concurrency = max_concurrency or int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+        self.requests_per_second = requests_per_second or float(os.environ.get("LLM_REQUESTS_PER_SECOND", "2"))
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.transport = transport
+        self.logger = logging.getLogger(__name__)
+        self.usage = {'requests': 0, 'retries': 0, 'throttled': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+
+        self._loop = None
+        self._thread = None
+        self._http = None
+        self._semaphore = None
+        self._bucket = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                # httpx is only imported once the first request is made, in the calling
+                # thread so a missing dependency raises here instead of in the loop thread
+                import httpx
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+                startup_error = []
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    try:
+                        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                        self._bucket = AdaptiveTokenBucket(self.requests_per_second)
+                        self._http = httpx.AsyncClient(
+                            timeout=httpx.Timeout(self.timeout, connect=30.0),
+                            limits=httpx.Limits(max_connections=self.max_concurrency,
+                                                max_keepalive_connections=self.max_concurrency),
+                            transport=self.transport,
+                        )
+                    except BaseException as e:
+                        startup_error.append(e)
+                        return
+                    finally:
+                        ready.set()
+                    loop.run_forever()
+
+                thread = threading.Thread(target=run, name="llm-client", daemon=True)
+                thread.start()
+                if not ready.wait(30.0):
+                    raise LLMError("LLM client event loop did not start within 30s")
+                if startup_error:
+                    thread.join()
+                    loop.close()
+                    raise startup_error[0]
+                self._thread = thread
+                self._loop = loop
+            return self._loop
+
+    def _headers(self, api_key: Optional[str]) -> Dict[str, str]:
+        key = api_key or self.api_key or os.environ.get("TOGETHER_API_KEY")
+        headers = {"Content-Type": "application/json"}
+        if key:
+            headers["Authorization"] = f"Bearer {key}"
+        return headers
+
+    def _payload(self, model: str, prompt: str, max_tokens: Optional[int], stop: Optional[List[str]],
+                 temperature: Optional[float]) -> Dict:
+        payload = {"model": model, "messages": [{"role": "user", "content": prompt}]}
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+        if stop:
+            payload["stop"] = list(stop)
+        if temperature is not None:
+            payload["temperature"] = temperature
+        return payload
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        jitter = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+        return max(jitter, retry_after or 0.0)
+
+    async def _with_retries(self, send, span=tracing.NOOP_SPAN):
+        """
+        Run send() under the rate limiter and concurrency limit, retrying transport
+        errors and retryable HTTP statuses. send() raises _RetryableError to ask for a retry.
+        """
+        attempt = 0
+        while True:
+            await self._bucket.acquire()
+            async with self._semaphore:
+                try:
+                    result = await send()
+                except _RetryableError as e:
+                    error, retry_after = e.error, e.retry_after
+                    if error.status_code == 429:
+                        self.usage['throttled'] += 1
+                        self._bucket.on_throttle(retry_after)
+                else:
+                    self._bucket.on_success()
+                    return result
+
+            if attempt >= self.max_retries:
+                raise error
+            delay = self._backoff(attempt, retry_after)
+            attempt += 1
+            self.usage['retries'] += 1
+            span.add('llm.retries')
+            self.logger.warning(f"{str(error)[:200]}; retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _raise_for_status(response: 'httpx.Response', body: str):
+        error = LLMError(
+            f"LLM request failed with HTTP {response.status_code}: {body[:500]}",
+            status_code=response.status_code,
+        )
+        if response.status_code not in RETRYABLE_STATUS:
+            raise error
+        raise _RetryableError(error, _parse_retry_after(response.headers.get("retry-after")))
+
+    async def _post_with_retries(self, payload: Dict, api_key: Optional[str], span=tracing.NOOP_SPAN) -> Dict:
+        import httpx
+        url = f"{self.base_url}/chat/completions"
+        headers = self._headers(api_key)
+
+        async def send():
+            try:
+                response = await self._http.post(url, json=payload, headers=headers)
+            except httpx.TransportError as e:
+                raise _RetryableError(LLMError(f"Transport error calling {url}: {str(e)}"))
+            if response.status_code >= 400:
+                self._raise_for_status(response, response.text)
+            return response.json()
+
+        return await self._with_retries(send, span)
+
+    async def _stream_into(self, payload: Dict, api_key: Optional[str], stream: 'CompletionStream',
+                           span=tracing.NOOP_SPAN):
+        """Stream server-sent events into stream's queue; retries only before the first token"""
+        import httpx
+        url = f"{self.base_url}/chat/completions"
+        headers = self._headers(api_key)
+        payload = dict(payload, stream=True, stream_options={"include_usage": True})
+        started = False
+        span_start = time.time_ns()
+
+        async def send():
+            nonlocal started
+            try:
+                async with self._http.stream("POST", url, json=payload, headers=headers) as response:
+                    if response.status_code >= 400:
+                        body = (await response.aread()).decode('utf-8', errors='replace')
+                        self._raise_for_status(response, body)
+                    async for line in response.aiter_lines():
+                        if not line.startswith('data:'):
+                            continue
+                        data = line[5:].strip()
+                        if data == '[DONE]':
+                            break
+                        event = json.loads(data)
+                        if event.get('usage'):
+                            stream.prompt_tokens = event['usage'].get('prompt_tokens', 0)
+                            stream.completion_tokens = event['usage'].get('completion_tokens', 0)
+                        for choice in event.get('choices') or []:
+                            text = (choice.get('delta') or {}).get('content')
+                            if text:
+                                if not started:
+                                    span.set_attribute('llm.first_token_ms', round((time.time_ns() - span_start) / 1e6))
+                                started = True
+                                stream._queue.put(text)
+                            if choice.get('finish_reason'):
+                                stream.finish_reason = choice['finish_reason']
+            except httpx.TransportError as e:
+                error = LLMError(f"Transport error streaming from {url}: {str(e)}")
+                if started:
+                    raise error
+                raise _RetryableError(error)
+
+        try:
+            await self._with_retries(send, span)
+            self.usage['requests'] += 1
+            self.usage['prompt_tokens'] += stream.prompt_tokens
+            self.usage['completion_tokens'] += stream.completion_tokens
+            span.add('llm.prompt_tokens', stream.prompt_tokens)
+            span.add('llm.completion_tokens', stream.completion_tokens)
+            span.set_attribute('llm.finish_reason', stream.finish_reason or '')
+            stream._queue.put(_END_OF_STREAM)
+        except BaseException as e:
+            span.record_error(e)
+            stream._queue.put(e if isinstance(e, Exception) else LLMError("Stream cancelled"))
+            raise
+        finally:
+            span.end()
+
+    async def _complete(self, model: str, prompt: str, max_tokens: Optional[int], stop: Optional[List[str]],
+                        temperature: Optional[float], api_key: Optional[str], span=tracing.NOOP_SPAN) -> Completion:
+        payload = self._payload(model, prompt, max_tokens, stop, temperature)
+        try:
+            data = await self._post_with_retries(payload, api_key, span)
+            choice = data["choices"][0]
+            usage = data.get("usage") or {}
+            completion = Completion(
+                text=choice["message"]["content"],
+                model=model,
+                prompt_tokens=usage.get("prompt_tokens", 0),
+                completion_tokens=usage.get("completion_tokens", 0),
+                finish_reason=choice.get("finish_reason"),
+            )
+            span.add('llm.prompt_tokens', completion.prompt_tokens)
+            span.add('llm.completion_tokens', completion.completion_tokens)
+            span.set_attribute('llm.finish_reason', completion.finish_reason or '')
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            span.end()
+        self.usage['requests'] += 1
+        self.usage['prompt_tokens'] += completion.prompt_tokens
+        self.usage['completion_tokens'] += completion.completion_tokens
+        return completion
+
+    @staticmethod
+    def _start_span(name: str, model: str, prompt: str, max_tokens: Optional[int], temperature: Optional[float]):
+        """Span for one request, opened in the caller's context so it nests under the caller's stage"""
+        if not tracing.tracing_enabled():
+            return tracing.NOOP_SPAN
+        span = tracing.start_span(name, {'llm.model': model})
+        if max_tokens is not None:
+            span.set_attribute('llm.max_tokens', max_tokens)
+        if temperature is not None:
+            span.set_attribute('llm.temperature', float(temperature))
+        span.add('llm.requests')
+        span.add('llm.prompt_bytes', len(prompt.encode('utf-8')))
+        return span
+
+    def submit(self, model: str, prompt: str, max_tokens: Optional[int] = None, stop: Optional[List[str]] = None,
+               temperature: Optional[float] = None, api_key: Optional[str] = None) -> Future:
+        """Schedule a completion on the shared pool and return a concurrent.futures.Future"""
+        loop = self._ensure_loop()
+        span = self._start_span('llm.complete', model, prompt, max_tokens, temperature)
+        return asyncio.run_coroutine_threadsafe(
+            self._complete(model, prompt, max_tokens, stop, temperature, api_key, span), loop
+        )
+
+    async def acomplete(self, model: str, prompt: str, max_tokens: Optional[int] = None,
+                        stop: Optional[List[str]] = None, temperature: Optional[float] = None,
+                        api_key: Optional[str] = None) -> Completion:
+        """Await a completion from any event loop"""
+        return await asyncio.wrap_future(self.submit(model, prompt, max_tokens, stop, temperature, api_key))
+
+    def complete(self, model: str, prompt: str, max_tokens: Optional[int] = None, stop: Optional[List[str]] = None,
+                 temperature: Optional[float] = None, api_key: Optional[str] = None) -> Completion:
+        """Blocking completion, safe to call from many threads at once"""
+        return self.submit(model, prompt, max_tokens, stop, temperature, api_key).result()
+
+    def stream(self, model: str, prompt: str, max_tokens: Optional[int] = None, stop: Optional[List[str]] = None,
+               temperature: Optional[float] = None, api_key: Optional[str] = None) -> 'CompletionStream':
+        """Start a streamed completion; iterate the result for text deltas as they arrive"""
+        loop = self._ensure_loop()
+        stream = CompletionStream(model)
+        payload = self._payload(model, prompt, max_tokens, stop, temperature)
+        span = self._start_span('llm.stream', model, prompt, max_tokens, temperature)
+        stream._future = asyncio.run_coroutine_threadsafe(self._stream_into(payload, api_key, stream, span), loop)
+        return stream
+
+    def close(self):
+        """Close pooled connections and stop the background loop"""
+        with self._start_lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._http.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client() -> LLMClient:
+    """Process-wide client shared by every LLM call site"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = LLMClient()
+        return _default_client
@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import contextvars
+from pathlib import Path
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import tracing
+
+DEFAULT_CHECKPOINT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "code_generation_agent", "stages")
+
+
+def fingerprint(*parts: Any) -> str:
+    """Stable hash of stage inputs, for use in Stage keys"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def default_checkpoint_path(graph_name: str, *identity: Any) -> Path:
+    """Checkpoint file for a pipeline run identified by e.g. (repo_url, feature_description)"""
+    checkpoint_dir = os.environ.get("STAGE_CHECKPOINT_DIR", DEFAULT_CHECKPOINT_DIR)
+    return Path(checkpoint_dir) / f"{graph_name}-{fingerprint(*identity)[:16]}.json"
+
+
+def load_stage_output(checkpoint_path: Path, stage: str) -> Any:
+    """Checkpointed output of one stage of an earlier run, or None if there is none"""
+    try:
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            return (json.load(f).get(stage) or {}).get('output')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class StopPipeline(Exception):
+    """Raised by a stage to end the run early without treating it as a failure"""
+
+
+class Stage:
+    """
+    One step of a pipeline. fn receives the outputs of deps positionally.
+
+    If key is given it is called with the same inputs and must return a string
+    identifying them; when a checkpoint with the same key exists (and is_valid
+    accepts its output) the stage is skipped and the checkpointed output reused.
+    Checkpointed outputs must be JSON-serializable.
+    """
+
+    def __init__(self, name: str, fn: Callable[..., Any], deps: Sequence[str] = (),
+                 key: Optional[Callable[..., str]] = None, is_valid: Optional[Callable[[Any], bool]] = None):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.key = key
+        self.is_valid = is_valid
+
+
+class StageGraph:
+    """Runs stages in dependency order, running independent stages concurrently"""
+
+    def __init__(self, name: str, checkpoint_path: Optional[Path] = None, max_workers: int = 4):
+        self.name = name
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path else None
+        self.max_workers = max_workers
+        self.stages: Dict[str, Stage] = {}
+        self.timings: Dict[str, float] = {}
+        self.skipped: List[str] = []
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._checkpoints: Dict[str, Dict] = {}
+
+    def add(self, name: str, fn: Callable[..., Any], deps: Sequence[str] = (),
+            key: Optional[Callable[..., str]] = None, is_valid: Optional[Callable[[Any], bool]] = None) -> Stage:
+        """Register a stage; its dependencies must already be registered"""
+        missing = [dep for dep in deps if dep not in self.stages]
+        if missing:
+            raise ValueError(f"Stage {name!r} depends on unknown stages {missing}")
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage {name!r}")
+        stage = Stage(name, fn, deps, key, is_valid)
+        self.stages[name] = stage
+        return stage
+
+    def _load_checkpoints(self):
+        self._checkpoints = {}
+        if not self.checkpoint_path:
+            return
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                self._checkpoints = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable checkpoints {self.checkpoint_path}: {str(e)}")
+
+    def _save_checkpoint(self, name: str, key: str, output: Any):
+        if not self.checkpoint_path:
+            return
+        with self._lock:
+            self._checkpoints[name] = {'key': key, 'output': output, 'duration': self.timings.get(name)}
+            self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.checkpoint_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._checkpoints, f)
+            os.replace(tmp_path, self.checkpoint_path)
+
+    def _run_stage(self, stage: Stage, inputs: List[Any]) -> Any:
+        with tracing.span(f"stage.{stage.name}", {'stage.name': stage.name}) as span:
+            key = stage.key(*inputs) if stage.key else None
+            if key is not None:
+                checkpoint = self._checkpoints.get(stage.name)
+                if checkpoint and checkpoint.get('key') == key and (
+                        stage.is_valid is None or stage.is_valid(checkpoint['output'])):
+                    self.logger.info(f"Skipping stage {stage.name}: inputs unchanged since last run")
+                    span.set_attribute('stage.skipped', True)
+                    with self._lock:
+                        self.timings[stage.name] = 0.0
+                        self.skipped.append(stage.name)
+                    return checkpoint['output']
+
+            self.logger.info(f"Starting stage {stage.name}")
+            start = time.perf_counter()
+            output = stage.fn(*inputs)
+            with self._lock:
+                self.timings[stage.name] = time.perf_counter() - start
+            self.logger.info(f"Completed stage {stage.name} in {self.timings[stage.name]:.2f}s")
+            if key is not None:
+                self._save_checkpoint(stage.name, key, output)
+            return output
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Execute every stage and return their outputs by name. If a stage raises
+        StopPipeline, no further stages are started and the outputs so far are returned.
+        """
+        self._load_checkpoints()
+        self.timings = {}
+        self.skipped = []
+        results: Dict[str, Any] = {}
+        pending = dict(self.stages)
+        running = {}
+
+        with tracing.span(self.name, {'pipeline.name': self.name, 'pipeline.stages': len(self.stages)}) as span, \
+                ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name) as pool:
+            try:
+                while pending or running:
+                    ready = [name for name, stage in pending.items() if all(d in results for d in stage.deps)]
+                    for name in ready:
+                        stage = pending.pop(name)
+                        inputs = [results[dep] for dep in stage.deps]
+                        # Run in a copy of this context so the stage's span is a child of the pipeline's
+                        running[pool.submit(contextvars.copy_context().run, self._run_stage, stage, inputs)] = name
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        results[name] = future.result()
+            except StopPipeline as e:
+                self.logger.warning(f"Stopping {self.name} early: {str(e)}")
+                span.set_attribute('pipeline.stopped', str(e))
+                for future in running:
+                    future.cancel()
+            except BaseException:
+                for future in running:
+                    future.cancel()
+                raise
+        return results
+
+    def log_timings(self, logger: Optional[logging.Logger] = None):
+        """Log one line with the wall time of every stage that ran"""
+        parts = []
+        for name in self.stages:
+            if name in self.timings:
+                suffix = " (skipped)" if name in self.skipped else ""
+                parts.append(f"{name}={self.timings[name]:.2f}s{suffix}")
+        (logger or self.logger).info(f"Stage timings for {self.name}: {', '.join(parts)}")
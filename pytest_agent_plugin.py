@@ -0,0 +1,223 @@
+"""
+pytest plugin loaded into the test subprocesses started by test_runner.
+
+Appends a JSON line per finished test to --agent-report (so results survive a
+test that kills the process) and enforces a per-test timeout (--agent-timeout)
+using SIGALRM where available. With --agent-coverage each result also lists
+the repository lines the test executed during setup, call and teardown.
+With --agent-collect the node ids of the collected tests are written to that
+path as a JSON list, exactly as pytest reports them.
+"""
+import sys
+import json
+import signal
+import threading
+from pathlib import Path
+
+import pytest
+
+# Repository frames kept per failure, innermost last
+MAX_FRAMES = 8
+
+
+class AgentTestTimeout(BaseException):
+    """Raised inside a test that exceeded --agent-timeout (BaseException so tests cannot swallow it)"""
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("code-agent")
+    group.addoption("--agent-report", default=None, help="Write per-test results as JSON to this path")
+    group.addoption("--agent-timeout", type=float, default=0.0, help="Per-test timeout in seconds (0 disables)")
+    group.addoption("--agent-coverage", action="store_true", default=False,
+                    help="Record the repository lines each test executes in its result")
+    group.addoption("--agent-collect", default=None, help="Write the collected node ids as JSON to this path")
+
+
+def _is_repo_path(rel):
+    return not any(part in ('site-packages', 'dist-packages') or part.startswith('.') for part in rel.parts)
+
+
+def _repo_frames(excinfo, rootpath, limit=MAX_FRAMES):
+    """The innermost traceback frames that belong to the repository under test"""
+    frames = []
+    for entry in excinfo.traceback:
+        path = Path(str(entry.path))
+        try:
+            rel = path.resolve().relative_to(Path(rootpath).resolve())
+        except ValueError:
+            continue
+        if not _is_repo_path(rel):
+            continue
+        try:
+            code = str(entry.statement).strip().splitlines()[0][:200]
+        except (IndexError, OSError, SyntaxError):
+            code = ''
+        frames.append({'path': rel.as_posix(), 'line': entry.lineno + 1, 'function': entry.name, 'code': code})
+    return frames[-limit:]
+
+
+class LineRecorder:
+    """sys.settrace based record of the lines executed in files under rootpath"""
+
+    def __init__(self, rootpath):
+        self.root = Path(rootpath).resolve()
+        self.lines = {}
+        # co_filename -> repository-relative path, or None for files outside it
+        self._paths = {}
+
+    def _rel_path(self, filename):
+        if filename not in self._paths:
+            rel = None
+            if not filename.startswith('<'):
+                try:
+                    candidate = Path(filename).resolve().relative_to(self.root)
+                    rel = candidate.as_posix() if _is_repo_path(candidate) else None
+                except (ValueError, OSError):
+                    pass
+            self._paths[filename] = rel
+        return self._paths[filename]
+
+    def _trace(self, frame, event, arg):
+        rel = self._rel_path(frame.f_code.co_filename)
+        if rel is None:
+            return None
+        lines = self.lines.setdefault(rel, set())
+        lines.add(frame.f_lineno)
+
+        def trace_lines(frame, event, arg):
+            if event == 'line':
+                lines.add(frame.f_lineno)
+            return trace_lines
+        return trace_lines
+
+    def start(self):
+        self.lines = {}
+        threading.settrace(self._trace)
+        sys.settrace(self._trace)
+
+    def stop(self):
+        sys.settrace(None)
+        threading.settrace(None)
+        return {path: sorted(lines) for path, lines in sorted(self.lines.items())}
+
+
+class AgentReporter:
+    def __init__(self, report_path, timeout, rootpath=None, coverage=False):
+        self.report_path = report_path
+        self.timeout = timeout
+        self.results = {}
+        self.details = {}
+        self.recorder = LineRecorder(rootpath) if coverage else None
+        self._file = open(report_path, 'a', encoding='utf-8') if report_path else None
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        timed = self.timeout and hasattr(signal, 'SIGALRM')
+        if timed:
+            def on_timeout(signum, frame):
+                raise AgentTestTimeout(f"Test exceeded the {self.timeout:g}s timeout")
+
+            previous = signal.signal(signal.SIGALRM, on_timeout)
+            signal.setitimer(signal.ITIMER_REAL, self.timeout)
+        if self.recorder is not None:
+            self.recorder.start()
+        try:
+            yield
+        finally:
+            if self.recorder is not None:
+                # Normally stopped by pytest_runtest_logfinish already
+                sys.settrace(None)
+                threading.settrace(None)
+            if timed:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, previous)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+        report = outcome.get_result()
+        if call.excinfo is not None and report.failed and item.nodeid not in self.details:
+            self.details[item.nodeid] = {
+                'exception': call.excinfo.typename,
+                'frames': _repo_frames(call.excinfo, item.config.rootpath),
+            }
+
+    def _write(self, record):
+        if self._file is not None:
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+
+    def _entry(self, nodeid):
+        return self.results.setdefault(nodeid, {
+            'nodeid': nodeid, 'outcome': 'passed', 'duration': 0.0, 'when': None,
+            'message': None, 'longrepr': None, 'exception': None, 'frames': [],
+        })
+
+    def pytest_runtest_logreport(self, report):
+        entry = self._entry(report.nodeid)
+        entry['duration'] += report.duration
+        if report.failed:
+            crash = getattr(report.longrepr, 'reprcrash', None)
+            if crash is not None:
+                message = crash.message
+            else:
+                lines = report.longreprtext.strip().splitlines()
+                message = lines[-1] if lines else None
+            if entry['outcome'] in ('passed', 'skipped'):
+                if 'AgentTestTimeout' in (message or ''):
+                    entry['outcome'] = 'timeout'
+                else:
+                    entry['outcome'] = 'failed' if report.when == 'call' else 'error'
+                entry['when'] = report.when
+                entry['message'] = message
+                entry['longrepr'] = report.longreprtext
+                entry.update(self.details.get(report.nodeid, {}))
+        elif report.skipped and entry['outcome'] == 'passed':
+            entry['outcome'] = 'skipped'
+            if isinstance(report.longrepr, tuple) and len(report.longrepr) == 3:
+                entry['message'] = report.longrepr[2]
+
+    def pytest_runtest_logfinish(self, nodeid, location):
+        if self.recorder is not None:
+            coverage = self.recorder.stop()
+            if nodeid in self.results:
+                self.results[nodeid]['coverage'] = coverage
+        if nodeid in self.results:
+            self._write(self.results[nodeid])
+
+    def pytest_collectreport(self, report):
+        if report.failed:
+            entry = self._entry(report.nodeid or 'collection')
+            entry['outcome'] = 'error'
+            entry['when'] = 'collect'
+            entry['longrepr'] = report.longreprtext
+            entry['message'] = report.longreprtext.strip().splitlines()[-1] if report.longreprtext.strip() else None
+            self._write(entry)
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        if self._file is not None:
+            self._write({'exitstatus': int(exitstatus)})
+            self._file.close()
+            self._file = None
+
+
+class AgentCollector:
+    def __init__(self, collect_path):
+        self.collect_path = collect_path
+
+    def pytest_collection_finish(self, session):
+        with open(self.collect_path, 'w', encoding='utf-8') as f:
+            json.dump([item.nodeid for item in session.items], f)
+
+
+def pytest_configure(config):
+    report_path = config.getoption("--agent-report")
+    timeout = config.getoption("--agent-timeout")
+    coverage = config.getoption("--agent-coverage")
+    if report_path or timeout or coverage:
+        config.pluginmanager.register(
+            AgentReporter(report_path, timeout, config.rootpath, coverage), "code-agent-reporter"
+        )
+    collect_path = config.getoption("--agent-collect")
+    if collect_path:
+        config.pluginmanager.register(AgentCollector(collect_path), "code-agent-collector")
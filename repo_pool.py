@@ -0,0 +1,300 @@
+import os
+import re
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    import git
+
+DEFAULT_POOL_DIR = os.path.join(os.path.expanduser("~"), ".cache", "code_generation_agent", "repos")
+DEFAULT_FETCH_INTERVAL = 60.0
+DEFAULT_MAX_IDLE_SECONDS = 3 * 24 * 3600
+DEFAULT_MAX_WORKTREES = 8
+# Untracked state that survives a worktree being reset for the next job
+KEEP_ON_RESET = '.code_agent'
+
+
+def _repo_key(repo_url: str) -> str:
+    """Readable, collision-free directory name for a repository URL"""
+    name = re.sub(r'[^A-Za-z0-9_.-]', '_', repo_url.rstrip('/').split('/')[-1]) or 'repo'
+    if name.endswith('.git'):
+        name = name[:-4]
+    return f"{name}-{hashlib.sha256(repo_url.encode('utf-8')).hexdigest()[:12]}"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WorktreeLease:
+    """A worktree checked out for one job. Release it to return it to the pool"""
+
+    def __init__(self, pool: 'RepoPool', repo_url: str, path: Path, commit: str):
+        self.pool = pool
+        self.repo_url = repo_url
+        self.path = path
+        self.commit = commit
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.pool.release(self)
+            self.released = True
+
+    def __enter__(self) -> 'WorktreeLease':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+    def __repr__(self):
+        return f"WorktreeLease({str(self.path)!r}, commit={self.commit[:12]})"
+
+
+class RepoPool:
+    """
+    Local bare mirror per repository URL, fetched incrementally, plus a pool of
+    detached worktrees on top of it that jobs lease and return.
+
+    Released worktrees are reset and reused by the next lease for the same URL.
+    A worktree whose owning process died is left alone (a later process may
+    still need its generated files) until it has been idle for max_idle_seconds,
+    after which gc() removes it along with any released worktrees above
+    max_worktrees per repository.
+    """
+
+    def __init__(self, root: Optional[str] = None, fetch_interval: float = DEFAULT_FETCH_INTERVAL,
+                 max_idle_seconds: float = DEFAULT_MAX_IDLE_SECONDS, max_worktrees: int = DEFAULT_MAX_WORKTREES):
+        self.root = Path(root or os.environ.get("REPO_POOL_DIR", DEFAULT_POOL_DIR))
+        self.fetch_interval = fetch_interval
+        self.max_idle_seconds = max_idle_seconds
+        self.max_worktrees = max_worktrees
+        self.logger = logging.getLogger(__name__)
+        self._thread_locks: Dict[str, threading.Lock] = {}
+        self._thread_locks_lock = threading.Lock()
+
+    def mirror_path(self, repo_url: str) -> Path:
+        return self.root / 'mirrors' / f"{_repo_key(repo_url)}.git"
+
+    def _worktree_dir(self, repo_url: str) -> Path:
+        return self.root / 'worktrees' / _repo_key(repo_url)
+
+    @contextmanager
+    def _locked(self, repo_url: str) -> Iterator[None]:
+        """Serialize mirror and pool bookkeeping for one URL across threads and processes"""
+        key = _repo_key(repo_url)
+        with self._thread_locks_lock:
+            thread_lock = self._thread_locks.setdefault(key, threading.Lock())
+        lock_path = self.root / 'locks' / f"{key}.lock"
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with thread_lock, open(lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _ensure_mirror(self, repo_url: str) -> 'git.Repo':
+        """Create or incrementally update the bare mirror; caller holds the URL lock"""
+        # GitPython is slow to import, so only pay for it once a checkout is needed
+        import git
+        mirror_path = self.mirror_path(repo_url)
+        stamp = mirror_path / 'agent_last_fetch'
+        if not mirror_path.exists():
+            self.logger.info(f"Creating mirror of {repo_url} in {mirror_path}")
+            mirror_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = mirror_path.with_name(f"{mirror_path.name}.{os.getpid()}.tmp")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            git.Repo.clone_from(repo_url, tmp_path, mirror=True)
+            os.replace(tmp_path, mirror_path)
+            stamp.touch()
+            return git.Repo(mirror_path)
+
+        mirror = git.Repo(mirror_path)
+        try:
+            fresh = time.time() - stamp.stat().st_mtime < self.fetch_interval
+        except FileNotFoundError:
+            fresh = False
+        if not fresh:
+            start = time.perf_counter()
+            mirror.git.remote('update', '--prune')
+            stamp.touch()
+            self.logger.info(f"Fetched {repo_url} into mirror in {time.perf_counter() - start:.2f}s")
+        return mirror
+
+    def _read_meta(self, meta_path: Path) -> Optional[Dict]:
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, meta_path: Path, meta: Dict):
+        tmp_path = meta_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def _worktrees(self, repo_url: str) -> List[Dict]:
+        """Bookkeeping of every pooled worktree for a URL, with 'meta_path' added"""
+        entries = []
+        for meta_path in sorted(self._worktree_dir(repo_url).glob('wt-*.json')):
+            meta = self._read_meta(meta_path)
+            if meta is not None:
+                meta['meta_path'] = str(meta_path)
+                entries.append(meta)
+        return entries
+
+    def _is_leased(self, meta: Dict) -> bool:
+        return meta.get('state') == 'leased' and _pid_alive(meta.get('pid', -1))
+
+    def lease(self, repo_url: str, ref: Optional[str] = None) -> WorktreeLease:
+        """Check out ref (default: the remote's HEAD) in a pooled worktree and lease it"""
+        start = time.perf_counter()
+        with self._locked(repo_url):
+            mirror = self._ensure_mirror(repo_url)
+            commit = mirror.git.rev_parse(f"{ref or 'HEAD'}^{{commit}}")
+            self._gc_locked(repo_url, mirror)
+
+            candidate = None
+            for meta in self._worktrees(repo_url):
+                if meta.get('state') == 'idle' and Path(meta['path']).exists():
+                    # The most recently used one has the warmest caches (index, test worker)
+                    if candidate is None or meta.get('released_at', 0) > candidate.get('released_at', 0):
+                        candidate = meta
+
+            if candidate is not None:
+                path = Path(candidate['path'])
+                meta_path = Path(candidate['meta_path'])
+                reused = True
+            else:
+                worktree_dir = self._worktree_dir(repo_url)
+                worktree_dir.mkdir(parents=True, exist_ok=True)
+                index = 0
+                while (worktree_dir / f"wt-{index}").exists() or (worktree_dir / f"wt-{index}.json").exists():
+                    index += 1
+                path = worktree_dir / f"wt-{index}"
+                meta_path = worktree_dir / f"wt-{index}.json"
+                mirror.git.worktree('add', '--detach', str(path), commit)
+                reused = False
+
+            self._write_meta(meta_path, {
+                'repo_url': repo_url, 'path': str(path), 'commit': commit, 'state': 'leased',
+                'pid': os.getpid(), 'leased_at': time.time(),
+            })
+
+        if reused:
+            import git
+            # The worktree is ours now, so resetting it does not need the pool lock
+            worktree = git.Repo(path)
+            worktree.git.checkout('--detach', '--force', commit)
+            worktree.git.clean('-ffdx', '-e', KEEP_ON_RESET)
+        self.logger.info(
+            f"Leased {'reused' if reused else 'new'} worktree {path} at {commit[:12]} "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+        return WorktreeLease(self, repo_url, path, commit)
+
+    def release(self, lease: WorktreeLease):
+        """Return a worktree to the pool; its files stay until the next lease resets them"""
+        with self._locked(lease.repo_url):
+            for meta in self._worktrees(lease.repo_url):
+                if meta['path'] == str(lease.path):
+                    meta_path = Path(meta.pop('meta_path'))
+                    meta.update(state='idle', pid=None, released_at=time.time())
+                    self._write_meta(meta_path, meta)
+        self.logger.info(f"Released worktree {lease.path}")
+
+    def worktree_paths(self, repo_url: str) -> List[Path]:
+        """Every pooled worktree for a URL, leased or not"""
+        return [Path(meta['path']) for meta in self._worktrees(repo_url) if Path(meta['path']).exists()]
+
+    def latest(self, repo_url: str) -> Optional[Path]:
+        """
+        Most recently leased worktree for a URL that still exists and is not leased
+        right now. A later lease may have reset it, so prefer passing the checkout on
+        explicitly (see FeatureImplementer.generator_checkout).
+        """
+        entries = [meta for meta in self._worktrees(repo_url)
+                   if Path(meta['path']).exists() and not self._is_leased(meta)]
+        if not entries:
+            return None
+        return Path(max(entries, key=lambda meta: meta.get('leased_at', 0))['path'])
+
+    def _remove_worktree(self, mirror: 'git.Repo', meta: Dict):
+        import git
+        path = Path(meta['path'])
+        try:
+            mirror.git.worktree('remove', '--force', str(path))
+        except git.GitCommandError:
+            shutil.rmtree(path, ignore_errors=True)
+        try:
+            os.remove(meta['meta_path'])
+        except OSError:
+            pass
+        self.logger.info(f"Removed pooled worktree {path}")
+
+    def _gc_locked(self, repo_url: str, mirror: 'git.Repo') -> int:
+        now = time.time()
+        removed = 0
+        keep = []
+        for meta in self._worktrees(repo_url):
+            if self._is_leased(meta):
+                continue
+            last_used = max(meta.get('leased_at', 0), meta.get('released_at') or 0)
+            if not Path(meta['path']).exists() or now - last_used > self.max_idle_seconds:
+                self._remove_worktree(mirror, meta)
+                removed += 1
+            elif meta.get('state') == 'idle':
+                keep.append(meta)
+        # Cap the released worktrees kept around for reuse, dropping the least recently used
+        keep.sort(key=lambda meta: meta.get('released_at') or 0)
+        for meta in keep[:max(0, len(keep) - self.max_worktrees)]:
+            self._remove_worktree(mirror, meta)
+            removed += 1
+        mirror.git.worktree('prune')
+        return removed
+
+    def gc(self, repo_url: Optional[str] = None) -> int:
+        """Remove stale worktrees for one URL (or every mirrored URL); returns how many were removed"""
+        urls = [repo_url] if repo_url else []
+        if not repo_url:
+            for meta_path in (self.root / 'worktrees').glob('*/wt-*.json'):
+                meta = self._read_meta(meta_path)
+                if meta and meta.get('repo_url') not in urls:
+                    urls.append(meta['repo_url'])
+        removed = 0
+        for url in urls:
+            import git
+            if not self.mirror_path(url).exists():
+                continue
+            with self._locked(url):
+                removed += self._gc_locked(url, git.Repo(self.mirror_path(url)))
+        return removed
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_repo_pool() -> RepoPool:
+    """Process-wide pool shared by both agents"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = RepoPool()
+        return _default_pool
@@ -0,0 +1,265 @@
+import shutil
+import logging
+import tempfile
+import threading
+import contextvars
+from pathlib import Path
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import tracing
+from codebase_index import STATE_DIR_NAME
+from code_blocks import CodeBlockStreamParser
+from edit_blocks import write_files
+from test_runner import DEFAULT_TEST_TIMEOUT, ShardedTestRunner, TestReport, available_cores
+from test_summary import DEFAULT_DIGEST_TOKENS, summarize_failures
+from test_worker import RunCancelled, WarmTestWorker
+from static_check import StaticChecker, blocking_issues, format_issues
+from test_impact import TestImpactMap
+
+# Every candidate samples at its own (temperature, prompt variant) pair, see candidate_settings
+TEMPERATURES = (0.2, 0.6, 1.0)
+PROMPT_VARIANTS = (
+    "",
+    "\nMake the smallest change that makes the failing tests pass; do not refactor unrelated code.\n",
+    "\nBefore answering, check every test case against your implementation, including edge cases.\n",
+)
+# More candidates would repeat a pair, hit the same completion cache entry and add nothing
+MAX_CANDIDATES = len(TEMPERATURES) * len(PROMPT_VARIANTS)
+COPY_IGNORE = shutil.ignore_patterns('.git', STATE_DIR_NAME, '__pycache__', '.pytest_cache')
+
+
+def candidate_settings(index: int) -> Tuple[float, int]:
+    """
+    Temperature and prompt variant of candidate index: the first three pair them
+    up diagonally, later ones shift the variant so no pair repeats up to MAX_CANDIDATES
+    """
+    temperature = index % len(TEMPERATURES)
+    variant = (index + index // len(TEMPERATURES)) % len(PROMPT_VARIANTS)
+    return TEMPERATURES[temperature], variant
+
+
+def parse_code_blocks(text: str) -> Dict[str, str]:
+    """Files in a response, from its ```python:path blocks (later blocks win)"""
+    files = {}
+
+    def on_block(path: Optional[str], content: str):
+        if path:
+            files[path] = content
+
+    parser = CodeBlockStreamParser(on_block)
+    parser.feed(text)
+    parser.close()
+    return files
+
+
+def format_code_blocks(files: Dict[str, str]) -> str:
+    """Inverse of parse_code_blocks"""
+    return ''.join(f"```python:{path}\n{content}\n```\n" for path, content in files.items())
+
+
+def repair_prompt(prompt: str, files: Dict[str, str], digest: str) -> str:
+    return f"""{prompt}
+
+A previous attempt produced these files:
+{format_code_blocks(files)}
+Running the test cases against it gave:
+```
+{digest}
+```
+Fix the implementation so that every test passes. Reply with the complete corrected code of each
+file you change, in the same format as before.
+"""
+
+
+class Candidate:
+    """One speculative implementation and the result of testing it"""
+
+    def __init__(self, index: int, temperature: float, variant: int):
+        self.index = index
+        self.temperature = temperature
+        self.variant = variant
+        self.files: Dict[str, str] = {}
+        self.report: Optional[TestReport] = None
+        self.attempts = 0
+        self.cancelled = False
+        self.error: Optional[str] = None
+
+    @property
+    def passed(self) -> bool:
+        return self.report is not None and self.report.passed
+
+    def to_dict(self) -> Dict:
+        return {
+            'index': self.index,
+            'temperature': self.temperature,
+            'variant': self.variant,
+            'attempts': self.attempts,
+            'passed': self.passed,
+            'cancelled': self.cancelled,
+            'error': self.error,
+            'tests': self.report.counts if self.report else None,
+            'files': sorted(self.files),
+        }
+
+
+class SpeculativeSearch:
+    """
+    Generates several implementation candidates concurrently (at most
+    MAX_CANDIDATES), each at its own temperature and prompt variant, and
+    validates each one in a scratch copy of
+    the checkout by running the test file against it (unless the static checker
+    rejects it first). A failing candidate gets up to max_repairs follow-up
+    attempts with its failure digest or static issues. The first
+    candidate whose tests all pass wins and the others are cancelled: their
+    streams are closed and their test runs killed.
+
+    generate(prompt, temperature) must return an iterator of response deltas
+    whose close() abandons the request.
+    """
+
+    def __init__(self, repo_path: Path, test_file: str, generate: Callable[[str, float], Iterable[str]],
+                 candidates: int = 3, max_repairs: int = 1, test_timeout: float = DEFAULT_TEST_TIMEOUT,
+                 worker: Optional[WarmTestWorker] = None, digest_tokens: int = DEFAULT_DIGEST_TOKENS,
+                 checker: Optional[StaticChecker] = None, impact: Optional[TestImpactMap] = None):
+        self.repo_path = Path(repo_path).resolve()
+        self.test_file = test_file
+        self.generate = generate
+        self.max_repairs = max_repairs
+        self.test_timeout = test_timeout
+        self.worker = worker
+        self.digest_tokens = digest_tokens
+        self.checker = checker
+        # Coverage map of the original checkout; candidates only re-run the tests their changes
+        # affect, and record their own coverage in a fork of it that goes away with their copy
+        self.impact = impact
+        self.logger = logging.getLogger(__name__)
+        if candidates > MAX_CANDIDATES:
+            self.logger.warning(f"Capping {candidates} candidates at {MAX_CANDIDATES}, the number of distinct "
+                                f"temperature and prompt variant pairs")
+            candidates = MAX_CANDIDATES
+        self.candidates = [Candidate(i, *candidate_settings(i)) for i in range(candidates)]
+        self.winner: Optional[Candidate] = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def _collect(self, deltas: Iterable[str]) -> Optional[str]:
+        """Join a streamed response; None if another candidate won meanwhile"""
+        pieces = []
+        for delta in deltas:
+            if self._done.is_set():
+                if hasattr(deltas, 'close'):
+                    deltas.close()
+                return None
+            pieces.append(delta)
+        return ''.join(pieces)
+
+    def _traced_attempt(self, candidate: Candidate, prompt: str) -> Candidate:
+        with tracing.span(f"candidate.{candidate.index}", {
+            'candidate.temperature': candidate.temperature, 'candidate.variant': candidate.variant,
+        }) as span:
+            self._attempt(candidate, prompt)
+            span.set_attributes({'candidate.attempts': candidate.attempts, 'candidate.passed': candidate.passed,
+                                 'candidate.cancelled': candidate.cancelled})
+            return candidate
+
+    def _attempt(self, candidate: Candidate, prompt: str) -> Candidate:
+        scratch = Path(tempfile.mkdtemp(prefix=f"agent-candidate-{candidate.index}-"))
+        work_dir = scratch / self.repo_path.name
+        try:
+            shutil.copytree(self.repo_path, work_dir, ignore=COPY_IGNORE, symlinks=True)
+            base_prompt = prompt + PROMPT_VARIANTS[candidate.variant]
+            current_prompt = base_prompt
+            workers = max(1, available_cores() // len(self.candidates))
+            impact = self.impact.fork(work_dir) if self.impact is not None else None
+
+            for attempt in range(1 + self.max_repairs):
+                if self._done.is_set():
+                    candidate.cancelled = True
+                    return candidate
+                text = self._collect(self.generate(current_prompt, candidate.temperature))
+                if text is None:
+                    candidate.cancelled = True
+                    return candidate
+                candidate.attempts += 1
+
+                files = parse_code_blocks(text)
+                # Repairs may only resend the files they change
+                candidate.files.update(files)
+                write_files(work_dir, files)
+                if self._done.is_set():
+                    candidate.cancelled = True
+                    return candidate
+                issues = blocking_issues(self.checker.check_files(candidate.files)) if self.checker and files else []
+                if issues:
+                    # Rejected without a test run; the issues are the repair feedback
+                    self.logger.info(f"Candidate {candidate.index} attempt {attempt + 1} failed the static check")
+                    candidate.report = None
+                    current_prompt = repair_prompt(base_prompt, candidate.files, format_issues(issues))
+                    continue
+                candidate.report = ShardedTestRunner(
+                    work_dir, workers=workers, per_test_timeout=self.test_timeout, worker=self.worker,
+                    cancel=self._done, impact=impact
+                ).run(work_dir / self.test_file)
+                self.logger.info(
+                    f"Candidate {candidate.index} (temperature {candidate.temperature}, variant {candidate.variant}) "
+                    f"attempt {attempt + 1}: {candidate.report.summary()}"
+                )
+                if candidate.passed:
+                    with self._lock:
+                        if self.winner is None:
+                            self.winner = candidate
+                            self._done.set()
+                    return candidate
+                digest = summarize_failures(candidate.report, self.digest_tokens) if files else \
+                    "No ```python:path code blocks were found in the response."
+                current_prompt = repair_prompt(base_prompt, candidate.files, digest)
+            return candidate
+        except RunCancelled:
+            candidate.cancelled = True
+            return candidate
+        except Exception as e:
+            candidate.error = f"{type(e).__name__}: {str(e)}"
+            self.logger.warning(f"Candidate {candidate.index} failed: {candidate.error}")
+            return candidate
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    def _best(self) -> Optional[Candidate]:
+        """Winner, or else the candidate with the most passing tests"""
+        if self.winner is not None:
+            return self.winner
+        finished = [c for c in self.candidates if c.files and c.report is not None]
+        if not finished:
+            return next((c for c in self.candidates if c.files), None)
+        return max(finished, key=lambda c: (c.report.counts['passed'], -c.index))
+
+    def run(self, prompt: str) -> Optional[Candidate]:
+        """
+        Run all candidates and return the first to pass, or the best one if none
+        did (None if no candidate produced any files). Returns as soon as there
+        is a winner; the losers wind down and clean up in the background.
+        """
+        self.logger.info(f"Generating {len(self.candidates)} candidates with up to {self.max_repairs} repairs each")
+        pool = ThreadPoolExecutor(max_workers=len(self.candidates), thread_name_prefix='candidate')
+        futures = {}
+        try:
+            futures = {
+                pool.submit(contextvars.copy_context().run, self._traced_attempt, candidate, prompt): candidate
+                for candidate in self.candidates
+            }
+            running = set(futures)
+            while running and not self._done.is_set():
+                _, running = wait(running, return_when=FIRST_COMPLETED)
+        finally:
+            pool.shutdown(wait=not self._done.is_set(), cancel_futures=True)
+        for future, candidate in futures.items():
+            if not future.done():
+                candidate.cancelled = True
+
+        best = self._best()
+        if self.winner is not None:
+            self.logger.info(f"Candidate {self.winner.index} passed all tests after {self.winner.attempts} attempt(s)")
+        elif best is not None:
+            self.logger.warning(f"No candidate passed; keeping candidate {best.index} ({best.report.summary() if best.report else 'untested'})")
+        return best
@@ -0,0 +1,256 @@
+import os
+import sys
+import ast
+import time
+import builtins
+import logging
+import importlib.machinery
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterable, List, Mapping, Optional, Set
+
+from codebase_index import get_codebase_index
+from context_selector import ContextSelector
+
+MAX_REPORTED_ISSUES = 20
+# Names every module has without binding them
+MODULE_NAMES = {'__name__', '__file__', '__doc__', '__package__', '__spec__', '__loader__',
+                '__builtins__', '__path__', '__annotations__', '__dict__', '__cached__'}
+# Handlers that make an import inside their try block optional
+_OPTIONAL_IMPORT_ERRORS = {'ImportError', 'ModuleNotFoundError', 'Exception', 'BaseException'}
+_AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Kinds that are reported but do not reject a file: tests written ahead of the
+# feature legitimately import modules the implementation has yet to create
+WARNING_KINDS = {'import'}
+
+
+class StaticIssue:
+    """One problem found without running the code"""
+
+    def __init__(self, path: str, line: int, column: int, kind: str, message: str, severity: Optional[str] = None):
+        self.path = path
+        self.line = line
+        self.column = column
+        # 'syntax', 'import' or 'undefined-name'
+        self.kind = kind
+        self.message = message
+        # 'error' rejects the file, 'warning' is only reported
+        self.severity = severity or ('warning' if kind in WARNING_KINDS else 'error')
+
+    @property
+    def blocking(self) -> bool:
+        return self.severity == 'error'
+
+    def format(self) -> str:
+        label = self.kind if self.blocking else f"{self.kind} {self.severity}"
+        return f"{self.path}:{self.line}:{self.column}: [{label}] {self.message}"
+
+    def to_dict(self) -> Dict:
+        return {'path': self.path, 'line': self.line, 'column': self.column, 'kind': self.kind, 'message': self.message,
+                'severity': self.severity}
+
+    def __repr__(self):
+        return f"StaticIssue({self.format()!r})"
+
+
+def blocking_issues(issues: Iterable[StaticIssue]) -> List[StaticIssue]:
+    """The issues that should stop a file from being run"""
+    return [issue for issue in issues if issue.blocking]
+
+
+def format_issues(issues: List[StaticIssue], max_issues: int = MAX_REPORTED_ISSUES) -> str:
+    """Issues as prompt feedback, one per line"""
+    lines = [f"Static check found {len(issues)} problem(s) before running the tests:"]
+    lines.extend(issue.format() for issue in issues[:max_issues])
+    if len(issues) > max_issues:
+        lines.append(f"... {len(issues) - max_issues} more")
+    return '\n'.join(lines)
+
+
+def _is_optional_import(handlers: List[ast.ExceptHandler]) -> bool:
+    for handler in handlers:
+        if handler.type is None:
+            return True
+        types = handler.type.elts if isinstance(handler.type, ast.Tuple) else [handler.type]
+        for node in types:
+            name = node.attr if isinstance(node, ast.Attribute) else getattr(node, 'id', None)
+            if name in _OPTIONAL_IMPORT_ERRORS:
+                return True
+    return False
+
+
+class _ImportCollector(ast.NodeVisitor):
+    """Imports that must resolve: not inside try/except ImportError or an `if TYPE_CHECKING` block"""
+
+    def __init__(self):
+        self.imports: List[ast.AST] = []
+
+    def visit_Import(self, node: ast.Import):
+        self.imports.append(node)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        self.imports.append(node)
+
+    def visit_Try(self, node: ast.Try):
+        if not _is_optional_import(node.handlers):
+            for child in node.body:
+                self.visit(child)
+        for child in node.handlers + node.orelse + node.finalbody:
+            self.visit(child)
+
+    visit_TryStar = visit_Try
+
+    def visit_If(self, node: ast.If):
+        test = node.test
+        name = test.attr if isinstance(test, ast.Attribute) else getattr(test, 'id', None)
+        if name != 'TYPE_CHECKING':
+            for child in node.body:
+                self.visit(child)
+        for child in node.orelse:
+            self.visit(child)
+
+
+def _bound_names(tree: ast.Module) -> Set[str]:
+    """Every name the module binds in any scope; undefined-name checks ignore scoping on purpose"""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, ast.alias):
+            names.add((node.asname or node.name).split('.')[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            names.update(node.names)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            names.add(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            names.add(node.rest)
+        elif sys.version_info >= (3, 12) and isinstance(node, ast.TypeVar):
+            names.add(node.name)
+    return names
+
+
+class StaticChecker:
+    """
+    In-process validation of generated Python files, meant to run before pytest:
+    parses each file, checks that its imports resolve to a module of the checkout
+    or of the interpreter, and flags names that are never bound anywhere in the
+    file nor builtins. Checks stay conservative so a file that fails them would
+    have failed at import time too.
+
+    Syntax errors and undefined names are blocking errors. Unresolved imports are
+    only warnings (see blocking_issues): the module may be the one the feature is
+    about to add, and if it never appears the test run reports the ImportError.
+    """
+
+    def __init__(self, repo_path: Path, files: Optional[Iterable[Mapping]] = None):
+        self.repo_path = Path(repo_path)
+        self.logger = logging.getLogger(__name__)
+        if files is None:
+            files = get_codebase_index(self.repo_path).scan()
+        self.module_names = self._importable(f['path'] for f in files)
+        self._found: Dict[str, bool] = {}
+        # Where the test subprocesses find installed modules: this interpreter's path minus the agent itself
+        self._search_path = [p for p in sys.path if p and os.path.abspath(p) != _AGENT_DIR]
+
+    @staticmethod
+    def _importable(paths: Iterable[str]) -> Set[str]:
+        """Module names under which repository-relative .py paths can be imported"""
+        paths = list(paths)
+        package_dirs = {str(PurePosixPath(p).parent) for p in paths if PurePosixPath(p).name == '__init__.py'}
+        names = set()
+        for path in paths:
+            for name in ContextSelector._module_names(path, package_dirs):
+                parts = name.split('.')
+                # Parent directories import as (namespace) packages
+                names.update('.'.join(parts[:i]) for i in range(1, len(parts) + 1))
+        return names
+
+    def _installed(self, top_level: str) -> bool:
+        if top_level not in self._found:
+            self._found[top_level] = (
+                top_level in sys.builtin_module_names
+                or top_level in getattr(sys, 'stdlib_module_names', ())
+                or importlib.machinery.PathFinder.find_spec(top_level, self._search_path) is not None
+            )
+        return self._found[top_level]
+
+    def _resolves(self, module: str, module_names: Set[str]) -> bool:
+        if module in module_names:
+            return True
+        top_level = module.split('.')[0]
+        # Submodules of installed packages are not looked up: finding them would import the package
+        return top_level not in module_names and self._installed(top_level)
+
+    def _check_imports(self, path: str, tree: ast.Module, module_names: Set[str]) -> List[StaticIssue]:
+        issues = []
+        package = list(PurePosixPath(path).parent.parts)
+        collector = _ImportCollector()
+        collector.visit(tree)
+        for node in collector.imports:
+            if isinstance(node, ast.Import):
+                modules = [alias.name for alias in node.names]
+            elif node.level:
+                base = package[:len(package) - (node.level - 1)] if node.level > 1 else package
+                base_name = '.'.join(base + ([node.module] if node.module else []))
+                # from . import x: each x may itself be a module
+                modules = [base_name] if node.module else [
+                    '.'.join(base + [alias.name]) for alias in node.names if alias.name != '*'
+                ]
+                modules = [m for m in modules if m]
+                if not node.module and base_name in module_names:
+                    modules = []
+            else:
+                modules = [node.module]
+            for module in modules:
+                if not self._resolves(module, module_names):
+                    issues.append(StaticIssue(
+                        path, node.lineno, node.col_offset + 1, 'import',
+                        f"No module named '{module}' in the repository or the installed packages"
+                    ))
+        return issues
+
+    def _check_names(self, path: str, tree: ast.Module) -> List[StaticIssue]:
+        if any(isinstance(node, ast.ImportFrom) and any(a.name == '*' for a in node.names) for node in ast.walk(tree)):
+            # A star import can bind anything
+            return []
+        known = _bound_names(tree) | set(dir(builtins)) | MODULE_NAMES
+        issues = []
+        reported = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) \
+                    and node.id not in known and node.id not in reported:
+                reported.add(node.id)
+                issues.append(StaticIssue(path, node.lineno, node.col_offset + 1, 'undefined-name',
+                                          f"Name '{node.id}' is not defined"))
+        return issues
+
+    def check(self, path: str, source: str, module_names: Optional[Set[str]] = None) -> List[StaticIssue]:
+        """Issues in one file; path is relative to the checkout and decides relative imports"""
+        try:
+            tree = ast.parse(source, filename=path)
+        except SyntaxError as e:
+            return [StaticIssue(path, e.lineno or 0, e.offset or 0, 'syntax', e.msg)]
+        except ValueError as e:
+            return [StaticIssue(path, 0, 0, 'syntax', str(e))]
+        issues = self._check_imports(path, tree, self.module_names if module_names is None else module_names)
+        return sorted(issues + self._check_names(path, tree),
+                      key=lambda issue: (issue.line, issue.column))
+
+    def check_files(self, files: Dict[str, str]) -> List[StaticIssue]:
+        """Check several files that are written together, so they may import each other"""
+        start = time.perf_counter()
+        module_names = self.module_names | self._importable(path for path in files if path.endswith('.py'))
+        issues = []
+        for path, source in files.items():
+            if path.endswith('.py'):
+                issues.extend(self.check(path, source, module_names))
+        self.logger.info(
+            f"Static check of {len(files)} file(s) found {len(issues)} issue(s) "
+            f"in {(time.perf_counter() - start) * 1000:.1f}ms"
+        )
+        return issues
@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import platform
+import threading
+import importlib.metadata
+from pathlib import Path
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from llm_cache import CACHE_MODES, DiskStore
+from codebase_index import get_codebase_index
+from test_runner import AGENT_DIR, PLUGIN_NAME, TestReport
+
+DEFAULT_TEST_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "code_generation_agent", "tests")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_AGE_SECONDS = 7 * 24 * 3600
+# Files up to this size are hashed by content, larger ones (data, models) by size and mtime
+MAX_HASHED_FILE_BYTES = 1024 * 1024
+
+
+@lru_cache(maxsize=1)
+def environment_fingerprint() -> str:
+    """Hash of the interpreter, the installed distributions and the agent's pytest plugin"""
+    distributions = sorted(
+        f"{dist.metadata['Name']}=={dist.version}" for dist in importlib.metadata.distributions()
+        if dist.metadata['Name']
+    )
+    try:
+        plugin = (AGENT_DIR / f"{PLUGIN_NAME}.py").read_bytes()
+    except OSError:
+        plugin = b''
+    payload = json.dumps({
+        'executable': sys.executable,
+        'version': sys.version,
+        'platform': platform.platform(),
+        'distributions': distributions,
+        'plugin': hashlib.sha256(plugin).hexdigest(),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class TestResultCache:
+    """
+    On-disk memo of test reports. The key covers every file of the checkout
+    (walked like the codebase index, so .gitignored and vendored paths are left
+    out), the test file and selection, the run options and the interpreter with
+    its installed packages; changing any of them is a miss. Keys do not include
+    the checkout's location, so worktrees with identical content share entries.
+    """
+
+    __test__ = False  # not a pytest test class
+
+    def __init__(self, cache_dir: Optional[str] = None, mode: Optional[str] = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES, max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS):
+        cache_dir = cache_dir or os.environ.get("TEST_CACHE_DIR", DEFAULT_TEST_CACHE_DIR)
+        mode = mode or os.environ.get("TEST_CACHE_MODE", "use")
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}, expected one of {CACHE_MODES}")
+
+        self.mode = mode
+        self.store = DiskStore(cache_dir, max_bytes=max_bytes, max_age_seconds=max_age_seconds)
+        self.logger = logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        # (absolute path, size, mtime_ns) -> content digest, so unchanged files are read once per process
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+
+    def _file_digest(self, path: str, stat: os.stat_result) -> str:
+        if stat.st_size > MAX_HASHED_FILE_BYTES:
+            return f"size:{stat.st_size}:mtime:{stat.st_mtime_ns}"
+        memo_key = (path, stat.st_size, stat.st_mtime_ns)
+        digest = self._digests.get(memo_key)
+        if digest is None:
+            try:
+                with open(path, 'rb') as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+            except OSError:
+                digest = 'unreadable'
+            with self._lock:
+                self._digests[memo_key] = digest
+        return digest
+
+    def tree_hash(self, repo_path: Path) -> str:
+        """Hash of the relative path and content of every file in the checkout"""
+        repo_path = Path(repo_path).resolve()
+        tree = hashlib.sha256()
+        for rel, stat in get_codebase_index(repo_path).iter_source_paths(suffix=''):
+            tree.update(f"{rel}\0{self._file_digest(str(repo_path / rel), stat)}\n".encode('utf-8'))
+        return tree.hexdigest()
+
+    def make_key(self, repo_path: Path, test_file: Path, node_ids: Optional[List[str]], options: Dict) -> str:
+        """Hash everything that influences a test run into a cache key"""
+        repo_path = Path(repo_path).resolve()
+        request = {
+            'tree': self.tree_hash(repo_path),
+            'test_file': Path(test_file).resolve().relative_to(repo_path).as_posix(),
+            'node_ids': node_ids,
+            'options': options,
+            'environment': environment_fingerprint(),
+        }
+        payload = json.dumps(request, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[TestReport]:
+        if self.mode != "use":
+            return None
+        entry = self.store.get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += entry['duration']
+        self.logger.info(f"Test cache hit (key {key[:12]})")
+        return TestReport(entry['tests'], entry['output'], entry['duration'], entry['shards'])
+
+    def put(self, key: str, report: TestReport):
+        """Store a report, unless it looks like an incomplete or environment-dependent run"""
+        if self.mode == "bypass":
+            return
+        if not report.tests or report.counts['timeout']:
+            self.logger.debug("Not caching a test run with no results or with timeouts")
+            return
+        self.store.put(key, {
+            'tests': report.tests,
+            'output': report.output,
+            'duration': report.duration,
+            'shards': report.shards,
+            'created': time.time(),
+        })
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and the test time avoided by cache hits"""
+        with self._lock:
+            return {'mode': self.mode, 'hits': self.hits, 'misses': self.misses,
+                    'saved_seconds': round(self.saved_seconds, 3)}
+
+    def log_stats(self, logger: Optional[logging.Logger] = None):
+        stats = self.stats()
+        (logger or self.logger).info(
+            f"Test cache ({stats['mode']}): {stats['hits']} hits, {stats['misses']} misses, "
+            f"saved {stats['saved_seconds']:.1f}s of test runs"
+        )
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_test_cache() -> TestResultCache:
+    """Process-wide test result cache shared by both agents"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = TestResultCache()
+        return _default_cache
@@ -1,22 +1,61 @@
-import os
-import git
+import sys
+import ast
+import hashlib
 from pathlib import Path
 import logging
-from typing import List, Dict
-import pytest
-import pprint
-import requests
-import dspy
-from together import Together
-
-together_client = Together(api_key="09e8f3626baed45a43804f875e0f422d71ed78320343857bf09ce90bb6d00ae8")
+from typing import Iterable, Iterator, List, Dict, Optional, Union
+from llm_cache import CompletionCache, get_default_cache
+from llm_client import LLMClient, get_default_client
+from code_blocks import CodeBlockStreamParser, check_syntax
+from codebase_index import MAX_SOURCE_FILE_BYTES, get_codebase_index
+from context_selector import ContextBuilder, ContextSelector, DEFAULT_TOKEN_BUDGET
+from code_search import get_code_search_index, retrieval_seeds
+import tracing
+from pipeline import StageGraph, StopPipeline, default_checkpoint_path, fingerprint
+from test_runner import DEFAULT_TEST_TIMEOUT, ShardedTestRunner, TestReport
+from repo_pool import RepoPool, WorktreeLease, get_default_repo_pool
+from static_check import StaticChecker, StaticIssue, blocking_issues, format_issues
+from test_cache import TestResultCache, get_default_test_cache
+
+THOUGHT_MODEL = "deepseek-ai/DeepSeek-V3"
+CODER_MODEL = "Qwen/Qwen2.5-Coder-32B-Instruct"
+
 class TestCaseGenerator:
-    def __init__(self, repo_url: str, feature_description: str, together_api_key: str, model: str = "Qwen/Qwen2.5-7B-Instruct-Turbo"):
+    def __init__(self, repo_url: str, feature_description: str, together_api_key: str, model: str = "Qwen/Qwen2.5-7B-Instruct-Turbo",
+                 cache: Optional[CompletionCache] = None, context_token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 retrieval_top_k: int = 10, client: Optional[LLMClient] = None,
+                 checkpoint_path: Optional[Path] = None, test_workers: Optional[int] = None,
+                 test_timeout: float = DEFAULT_TEST_TIMEOUT, repo_path: Optional[Path] = None,
+                 repo_pool: Optional[RepoPool] = None, static_repairs: int = 1,
+                 test_cache: Optional[TestResultCache] = None, max_file_bytes: int = MAX_SOURCE_FILE_BYTES,
+                 max_context_chars: Optional[int] = None):
         self.repo_url = repo_url
         self.feature_description = feature_description
         self.together_api_key = together_api_key
         self.model = model
         self.temp_dir = None
+        self.cache = cache or get_default_cache()
+        self.client = client or get_default_client()
+        self.syntax_errors = []
+        self.context_token_budget = context_token_budget
+        self.context_report = None
+        # Caps on what one prompt can hold, whatever the size of the repository
+        self.max_file_bytes = max_file_bytes
+        self.max_context_chars = max_context_chars
+        self.retrieval_top_k = retrieval_top_k
+        self.checkpoint_path = checkpoint_path
+        self.stage_timings = {}
+        self.test_workers = test_workers
+        self.test_timeout = test_timeout
+        self.repo_path = repo_path
+        self.repo_pool = repo_pool or get_default_repo_pool()
+        self.lease: Optional[WorktreeLease] = None
+        self.test_file: Optional[Path] = None
+        self.test_report: Optional[TestReport] = None
+        self.test_cache = test_cache or get_default_test_cache()
+        # Follow-up requests to fix a test file the static check rejects; it is not run while issues remain
+        self.static_repairs = static_repairs
+        self.static_issues: List[StaticIssue] = []
         self.logger = logging.getLogger(__name__)
         
     def setup_logging(self):
@@ -27,57 +66,57 @@ class TestCaseGenerator:
         )
 
     def clone_repository(self) -> Path:
-        """Clone the repository to a new directory in current working directory"""
-        repo_name = self.repo_url.split('/')[-1]  # Extract repo name from URL
-        self.temp_dir = os.path.join(os.getcwd(), repo_name)
-        self.logger.info(f"Cloning repository to {self.temp_dir}")
-        
-        # Check if directory already exists and handle it
-        if os.path.exists(self.temp_dir):
-            self.logger.info(f"Directory {self.temp_dir} already exists. Adding timestamp suffix.")
-            import time
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            self.temp_dir = f"{self.temp_dir}_{timestamp}"
-        
-        git.Repo.clone_from(self.repo_url, self.temp_dir)
+        """
+        Check out the repository for this run: repo_path if one was given, otherwise a worktree
+        leased from the shared mirror pool. The lease is kept (self.lease) so the feature
+        implementer can work on the same checkout; release it once the job is done.
+        """
+        if self.repo_path is not None:
+            self.temp_dir = str(Path(self.repo_path).resolve())
+        else:
+            if self.lease is None or self.lease.released:
+                self.lease = self.repo_pool.lease(self.repo_url)
+            self.temp_dir = str(self.lease.path)
+        self.logger.info(f"Using checkout {self.temp_dir}")
         return Path(self.temp_dir)
 
     def analyze_codebase(self, repo_path: Path) -> List[Dict]:
         """
         Analyze all Python files in the repository
-        Returns a list of dictionaries containing file paths and their content
+        Returns a list of index entries exposing each file's path and (lazily read) content
         """
-        all_files = []
-        
-        for file_path in repo_path.rglob("*.py"):
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    all_files.append({
-                        'path': str(file_path.relative_to(repo_path)),
-                        'content': content
-                    })
-            except Exception as e:
-                self.logger.warning(f"Error reading file {file_path}: {str(e)}")
-                
-        return all_files
+        return get_codebase_index(repo_path).scan()
 
     def construct_prompt(self, all_files: List[Dict]) -> tuple[str, str]:
-        """Construct the prompt for the LLM with all codebase files"""
+        """Construct the prompt for the LLM with the codebase files most relevant to the feature"""
+
+        # Look up code matching the concepts in the feature description
+        search_index = get_code_search_index(Path(self.temp_dir))
+        search_index.update(all_files, self.max_file_bytes)
+        seeds, symbols = retrieval_seeds(search_index.search(self.feature_description, k=self.retrieval_top_k))
+
+        # Pack the most relevant files into the token budget, the rest as signature stubs
+        sections, self.context_report = ContextSelector(all_files, self.context_token_budget, self.max_file_bytes).select(
+            feature_description=self.feature_description,
+            extra_seeds=seeds,
+            extra_symbols=symbols
+        )
 
-        context = ""
         files_by_dir = {}
-        for file in all_files:
-            dir_name = str(Path(file['path']).parent)
+        for section in sections:
+            dir_name = str(Path(section['path']).parent)
             if dir_name not in files_by_dir:
                 files_by_dir[dir_name] = []
-            files_by_dir[dir_name].append(file)
+            files_by_dir[dir_name].append(section)
         
         # Add files to prompt, organized by directory
+        builder = ContextBuilder(self.max_context_chars, self.max_file_bytes, self.context_token_budget)
         for dir_name, files in files_by_dir.items():
-            context += f"\nDirectory: {dir_name}\n"
+            builder.add_text(f"\nDirectory: {dir_name}\n")
             for file in files:
-                context += f"\nFile: {file['path']}\n```python\n{file['content']}\n```\n"
+                builder.add_section(file)
+        context = builder.build()
+        self.context_report.update(builder.report())
 
         prompt =  f"""You are an expert Python developer specializing in test-driven development (TDD).  Given the 
         following Python code representing a feature implementation, generate comprehensive test cases using pytest.  
@@ -125,142 +164,245 @@ class TestCaseGenerator:
         The response should contain only the complete, runnable Python test code enclosed within triple backticks 
         (```python ... ```).  Do not include any other text, explanations, or comments outside the code block.
         """
-        # pprint.pprint(prompt)
+        if tracing.tracing_enabled():
+            tracing.current_span().set_attribute('prompt.bytes', len(prompt.encode('utf-8')))
         return prompt
 
-    def generate_tests_with_llm(self, prompt: str) -> Dict:
-        """Make POST request to Together API and get the generated tests"""
+    def _complete(self, model: str, prompt: str, max_tokens: int, stop: Optional[List[str]] = None) -> str:
+        """Get a completion through the completion cache and the shared LLM client"""
+        return self.cache.get_or_compute(
+            model, prompt, max_tokens, stop,
+            lambda: self.client.complete(model, prompt, max_tokens, stop, api_key=self.together_api_key).text
+        )
+
+    def _stream(self, model: str, prompt: str, max_tokens: int, stop: Optional[List[str]] = None) -> Iterator[str]:
+        """Stream a completion through the completion cache and the shared LLM client"""
+        return self.cache.stream_or_compute(
+            model, prompt, max_tokens, stop,
+            lambda: self.client.stream(model, prompt, max_tokens, stop, api_key=self.together_api_key)
+        )
+
+    def generate_thought(self, prompt: str) -> str:
+        """Ask DeepSeek-V3 for the thought process behind the tests"""
         try:
-            # thought = together_client.chat.completions.create(
-            #     model="deepseek-ai/DeepSeek-R1",
-            #     messages=[
-            #         {"role": "user", "content": prompt}
-            #     ],
-            #     max_tokens=25000,
-            #     stop=['</think>']
-            # )
-            # print(thought.choices[0].message.content)
-            # Make POST request to DeepSeek-R1 using Together API
-
-            headers = {
-                "Authorization": f"Bearer {self.together_api_key}",
-                "Content-Type": "application/json"
-            }
-
-            data = {
-                "model": "deepseek-ai/DeepSeek-V3",
-                "messages": [
-                    {"role": "user", "content": prompt + "** Generate the throught process for the given prompt**"}
-                ],
-                "max_tokens": 25000,
-                "stop": ['</think>']
-            }
-
-            response = requests.post("https://api.together.xyz/inference", headers=headers, json=data)
-            response.raise_for_status()
-            thought_result = response.json()["choices"][0]["message"]["content"]
-            print(thought_result)
-
-
-            # Make POST request to DeepSeek-R1
-            thought_lm = dspy.LM("openai/Qwen/Qwen2.5-Coder-32B-Instruct", api_key=self.together_api_key, 
-                         api_base="https://api.together.xyz/v1", max_tokens=25000)
-            
-            dspy.configure(lm=thought_lm)
-            thought_result = thought_lm(prompt)[0]
-            print(thought_result)
+            thought_result = self._complete(
+                THOUGHT_MODEL, prompt + "** Generate the throught process for the given prompt**", 25000, ['</think>']
+            )
+            self.logger.debug(f"Thought process:\n{thought_result}")
+            return thought_result
+        except Exception as e:
+            self.logger.error(f"Error generating thought process: {str(e)}")
+            raise
+
+    def stream_tests_with_llm(self, prompt: str, thought_result: Optional[str] = None) -> Iterator[str]:
+        """Stream the generated tests as they are produced, guided by the thought process"""
+        if thought_result is None:
+            thought_result = self.generate_thought(prompt)
 
-            prompt_with_thought = prompt + f""" 
+        prompt_with_thought = prompt + f""" 
             The following is the thought process of the Python Developer. Use the given thought process 
             to generate the test cases.
             <think>
             {thought_result}
             </think>
             """
-            lm = dspy.LM("openai/Qwen/Qwen2.5-Coder-32B-Instruct", api_key=self.together_api_key, 
-                         api_base="https://api.together.xyz/v1", max_tokens=22000)
-            dspy.configure(lm=lm)
-            return lm(prompt_with_thought)[0]
-            
+        return self._stream(CODER_MODEL, prompt_with_thought, 22000)
+
+    def generate_tests_with_llm(self, prompt: str) -> Dict:
+        """Request the thought process and then the generated tests from the Together API"""
+        try:
+            return ''.join(self.stream_tests_with_llm(prompt))
         except Exception as e:
             self.logger.error(f"Error generating tests: {str(e)}")
             raise
 
-    def write_test_file(self, repo_path: Path, test_data: str) -> Path:
-        """Write the generated tests to a file"""
-        # Write complete output to raw file
+    def write_test_file(self, repo_path: Path, test_data: Union[str, Iterable[str]]) -> Path:
+        """
+        Write the generated tests to a file.
+        Accepts the full response or a stream of deltas; code blocks are appended to the
+        test file as soon as they close.
+        """
         raw_output_path = repo_path / 'raw_llm_output.py'
-        with open(raw_output_path, 'w', encoding='utf-8') as f:
-            f.write(test_data)
-            
         test_file_path = repo_path / 'generated_test_cases.py'
-        
-        # Extract code between ```python and ``` markers
-        code_blocks = []
-        lines = test_data.split('\n')
-        in_code_block = False
-        current_block = []
-        
-        for line in lines:
-            if line.strip() == '```python':
-                in_code_block = True
-                continue
-            elif line.strip() == '```':
-                if in_code_block:
-                    code_blocks.append('\n'.join(current_block))
-                    current_block = []
-                in_code_block = False
-                continue
-                
-            if in_code_block:
-                current_block.append(line)
-        
-        # Write only the extracted code blocks
-        with open(test_file_path, 'w', encoding='utf-8') as f:
-            f.write('\n\n'.join(code_blocks))
-            
+        self.syntax_errors = []
+        blocks_written = 0
+
+        with open(raw_output_path, 'w', encoding='utf-8') as raw, \
+                open(test_file_path, 'w', encoding='utf-8') as test_file:
+
+            # Extract code between ```python and ``` markers
+            def write_block(path: Optional[str], content: str):
+                nonlocal blocks_written
+                if path is not None:
+                    return
+                if blocks_written:
+                    test_file.write('\n\n')
+                test_file.write(content)
+                test_file.flush()
+                blocks_written += 1
+                error = check_syntax(test_file_path.name, content)
+                if error:
+                    self.syntax_errors.append(error)
+                    self.logger.warning(f"Generated test code has a syntax error: {error}")
+
+            parser = CodeBlockStreamParser(write_block)
+            # Write complete output to raw file as it arrives
+            for delta in ([test_data] if isinstance(test_data, str) else test_data):
+                raw.write(delta)
+                parser.feed(delta)
+            parser.close()
+
         return test_file_path
 
-    def run_tests(self, test_file_path: Path):
-        """Run the generated tests"""
+    def check_test_file(self, repo_path: Path, test_file_path: Path, all_files: List[Dict]) -> List[StaticIssue]:
+        """Parse the test file and resolve its imports and names without running it"""
+        rel_path = test_file_path.relative_to(repo_path).as_posix()
+        issues = StaticChecker(repo_path, all_files).check_files({rel_path: test_file_path.read_text(encoding='utf-8')})
+        for issue in issues:
+            self.logger.warning(f"Generated test file: {issue.format()}")
+        return issues
+
+    def repair_prompt(self, prompt: str, test_code: str, issues: List[StaticIssue]) -> str:
+        """Follow-up asking the model to fix the problems the static check found"""
+        return f"""{prompt}
+
+        Your previous answer was:
+        ```python
+        {test_code}
+        ```
+
+        It cannot run as it is:
+        ```
+        {format_issues(issues)}
+        ```
+        Fix these problems and reply with the complete corrected test code in the same format.
+        """
+
+    def parse_test_file(self, test_file_path: Path) -> List[str]:
+        """Return the names of the test functions defined in the generated test file"""
+        try:
+            tree = ast.parse(test_file_path.read_text(encoding='utf-8'), filename=str(test_file_path))
+        except SyntaxError as e:
+            self.logger.error(f"Generated test file does not parse: {str(e)}")
+            return []
+
+        test_names = []
+        for node in tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith('test'):
+                test_names.append(node.name)
+            elif isinstance(node, ast.ClassDef) and node.name.startswith('Test'):
+                test_names.extend(
+                    f"{node.name}::{child.name}" for child in node.body
+                    if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)) and child.name.startswith('test')
+                )
+        self.logger.info(f"Generated test file defines {len(test_names)} tests")
+        return test_names
+
+    def run_tests(self, test_file_path: Path) -> TestReport:
+        """Run the generated tests in isolated, sharded pytest processes"""
         self.logger.info(f"Running tests from {test_file_path}")
-        pytest.main([str(test_file_path), "-v"])
+        runner = ShardedTestRunner(test_file_path.parent, workers=self.test_workers, per_test_timeout=self.test_timeout,
+                                   cache=self.test_cache)
+        report = runner.run(test_file_path)
+        self.logger.debug(report.format_text())
+        return report
+
+    @staticmethod
+    def _file_digest(path: Path) -> Optional[str]:
+        try:
+            with open(path, 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
+
+    def build_pipeline(self) -> StageGraph:
+        """Stage graph for test generation: clone -> scan -> prompt -> think -> generate -> parse -> run"""
+        graph = StageGraph(
+            "generate_tests",
+            checkpoint_path=self.checkpoint_path or default_checkpoint_path(
+                "generate_tests", self.repo_url, self.feature_description
+            )
+        )
+
+        def scan(repo_path: str) -> List[Dict]:
+            all_files = self.analyze_codebase(Path(repo_path))
+            tracing.add_counts({'files.scanned': len(all_files)})
+            if not all_files:
+                raise StopPipeline("No files found for analysis")
+            return all_files
+
+        def generate(repo_path: str, all_files: List[Dict], prompt: str, thought_result: str) -> Dict:
+            test_file_path = self.write_test_file(Path(repo_path), self.stream_tests_with_llm(prompt, thought_result))
+            # Imports of modules that do not exist yet are only warnings: the feature may add them
+            issues = blocking_issues(self.check_test_file(Path(repo_path), test_file_path, all_files))
+            for _ in range(self.static_repairs):
+                if not issues:
+                    break
+                test_code = test_file_path.read_text(encoding='utf-8')
+                self.logger.info(f"Asking for a corrected test file ({len(issues)} static issues)")
+                test_file_path = self.write_test_file(
+                    Path(repo_path), self._stream(CODER_MODEL, self.repair_prompt(prompt, test_code, issues), 22000)
+                )
+                issues = blocking_issues(self.check_test_file(Path(repo_path), test_file_path, all_files))
+            # The checkout is recorded so the feature implementer can find the exact worktree used
+            return {'test_file': str(test_file_path), 'sha256': self._file_digest(test_file_path),
+                    'checkout': str(repo_path), 'static_issues': [issue.to_dict() for issue in issues]}
+
+        def run(generated: Dict, test_names: List[str]) -> Optional[TestReport]:
+            if blocking_issues(StaticIssue(**issue) for issue in generated.get('static_issues', [])):
+                self.logger.error("Generated test file failed the static check; skipping test run")
+                return None
+            if not test_names:
+                self.logger.warning("No tests found in the generated test file; skipping test run")
+                return None
+            return self.run_tests(Path(generated['test_file']))
+
+        graph.add("clone", lambda: str(self.clone_repository()))
+        graph.add("scan", scan, deps=["clone"])
+        graph.add("prompt", self.construct_prompt, deps=["scan"])
+        # The thought and the generated tests only depend on the prompt, so an unchanged
+        # prompt reuses the previous run's output instead of calling the model again
+        graph.add("think", self.generate_thought, deps=["prompt"],
+                  key=lambda prompt: fingerprint(THOUGHT_MODEL, prompt))
+        graph.add("generate", generate, deps=["clone", "scan", "prompt", "think"],
+                  key=lambda repo_path, all_files, prompt, thought_result: fingerprint(
+                      repo_path, CODER_MODEL, prompt, thought_result, self.static_repairs
+                  ),
+                  is_valid=lambda generated: self._file_digest(Path(generated['test_file'])) == generated['sha256'])
+        graph.add("parse", lambda generated: self.parse_test_file(Path(generated['test_file'])), deps=["generate"])
+        graph.add("run", run, deps=["generate", "parse"])
+        return graph
 
     def generate_and_run_tests(self):
         """Main method to orchestrate the test generation process"""
+        graph = None
         try:
             self.setup_logging()
-            repo_path = self.clone_repository()
-            all_files = self.analyze_codebase(repo_path)
-            
-            if not all_files:
-                self.logger.warning("No files found for analysis")
-                return
-            
-            prompt = self.construct_prompt(all_files)
-            test_data = self.generate_tests_with_llm(prompt)
-            # pprint.pprint(test_data)
-            test_file_path = self.write_test_file(repo_path, test_data)
-            self.run_tests(test_file_path)
+            graph = self.build_pipeline()
+            results = graph.run()
+            if results.get('generate'):
+                self.test_file = Path(results['generate']['test_file'])
+                self.static_issues = blocking_issues(
+                    StaticIssue(**issue) for issue in results['generate'].get('static_issues', [])
+                )
+            self.test_report = results.get('run')
             
         except Exception as e:
             self.logger.error(f"Error in test generation process: {str(e)}")
             raise
         finally:
+            if graph:
+                self.stage_timings = dict(graph.timings)
+                graph.log_timings(self.logger)
+            self.cache.log_stats(self.logger)
+            self.test_cache.log_stats(self.logger)
             if self.temp_dir:
                 self.logger.info(f"Generated tests can be found in {self.temp_dir}")
 
 def main():
-    # Example usage
-    repo_url = "https://github.com/ChidambaramG/demand_forecasting_XGBoost"
-    feature_description = """
-    Modify the approach to include rolling means as on of the features when training the model.
-    """
-    together_api_key = "09e8f3626baed45a43804f875e0f422d71ed78320343857bf09ce90bb6d00ae8"
-    model = "together_ai/togethercomputer/Qwen/Qwen2.5-Coder-32B-Instruct"
-    
-    generator = TestCaseGenerator(repo_url, feature_description, together_api_key)
-    generator.generate_and_run_tests()
+    # Same as `python cli.py generate-tests REPO_URL FEATURE_DESCRIPTION`; the API key comes from TOGETHER_API_KEY
+    from cli import main as cli_main
+    cli_main(['generate-tests'] + sys.argv[1:])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
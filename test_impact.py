@@ -0,0 +1,200 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from codebase_index import ensure_state_dir, get_codebase_index, STATE_DIR_NAME
+from test_cache import environment_fingerprint
+
+IMPACT_FILE_NAME = 'test_impact.json'
+IMPACT_VERSION = 1
+# Files that change how pytest collects or runs every test
+CONFIG_FILES = ('pytest.ini', 'pyproject.toml', 'setup.cfg', 'tox.ini')
+# Selection reasons are logged one per test up to this many tests, then summarized
+MAX_LOGGED_DECISIONS = 50
+
+
+def _sha256(path: Path) -> Optional[str]:
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class TestImpactMap:
+    """
+    Persistent per-test coverage of a checkout: for every test, the repository
+    files it executed (with their content hash at the time) and its last result.
+
+    select() decides which tests of a run need to execute. A test is re-run when
+    it is new, did not pass last time, or covered a file whose content changed
+    since; every other test keeps its recorded result. Any change to the test
+    file, a conftest.py, the pytest configuration or the interpreter invalidates
+    the whole map, and so does a run with force_full.
+
+    Coverage is file-level and only sees Python executed while a test runs, so
+    edits to module-level code a test merely reads at import time, or to data
+    files, are not detected; force a full run when that matters.
+    """
+
+    __test__ = False  # not a pytest test class
+
+    def __init__(self, repo_path: Path, path: Optional[Path] = None):
+        self.repo_path = Path(repo_path).resolve()
+        self.path = Path(path) if path else self.repo_path / STATE_DIR_NAME / IMPACT_FILE_NAME
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._data = self._load()
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable test impact map {self.path}: {str(e)}")
+            return {}
+        return data if data.get('version') == IMPACT_VERSION else {}
+
+    def _save(self):
+        if self.path.parent.name == STATE_DIR_NAME:
+            ensure_state_dir(self.path.parent.parent)
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f)
+        os.replace(tmp_path, self.path)
+
+    def _fingerprint(self, repo_path: Path, test_file: Path) -> Dict:
+        """Everything whose change invalidates all recorded coverage"""
+        config = {
+            rel: _sha256(repo_path / rel)
+            for rel, _ in get_codebase_index(repo_path).iter_source_paths()
+            if rel.rsplit('/', 1)[-1] == 'conftest.py'
+        }
+        for name in CONFIG_FILES:
+            if (repo_path / name).exists():
+                config[name] = _sha256(repo_path / name)
+        return {
+            'test_file': test_file.relative_to(repo_path).as_posix(),
+            'test_sha': _sha256(test_file),
+            'config': config,
+            'environment': environment_fingerprint(),
+        }
+
+    def select(self, repo_path: Path, test_file: Path, node_ids: List[str],
+               force_full: bool = False) -> Tuple[List[str], List[Dict]]:
+        """
+        Split node_ids into the tests to run and the recorded results of the tests
+        that can be skipped. repo_path may be a copy of the checkout the map belongs to.
+        """
+        repo_path = Path(repo_path).resolve()
+        test_file = Path(test_file).resolve()
+        fingerprint = self._fingerprint(repo_path, test_file)
+        with self._lock:
+            recorded = dict(self._data.get('tests', {}))
+            previous = self._data.get('fingerprint')
+
+        full_reason = None
+        if force_full:
+            full_reason = "full run forced"
+        elif not recorded:
+            full_reason = "no coverage recorded yet"
+        elif previous != fingerprint:
+            changed = [name for name in ('test_file', 'test_sha', 'config', 'environment')
+                       if (previous or {}).get(name) != fingerprint[name]]
+            full_reason = f"{', '.join(changed)} changed since coverage was recorded"
+        if full_reason:
+            self.logger.info(f"Test selection: running all {len(node_ids)} tests ({full_reason})")
+            with self._lock:
+                self._data = {'version': IMPACT_VERSION, 'fingerprint': fingerprint, 'tests': {}}
+            return list(node_ids), []
+
+        digests: Dict[str, Optional[str]] = {}
+        selected, reused, decisions = [], [], []
+        for node_id in node_ids:
+            record = recorded.get(node_id)
+            if record is None:
+                reason = "new test"
+            elif record['result']['outcome'] not in ('passed', 'skipped'):
+                reason = f"previously {record['result']['outcome']}"
+            else:
+                changed = []
+                for rel, sha in record['files'].items():
+                    if rel not in digests:
+                        digests[rel] = _sha256(repo_path / rel)
+                    if digests[rel] != sha:
+                        changed.append(rel)
+                reason = f"covered files changed: {', '.join(changed)}" if changed else None
+            if reason:
+                selected.append(node_id)
+                decisions.append(f"run {node_id}: {reason}")
+            else:
+                reused.append(dict(record['result'], reused=True))
+                decisions.append(f"skip {node_id}: {len(record['files'])} covered file(s) unchanged")
+
+        self.logger.info(
+            f"Test selection: running {len(selected)} of {len(node_ids)} tests, "
+            f"reusing {len(reused)} results ({len(digests)} covered files checked)"
+        )
+        for decision in decisions[:MAX_LOGGED_DECISIONS]:
+            self.logger.info(f"  {decision}")
+        if len(decisions) > MAX_LOGGED_DECISIONS:
+            self.logger.info(f"  ... {len(decisions) - MAX_LOGGED_DECISIONS} more decisions")
+        return selected, reused
+
+    def fork(self, repo_path: Path) -> 'TestImpactMap':
+        """
+        Map for a copy of the checkout that starts from the coverage recorded here.
+        What the copy records is saved under the copy and never reaches this map.
+        """
+        fork = TestImpactMap(repo_path)
+        with self._lock:
+            fork._data = json.loads(json.dumps(self._data))
+        return fork
+
+    def update(self, repo_path: Path, tests: List[Dict]):
+        """
+        Record the coverage and results of tests that just ran in repo_path. Pops the
+        'coverage' key the plugin adds; tests without one (e.g. killed) are forgotten
+        so they run again next time.
+        """
+        repo_path = Path(repo_path).resolve()
+        updates, dropped = {}, []
+        for test in tests:
+            coverage = test.pop('coverage', None)
+            if test.get('reused'):
+                continue
+            if coverage is None or '::' not in test['nodeid']:
+                dropped.append(test['nodeid'])
+                continue
+            updates[test['nodeid']] = {
+                'files': {rel: _sha256(repo_path / rel) for rel in coverage},
+                'lines': coverage,
+                'result': test,
+            }
+        with self._lock:
+            if not self._data:
+                return
+            entries = self._data.setdefault('tests', {})
+            entries.update(updates)
+            for node_id in dropped:
+                entries.pop(node_id, None)
+            self._save()
+
+
+_maps: Dict[Path, TestImpactMap] = {}
+_maps_lock = threading.Lock()
+
+
+def get_test_impact_map(repo_path: Path) -> TestImpactMap:
+    """Shared coverage map of a checkout, so concurrent runners update one copy"""
+    key = Path(repo_path).resolve()
+    with _maps_lock:
+        if key not in _maps:
+            _maps[key] = TestImpactMap(key)
+        return _maps[key]
@@ -0,0 +1,336 @@
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import threading
+import tempfile
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import tracing
+from codebase_index import ensure_state_dir
+from test_worker import POLL_INTERVAL, RunCancelled, WarmTestWorker, WorkerError, get_test_worker
+
+if TYPE_CHECKING:
+    from test_cache import TestResultCache
+    from test_impact import TestImpactMap
+
+AGENT_DIR = Path(__file__).resolve().parent
+PLUGIN_NAME = 'pytest_agent_plugin'
+DEFAULT_TEST_TIMEOUT = 300.0
+OUTCOMES = ('passed', 'failed', 'error', 'timeout', 'skipped')
+
+
+def _read_text(path: str) -> str:
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+    except OSError:
+        return ''
+
+
+def available_cores() -> int:
+    """CPU cores this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+class TestReport:
+    """Merged per-test results of a (possibly sharded) test run"""
+
+    __test__ = False  # not a pytest test class
+
+    def __init__(self, tests: List[Dict], output: str, duration: float, shards: int):
+        self.tests = tests
+        self.output = output
+        self.duration = duration
+        self.shards = shards
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        counts = {outcome: 0 for outcome in OUTCOMES}
+        for test in self.tests:
+            counts[test['outcome']] = counts.get(test['outcome'], 0) + 1
+        return counts
+
+    @property
+    def passed(self) -> bool:
+        counts = self.counts
+        return bool(self.tests) and not (counts['failed'] or counts['error'] or counts['timeout'])
+
+    def summary(self) -> str:
+        counts = self.counts
+        parts = [f"{counts[o]} {o}" for o in OUTCOMES if counts[o]] or ["no tests ran"]
+        return f"{', '.join(parts)} in {self.duration:.2f}s across {self.shards} shard(s)"
+
+    def format_text(self) -> str:
+        """Raw pytest output of every shard followed by the merged summary"""
+        return f"{self.output}\n{'=' * 20} merged: {self.summary()} {'=' * 20}\n"
+
+    def to_dict(self) -> Dict:
+        return {
+            'summary': self.summary(),
+            'counts': self.counts,
+            'duration': self.duration,
+            'shards': self.shards,
+            'tests': self.tests,
+        }
+
+
+class ShardedTestRunner:
+    """
+    Runs a test file in isolated pytest processes, sharding its tests across
+    a pool sized to the available cores, with a per-test timeout. Results from
+    every shard are merged into one TestReport.
+
+    With warm_worker=True each pytest run is forked from the checkout's warm
+    worker (see test_worker) instead of a new interpreter, falling back to a
+    subprocess if the worker is unavailable. A specific worker can be passed
+    instead, e.g. the one of the checkout a scratch copy was made from.
+
+    Setting cancel (a threading.Event) kills the pytest processes in flight and
+    makes run() raise RunCancelled.
+
+    With a cache (see test_cache), a run whose checkout, test selection, options
+    and interpreter match an earlier one returns that run's report without
+    starting pytest.
+
+    With an impact map (see test_impact), every test records the repository
+    files it executes, and later runs only execute the tests that map selects,
+    reusing the recorded results of the rest; force_full runs everything.
+    """
+
+    def __init__(self, repo_path: Path, workers: Optional[int] = None,
+                 per_test_timeout: float = DEFAULT_TEST_TIMEOUT, pytest_args: Optional[List[str]] = None,
+                 warm_worker: bool = False, worker: Optional[WarmTestWorker] = None,
+                 cancel: Optional[threading.Event] = None, cache: Optional['TestResultCache'] = None,
+                 impact: Optional['TestImpactMap'] = None, force_full: bool = False):
+        self.repo_path = Path(repo_path).resolve()
+        self.workers = workers or available_cores()
+        self.per_test_timeout = per_test_timeout
+        self.pytest_args = pytest_args if pytest_args is not None else ['-v', '--capture=no']
+        self.logger = logging.getLogger(__name__)
+        if worker is None and warm_worker and hasattr(os, 'fork'):
+            worker = get_test_worker(self.repo_path, env=self._env())
+        self.worker = worker
+        self.cancel = cancel
+        self.cache = cache
+        self.impact = impact
+        self.force_full = force_full
+
+    def _env(self) -> Dict[str, str]:
+        env = dict(os.environ)
+        # Make the result/timeout plugin importable without touching the target repo
+        env['PYTHONPATH'] = os.pathsep.join(p for p in (env.get('PYTHONPATH'), str(AGENT_DIR)) if p)
+        env.setdefault('PYTHONDONTWRITEBYTECODE', '1')
+        return env
+
+    def _pytest(self, args: List[str], timeout: float, work_dir: str, name: str) -> Tuple[int, str]:
+        """Run pytest with args and return (exit code, output); raises TimeoutExpired or RunCancelled"""
+        args = ['--rootdir', str(self.repo_path), '-p', 'no:cacheprovider'] + args
+        if self.worker is not None:
+            output_path = os.path.join(work_dir, f"{name}.log")
+            try:
+                returncode = self.worker.run_pytest(args, output_path, timeout, cwd=self.repo_path,
+                                                    env=self._env(), cancel=self.cancel)
+                return returncode, _read_text(output_path)
+            except subprocess.TimeoutExpired as e:
+                e.stdout = _read_text(output_path)
+                raise
+            except WorkerError as e:
+                self.logger.warning(f"Warm test worker unavailable, starting a new interpreter: {str(e)}")
+
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'pytest'] + args, cwd=self.repo_path, env=self._env(),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, start_new_session=True,
+        )
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                stdout, stderr = process.communicate(timeout=POLL_INTERVAL)
+                return process.returncode, stdout + "\n" + stderr
+            except subprocess.TimeoutExpired:
+                cancelled = self.cancel is not None and self.cancel.is_set()
+                if not cancelled and time.monotonic() < deadline:
+                    continue
+            # Kill the whole session so processes started by the tests go too
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            stdout, stderr = process.communicate()
+            if cancelled:
+                raise RunCancelled("Test run cancelled")
+            raise subprocess.TimeoutExpired(process.args, timeout, output=stdout, stderr=stderr)
+
+    def collect(self, test_file: Path) -> List[str]:
+        """Node ids of the tests in test_file; empty if collection fails"""
+        with tempfile.TemporaryDirectory(prefix='agent-tests-') as work_dir:
+            return self._collect(test_file, work_dir)
+
+    def _collect(self, test_file: Path, work_dir: str) -> List[str]:
+        # Node ids come from the plugin rather than pytest's text output, which
+        # cannot be split reliably (parametrize ids may contain spaces)
+        collect_path = os.path.join(work_dir, 'collect.json')
+        returncode, output = self._pytest(
+            ['-p', PLUGIN_NAME, '--agent-collect', collect_path, '--collect-only', '-q', str(test_file)],
+            self.per_test_timeout + 60, work_dir, 'collect'
+        )
+        try:
+            with open(collect_path, 'r', encoding='utf-8') as f:
+                node_ids = json.load(f)
+        except (OSError, ValueError):
+            node_ids = []
+        if returncode not in (0, 5) and not node_ids:
+            self.logger.warning(f"Test collection failed for {test_file} (exit {returncode})")
+        return node_ids
+
+    def _shard(self, node_ids: List[str], shards: int) -> List[List[str]]:
+        buckets = [[] for _ in range(shards)]
+        for i, node_id in enumerate(node_ids):
+            buckets[i % shards].append(node_id)
+        return [bucket for bucket in buckets if bucket]
+
+    def _run_shard(self, index: int, targets: List[str], expected: int, work_dir: str) -> Dict:
+        report_path = os.path.join(work_dir, f"shard-{index}.json")
+        args = [
+            '-p', PLUGIN_NAME, '--agent-report', report_path, '--agent-timeout', str(self.per_test_timeout),
+        ] + (['--agent-coverage'] if self.impact is not None else []) + self.pytest_args + targets
+        # Hard limit in case a test hangs somewhere SIGALRM cannot interrupt it
+        hard_timeout = self.per_test_timeout * max(expected, 1) + 60
+
+        killed = False
+        try:
+            returncode, output = self._pytest(args, hard_timeout, work_dir, f"shard-{index}")
+        except subprocess.TimeoutExpired as e:
+            killed = True
+            returncode = None
+            partial = e.stdout.decode(errors='replace') if isinstance(e.stdout, bytes) else (e.stdout or '')
+            output = f"{partial}\nShard {index} killed after {hard_timeout:.0f}s"
+            self.logger.error(f"Test shard {index} exceeded its {hard_timeout:.0f}s limit and was killed")
+
+        tests = []
+        finished = False
+        try:
+            with open(report_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    if 'exitstatus' in record:
+                        finished = True
+                    else:
+                        tests.append(record)
+        except (OSError, ValueError):
+            pass
+
+        if not finished:
+            # The process died mid-run: whatever did not report was killed by the
+            # timeout, or crashed/never ran because a test took the process down
+            reported = {test['nodeid'] for test in tests}
+            for node_id in targets:
+                if '::' in node_id and node_id not in reported:
+                    tests.append({
+                        'nodeid': node_id, 'outcome': 'timeout' if killed else 'error', 'duration': 0.0,
+                        'when': None, 'longrepr': None,
+                        'message': 'Test did not report a result before its shard was stopped' if killed
+                        else f"Test process exited (code {returncode}) before this test reported a result",
+                    })
+        return {'tests': tests, 'output': output}
+
+    def run(self, test_file: Path, node_ids: Optional[List[str]] = None) -> TestReport:
+        """Run test_file (or just node_ids) and return the merged report"""
+        test_file = Path(test_file)
+        with tracing.span('tests.run', {'tests.file': test_file.name}) as span:
+            report = self._run(test_file, node_ids, span)
+            if tracing.tracing_enabled():
+                span.add('tests.total', len(report.tests))
+                for outcome, count in report.counts.items():
+                    if count:
+                        span.add(f'tests.{outcome}', count)
+                span.add('tests.duration_s', sum(test.get('duration') or 0.0 for test in report.tests))
+            return report
+
+    def _run(self, test_file: Path, node_ids: Optional[List[str]], span) -> TestReport:
+        start = time.perf_counter()
+        key = None
+        if self.cache is not None and not self.force_full:
+            # Keyed on the state before the run, since tests may write files into the checkout.
+            # A report cached without coverage would leave an attached impact map empty
+            key = self.cache.make_key(self.repo_path, test_file, node_ids, {
+                'pytest_args': self.pytest_args, 'per_test_timeout': self.per_test_timeout,
+                'coverage': self.impact is not None,
+            })
+            cached = self.cache.get(key)
+            if cached is not None:
+                span.set_attribute('tests.cached', True)
+                self._save(cached)
+                self.logger.info(
+                    f"Reusing cached results for {test_file.name} (checked in {time.perf_counter() - start:.3f}s): "
+                    f"{cached.summary()}"
+                )
+                return cached
+
+        with tempfile.TemporaryDirectory(prefix='agent-tests-') as work_dir:
+            if node_ids is None:
+                node_ids = self._collect(test_file, work_dir)
+            run_ids, reused = node_ids, []
+            if self.impact is not None and node_ids:
+                run_ids, reused = self.impact.select(self.repo_path, test_file, node_ids, self.force_full)
+            shards = self._shard(run_ids, min(self.workers, len(run_ids))) if run_ids else []
+            if not shards and not reused:
+                # Nothing collected (or collection failed): one run of the whole file reports why
+                shards = [[str(test_file)]]
+            span.set_attributes({'tests.selected': len(run_ids), 'tests.reused': len(reused), 'tests.shards': len(shards)})
+
+            shard_results = []
+            if shards:
+                self.logger.info(
+                    f"Running {len(run_ids)} tests from {test_file.name} in {len(shards)} shard(s)"
+                    f"{' on the warm worker' if self.worker is not None else ''}"
+                )
+                with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+                    futures = [
+                        pool.submit(self._run_shard, i, targets, len(targets), work_dir)
+                        for i, targets in enumerate(shards)
+                    ]
+                    shard_results = [future.result() for future in futures]
+
+        tests = []
+        seen = set()
+        for result in shard_results:
+            for test in result['tests']:
+                if test['nodeid'] not in seen:
+                    seen.add(test['nodeid'])
+                    tests.append(test)
+        if self.impact is not None:
+            if node_ids:
+                self.impact.update(self.repo_path, tests)
+            for test in tests:
+                test.pop('coverage', None)
+            tests.extend(test for test in reused if test['nodeid'] not in seen)
+        order = {node_id: i for i, node_id in enumerate(node_ids)}
+        tests.sort(key=lambda test: order.get(test['nodeid'], len(order)))
+
+        report = TestReport(
+            tests=tests,
+            output="\n".join(result['output'] for result in shard_results),
+            duration=time.perf_counter() - start,
+            shards=len(shards),
+        )
+        self._save(report)
+        if key is not None:
+            self.cache.put(key, report)
+        self.logger.info(f"Test run finished: {report.summary()}")
+        return report
+
+    def _save(self, report: TestReport):
+        try:
+            state_dir = ensure_state_dir(self.repo_path)
+            with open(state_dir / 'test_report.json', 'w', encoding='utf-8') as f:
+                json.dump(report.to_dict(), f, indent=2)
+        except OSError as e:
+            self.logger.warning(f"Could not save test report: {str(e)}")
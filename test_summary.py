@@ -0,0 +1,111 @@
+import re
+from typing import Dict, List, Tuple
+
+from context_selector import CHARS_PER_TOKEN, estimate_tokens
+from test_runner import OUTCOMES, TestReport
+
+DEFAULT_DIGEST_TOKENS = 1500
+MAX_DETAIL_LINES = 12
+MAX_IDS_PER_GROUP = 5
+# Order in which failure groups are reported: collection errors block every test
+_OUTCOME_ORDER = {'error': 0, 'failed': 1, 'timeout': 2}
+
+
+def _details(test: Dict) -> List[str]:
+    """pytest's 'E' explanation lines for a failure, or its crash message"""
+    longrepr = test.get('longrepr') or ''
+    lines = [line[1:].strip() for line in longrepr.splitlines() if line.startswith('E ')]
+    if not lines and test.get('message'):
+        lines = test['message'].strip().splitlines()
+    return [line for line in lines if line]
+
+
+def _normalize(text: str) -> str:
+    """Drop the parts of a message that differ between otherwise identical failures"""
+    text = re.sub(r'0x[0-9a-fA-F]+', '0x?', text)
+    return re.sub(r'\d+(\.\d+)?', '#', text)
+
+
+def _signature(test: Dict) -> Tuple:
+    details = _details(test)
+    frames = test.get('frames') or []
+    innermost = (frames[-1]['path'], frames[-1]['function']) if frames else None
+    return (
+        test['outcome'], test.get('when') == 'collect', test.get('exception'),
+        _normalize(details[0]) if details else None, innermost,
+    )
+
+
+def _format_group(tests: List[Dict], compact: bool = False) -> str:
+    first = tests[0]
+    details = _details(first)
+    headline = details[0] if details else 'no message'
+    exception = first.get('exception')
+    if exception and not headline.split(':')[0].endswith(exception.split('.')[-1]):
+        headline = f"{exception}: {headline}"
+    kind = 'collection error' if first.get('when') == 'collect' else first['outcome']
+    count = f" ({len(tests)} tests)" if len(tests) > 1 else ""
+
+    lines = [f"[{kind}] {headline[:300]}{count}"]
+    ids = [test['nodeid'] for test in tests[:MAX_IDS_PER_GROUP]]
+    more = f", ... {len(tests) - len(ids)} more" if len(tests) > len(ids) else ""
+    lines.append(f"  tests: {', '.join(ids)}{more}")
+    if compact:
+        return '\n'.join(lines)
+
+    frames = first.get('frames') or []
+    if frames:
+        lines.append("  traceback (innermost last):")
+        for frame in frames:
+            lines.append(f"    {frame['path']}:{frame['line']} in {frame['function']}: {frame['code']}")
+    if len(details) > 1:
+        lines.append("  details:")
+        shown = details[1:MAX_DETAIL_LINES + 1]
+        lines.extend(f"    {line[:200]}" for line in shown)
+        if len(details) - 1 > len(shown):
+            lines.append(f"    ... {len(details) - 1 - len(shown)} more lines")
+    return '\n'.join(lines)
+
+
+def summarize_failures(report: TestReport, max_tokens: int = DEFAULT_DIGEST_TOKENS) -> str:
+    """
+    Compact digest of a test run for prompts: one entry per distinct failure
+    (test ids, exception, repository frames and pytest's explanation), largest
+    groups first, cut off at max_tokens. Timings are left out so the digest of
+    an unchanged run is byte-identical.
+    """
+    counts = report.counts
+    parts = [f"{counts[o]} {o}" for o in OUTCOMES if counts[o]] or ["no tests ran"]
+    header = f"Test results: {', '.join(parts)}"
+
+    if not report.tests:
+        # Nothing reported (e.g. pytest could not start): the tail of the raw output says why
+        budget = max(0, max_tokens - estimate_tokens(header)) * CHARS_PER_TOKEN
+        tail = report.output.strip()[-budget:] if budget else ''
+        return f"{header}\n\n{tail}" if tail else header
+
+    groups: Dict[Tuple, List[Dict]] = {}
+    for test in report.tests:
+        if test['outcome'] in _OUTCOME_ORDER:
+            groups.setdefault(_signature(test), []).append(test)
+    ordered = sorted(
+        groups.values(),
+        key=lambda tests: (tests[0].get('when') != 'collect', _OUTCOME_ORDER[tests[0]['outcome']], -len(tests))
+    )
+
+    digest = [header]
+    used = estimate_tokens(header)
+    for i, tests in enumerate(ordered):
+        remaining = len(ordered) - i - 1
+        reserve = estimate_tokens(f"... {remaining} more distinct failures omitted") if remaining else 0
+        for compact in (False, True):
+            text = _format_group(tests, compact)
+            cost = estimate_tokens(text) + 1
+            if used + cost + reserve <= max_tokens:
+                digest.append(text)
+                used += cost
+                break
+        else:
+            digest.append(f"... {len(ordered) - i} more distinct failures omitted")
+            break
+    return '\n\n'.join(digest)
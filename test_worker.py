@@ -0,0 +1,375 @@
+"""
+Warm pytest worker for a checkout (fork server).
+
+The worker process imports pytest and the target repository's third-party
+dependencies once, then forks a fresh child for every pytest run requested
+over a local Unix socket. Children start with those imports already in memory
+and never import the repository's own modules in the parent, so each run
+still sees the current code on disk.
+
+The worker's stdin stays open as a control pipe: when the agent process exits
+or crashes the pipe reaches EOF, and the worker kills its running children and
+exits, so no fork server outlives the agent that started it.
+"""
+import io
+import os
+import ast
+import sys
+import json
+import time
+import atexit
+import select
+import shutil
+import signal
+import logging
+import argparse
+import tempfile
+import importlib
+import threading
+import subprocess
+from pathlib import Path
+from multiprocessing.connection import Client, Listener
+from typing import Dict, List, Optional, Set
+
+from codebase_index import get_codebase_index
+
+AGENT_DIR = Path(__file__).resolve().parent
+STARTUP_TIMEOUT = 120.0
+# Always warmed, along with the repository's third-party dependencies
+BASE_IMPORTS = ['pytest', '_pytest.python', '_pytest.assertion.rewrite']
+
+
+# How often a waiting run checks whether it was cancelled
+POLL_INTERVAL = 0.1
+
+
+class WorkerError(Exception):
+    """Raised when the warm worker cannot be started or a run cannot be handed to it"""
+
+
+class RunCancelled(Exception):
+    """Raised when a pytest run is stopped because its cancel event was set"""
+
+
+def discover_dependencies(repo_path: Path) -> List[str]:
+    """Top-level third-party modules imported anywhere in a checkout"""
+    repo_path = Path(repo_path).resolve()
+    files = get_codebase_index(repo_path).scan()
+    local: Set[str] = set()
+    imported: Set[str] = set()
+    for file in files:
+        parts = file.path[:-3].split('/')
+        local.update(parts if parts[-1] != '__init__' else parts[:-1])
+        try:
+            tree = ast.parse(file.content, filename=file.path)
+        except (SyntaxError, ValueError, OSError):
+            continue
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                imported.update(alias.name.split('.')[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                imported.add(node.module.split('.')[0])
+    stdlib = getattr(sys, 'stdlib_module_names', set())
+    return sorted(
+        name for name in imported
+        if name not in local and name not in stdlib and name not in sys.builtin_module_names
+    )
+
+
+class WarmTestWorker:
+    """
+    Client side of the fork server. run_pytest() is safe to call from several
+    threads at once; every call gets its own forked child.
+    """
+
+    def __init__(self, repo_path: Path, dependencies: Optional[List[str]] = None,
+                 env: Optional[Dict[str, str]] = None):
+        self.repo_path = Path(repo_path).resolve()
+        self.dependencies = dependencies
+        self.env = env
+        self.logger = logging.getLogger(__name__)
+        self.preloaded: List[str] = []
+        self._process: Optional[subprocess.Popen] = None
+        self._socket_dir: Optional[str] = None
+        self._address: Optional[str] = None
+        self._authkey: Optional[bytes] = None
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        """Start the worker and wait until its imports are done"""
+        with self._lock:
+            if self.alive:
+                return
+            self._stop()
+            if not hasattr(os, 'fork'):
+                raise WorkerError("The warm test worker needs os.fork")
+
+            dependencies = self.dependencies if self.dependencies is not None else discover_dependencies(self.repo_path)
+            self._socket_dir = tempfile.mkdtemp(prefix='agent-worker-')
+            self._address = os.path.join(self._socket_dir, 'worker.sock')
+            self._authkey = os.urandom(32)
+            start = time.perf_counter()
+            self._process = subprocess.Popen(
+                [sys.executable, str(AGENT_DIR / 'test_worker.py'), '--repo', str(self.repo_path),
+                 '--address', self._address],
+                cwd=self.repo_path, env=self.env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+            # The auth key travels over stdin so it never shows up in the process list. stdin
+            # then stays open: the worker exits once it closes, i.e. when we exit or crash
+            self._process.stdin.write(json.dumps({
+                'authkey': self._authkey.hex(), 'imports': BASE_IMPORTS + dependencies,
+            }).encode('utf-8') + b'\n')
+            self._process.stdin.flush()
+
+            ready, _, _ = select.select([self._process.stdout], [], [], STARTUP_TIMEOUT)
+            line = self._process.stdout.readline() if ready else b''
+            try:
+                status = json.loads(line)
+            except ValueError:
+                self._stop()
+                raise WorkerError(f"Test worker for {self.repo_path} did not start")
+            self.preloaded = status.get('preloaded', [])
+            self.logger.info(
+                f"Started warm test worker for {self.repo_path} in {time.perf_counter() - start:.2f}s "
+                f"({len(self.preloaded)} modules preloaded, failed: {status.get('failed') or 'none'})"
+            )
+
+    def run_pytest(self, args: List[str], output_path: str, timeout: float,
+                   cwd: Optional[Path] = None, env: Optional[Dict[str, str]] = None,
+                   cancel: Optional[threading.Event] = None) -> int:
+        """
+        Run pytest.main(args) in a forked child with stdout/stderr going to output_path.
+        Returns pytest's exit code; raises subprocess.TimeoutExpired after killing
+        a child that outlives timeout, RunCancelled after killing one whose cancel
+        event was set, or WorkerError if the run could not be started.
+        """
+        if not self.alive:
+            self.start()
+        request = {
+            'args': list(args), 'output': str(output_path), 'cwd': str(cwd or self.repo_path),
+            'env': dict(env) if env is not None else None,
+        }
+        try:
+            conn = Client(self._address, family='AF_UNIX', authkey=self._authkey)
+        except (OSError, EOFError) as e:
+            raise WorkerError(f"Could not reach test worker: {str(e)}")
+
+        with conn:
+            try:
+                conn.send(request)
+                pid = conn.recv()['pid']
+            except (OSError, EOFError) as e:
+                raise WorkerError(f"Test worker did not accept the run: {str(e)}")
+            deadline = time.monotonic() + timeout
+            try:
+                while not conn.poll(POLL_INTERVAL):
+                    if cancel is not None and cancel.is_set():
+                        self._kill(pid)
+                        raise RunCancelled("Test run cancelled")
+                    if time.monotonic() > deadline:
+                        self._kill(pid)
+                        raise subprocess.TimeoutExpired(args, timeout)
+                return conn.recv()['exit']
+            except EOFError:
+                # The child died without reporting (e.g. a test called os._exit or segfaulted)
+                return -1
+
+    def _kill(self, pid: int):
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    def _stop(self):
+        if self._process is not None:
+            try:
+                self._process.stdin.close()
+            except OSError:
+                pass
+            if self._process.poll() is None:
+                self._process.terminate()
+                try:
+                    self._process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self._process.kill()
+                    self._process.wait()
+            self._process.stdout.close()
+            self._process = None
+        if self._socket_dir:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+            self._socket_dir = None
+
+    def close(self):
+        """Stop the worker process"""
+        with self._lock:
+            self._stop()
+
+
+_workers: Dict[Path, WarmTestWorker] = {}
+_workers_lock = threading.Lock()
+
+
+def get_test_worker(repo_path: Path, env: Optional[Dict[str, str]] = None) -> WarmTestWorker:
+    """Return the shared warm worker for a checkout; it is started on first use"""
+    key = Path(repo_path).resolve()
+    with _workers_lock:
+        if key not in _workers:
+            _workers[key] = WarmTestWorker(key, env=env)
+        return _workers[key]
+
+
+def close_test_worker(repo_path: Path):
+    """Stop the shared worker for a checkout, if one was started"""
+    with _workers_lock:
+        worker = _workers.pop(Path(repo_path).resolve(), None)
+    if worker is not None:
+        worker.close()
+
+
+@atexit.register
+def close_test_workers():
+    """Stop every shared worker"""
+    with _workers_lock:
+        for worker in _workers.values():
+            worker.close()
+        _workers.clear()
+
+
+def _run_child(request: Dict):
+    """Body of a forked child: run pytest as if started fresh in request['cwd']"""
+    fd = os.open(request['output'], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    os.close(fd)
+    sys.stdin = io.StringIO()
+    if request['env'] is not None:
+        os.environ.clear()
+        os.environ.update(request['env'])
+    os.chdir(request['cwd'])
+    sys.path.insert(0, request['cwd'])
+    sys.argv = ['pytest'] + request['args']
+
+    import pytest
+    return int(pytest.main(request['args']))
+
+
+def _plugin_packages() -> Set[str]:
+    """
+    Top-level modules of installed pytest plugin distributions. pytest marks
+    these for assertion rewriting, so they must not be imported ahead of it.
+    """
+    from importlib.metadata import distributions
+    packages = set()
+    for dist in distributions():
+        if not any(entry_point.group == 'pytest11' for entry_point in dist.entry_points):
+            continue
+        for file in dist.files or ():
+            parts = file.parts
+            if len(parts) == 1 and parts[0].endswith('.py'):
+                packages.add(parts[0][:-3])
+            elif len(parts) == 2 and parts[1] == '__init__.py':
+                packages.add(parts[0])
+    return packages
+
+
+def _exit_on_eof(control, children: Set[int]):
+    """Wait for the control pipe to close, then kill the running children and exit"""
+    try:
+        while control.read(4096):
+            pass
+    except (OSError, ValueError):
+        pass
+    for pid in list(children):
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+    os._exit(0)
+
+
+def serve(repo_path: str, address: str, authkey: bytes, imports: List[str], control=None):
+    """Preload imports, then fork a child per request until terminated or control reaches EOF"""
+    os.chdir(repo_path)
+    plugin_packages = _plugin_packages()
+    preloaded, failed = [], []
+    for name in imports:
+        if name.split('.')[0] in plugin_packages:
+            continue
+        try:
+            importlib.import_module(name)
+            preloaded.append(name)
+        except BaseException:
+            failed.append(name)
+
+    listener = Listener(address, family='AF_UNIX', backlog=64, authkey=authkey)
+    sys.stdout.write(json.dumps({'preloaded': preloaded, 'failed': failed}) + '\n')
+    sys.stdout.flush()
+
+    # Process groups of the children still running
+    children: Set[int] = set()
+    if control is not None:
+        threading.Thread(target=_exit_on_eof, args=(control, children), name='control-pipe', daemon=True).start()
+
+    while True:
+        try:
+            conn = listener.accept()
+        except (OSError, EOFError):
+            # A client that failed authentication or went away; keep serving
+            continue
+        try:
+            request = conn.recv()
+        except (OSError, EOFError):
+            conn.close()
+            continue
+
+        pid = os.fork()
+        if pid == 0:
+            code = 4
+            try:
+                # Lead a new process group before reporting the pid, so the
+                # client can always kill the run with killpg(pid)
+                os.setsid()
+                conn.send({'pid': os.getpid()})
+                code = _run_child(request)
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+            finally:
+                try:
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                    conn.send({'exit': code})
+                finally:
+                    os._exit(code)
+        children.add(pid)
+        conn.close()
+        # Reap children that have finished since the last request
+        try:
+            while True:
+                finished = os.waitpid(-1, os.WNOHANG)[0]
+                if not finished:
+                    break
+                children.discard(finished)
+        except ChildProcessError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm pytest fork server for one checkout")
+    parser.add_argument('--repo', required=True)
+    parser.add_argument('--address', required=True)
+    args = parser.parse_args()
+    control = sys.stdin.buffer
+    config = json.loads(control.readline())
+    serve(args.repo, args.address, bytes.fromhex(config['authkey']), config['imports'], control)
+
+
+if __name__ == "__main__":
+    main()
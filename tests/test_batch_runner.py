@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from batch_runner import BatchRunner, completed_job_ids, latest_results, load_jobs
+
+
+class FakePool:
+    def worktree_paths(self, repo_url):
+        return []
+
+
+def _write_lines(path, lines):
+    path.write_text(''.join(line + '\n' for line in lines), encoding='utf-8')
+    return path
+
+
+def _runner(tmp_path, statuses, ran):
+    runner = BatchRunner(tmp_path / 'results.jsonl', workers=2, repo_pool=FakePool())
+
+    def run_job(job):
+        ran.append(job['id'])
+        record = {'job_id': job['id'], 'status': statuses.get(job['id'], 'succeeded')}
+        runner._write_result(record)
+        return record
+
+    runner.run_job = run_job
+    return runner
+
+
+def test_load_jobs_assigns_ids_and_drops_duplicates(tmp_path):
+    jobs_path = _write_lines(tmp_path / 'jobs.jsonl', [
+        json.dumps({'id': 'a', 'repo_url': 'repo1', 'feature_description': 'first'}),
+        '',
+        json.dumps({'repo_url': 'repo1', 'feature_description': 'second'}),
+        json.dumps({'repo_url': 'repo1', 'feature_description': 'second'}),
+        json.dumps({'repo_url': 'repo1', 'feature_description': 'second', 'ref': 'v2'}),
+    ])
+
+    jobs = load_jobs(jobs_path)
+
+    assert [job['feature_description'] for job in jobs] == ['first', 'second', 'second']
+    assert jobs[0]['id'] == 'a'
+    assert len({job['id'] for job in jobs}) == 3
+
+
+@pytest.mark.parametrize('line, message', [
+    ('{"repo_url": "repo1"', 'invalid JSON'),
+    ('{"repo_url": "repo1"}', 'repo_url and feature_description are required'),
+])
+def test_load_jobs_reports_the_bad_line(tmp_path, line, message):
+    jobs_path = _write_lines(tmp_path / 'jobs.jsonl', [
+        json.dumps({'repo_url': 'repo1', 'feature_description': 'ok'}), line,
+    ])
+
+    with pytest.raises(ValueError, match=f"jobs.jsonl:2: {message}"):
+        load_jobs(jobs_path)
+
+
+def test_last_record_of_a_job_wins(tmp_path):
+    results_path = _write_lines(tmp_path / 'results.jsonl', [
+        json.dumps({'job_id': 'a', 'status': 'failed', 'error': 'boom'}),
+        json.dumps({'job_id': 'b', 'status': 'succeeded'}),
+        json.dumps({'job_id': 'a', 'status': 'succeeded'}),
+        json.dumps({'job_id': 'b', 'status': 'failed'}),
+        '{"job_id": "c", "sta',  # cut short by a crash
+    ])
+
+    assert {job_id: record['status'] for job_id, record in latest_results(results_path).items()} == {
+        'a': 'succeeded', 'b': 'failed',
+    }
+    assert completed_job_ids(results_path) == {'a'}
+    assert completed_job_ids(tmp_path / 'missing.jsonl') == set()
+
+
+def test_resume_reruns_only_jobs_without_a_successful_record(tmp_path):
+    jobs = [
+        {'id': job_id, 'repo_url': repo_url, 'feature_description': job_id}
+        for job_id, repo_url in [('a', 'repo1'), ('b', 'repo1'), ('c', 'repo2')]
+    ]
+    first_ran, second_ran = [], []
+
+    first = _runner(tmp_path, {'b': 'failed'}, first_ran).run(jobs)
+    second = _runner(tmp_path, {}, second_ran).run(jobs)
+
+    assert sorted(first_ran) == ['a', 'b', 'c']
+    assert first == {'succeeded': 2, 'failed': 1, 'skipped': 0}
+    assert second_ran == ['b']
+    assert second == {'succeeded': 1, 'failed': 0, 'skipped': 2}
+    assert completed_job_ids(tmp_path / 'results.jsonl') == {'a', 'b', 'c'}
+    assert len((tmp_path / 'results.jsonl').read_text(encoding='utf-8').splitlines()) == 4
@@ -0,0 +1,15 @@
+from benchmark import (IMPLEMENTATION_PROMPT_MARKER, TEST_PROMPT_MARKER, THOUGHT_RESPONSE, make_fake_server,
+                       synthetic_implementation, synthetic_tests)
+from test_generation_agent import CODER_MODEL, THOUGHT_MODEL
+
+TEST_PROMPT = f"You are an expert Python developer specializing in {TEST_PROMPT_MARKER} (TDD). ..."
+
+
+def test_fake_server_tells_the_think_prompt_from_the_test_prompt():
+    server = make_fake_server(files=3, file_lines=20, tests=2)
+    think_prompt = TEST_PROMPT + "** Generate the throught process for the given prompt**"
+
+    assert server.respond(THOUGHT_MODEL, think_prompt) == (THOUGHT_RESPONSE, TEST_PROMPT_MARKER)
+    assert server.respond(CODER_MODEL, TEST_PROMPT + THOUGHT_RESPONSE)[0] == synthetic_tests(3, 2)
+    assert server.respond(CODER_MODEL, f"... {IMPLEMENTATION_PROMPT_MARKER} to make the tests pass")[0] == \
+        synthetic_implementation(20)
@@ -0,0 +1,33 @@
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+import pytest
+
+CLI = Path(__file__).resolve().parent.parent / 'cli.py'
+HEAVY_MODULES = ('httpx', 'git', 'code_generation_agent', 'test_generation_agent', 'context_selector')
+
+
+def _loaded_modules(args):
+    """Heavy modules imported by running the CLI with args in a fresh interpreter"""
+    script = (
+        f"import runpy, sys; sys.argv = [{str(CLI)!r}] + {args!r}\n"
+        f"try:\n    runpy.run_path({str(CLI)!r}, run_name='__main__')\nexcept SystemExit:\n    pass\n"
+        f"print('loaded:' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+    return result.stdout.strip().splitlines()[-1]
+
+
+@pytest.mark.parametrize('args', [['--help'], ['implement', '--help']])
+def test_help_does_not_import_the_agents(args):
+    assert _loaded_modules(args) == 'loaded:'
+
+
+def test_finished_batch_does_not_import_the_agents(tmp_path):
+    jobs, results = tmp_path / 'jobs.jsonl', tmp_path / 'results.jsonl'
+    jobs.write_text(json.dumps({'id': 'done', 'repo_url': 'file:///nonexistent', 'feature_description': 'noop'}) + '\n')
+    results.write_text(json.dumps({'job_id': 'done', 'status': 'succeeded'}) + '\n')
+
+    assert _loaded_modules(['--log-level', 'WARNING', 'run-batch', str(jobs), '--results', str(results)]) == 'loaded:'
@@ -0,0 +1,49 @@
+from code_blocks import CodeBlockStreamParser, check_syntax
+
+
+def _parse(deltas):
+    blocks = []
+    parser = CodeBlockStreamParser(lambda path, content: blocks.append((path, content)))
+    for delta in deltas:
+        parser.feed(delta)
+    parser.close()
+    return blocks
+
+
+def test_named_and_unnamed_blocks():
+    text = "Intro\n```python:pkg/mod.py\nx = 1\n```\nand\n```python\ny = 2\n```\n"
+
+    assert _parse([text]) == [('pkg/mod.py', 'x = 1'), (None, 'y = 2')]
+
+
+def test_fences_split_across_deltas():
+    text = "```python:a.py\ndef f():\n    return 1\n```\n```python:b.py\nz = 3\n```"
+    deltas = [text[i:i + 3] for i in range(0, len(text), 3)]
+
+    assert _parse(deltas) == [('a.py', 'def f():\n    return 1'), ('b.py', 'z = 3')]
+
+
+def test_blocks_are_emitted_as_they_close():
+    blocks = []
+    parser = CodeBlockStreamParser(lambda path, content: blocks.append(path))
+    parser.feed("```python:a.py\nx = 1\n``")
+    assert blocks == []
+    parser.feed("`\n```python:b.py\n")
+    assert blocks == ['a.py']
+
+
+def test_new_fence_closes_the_open_block_and_unterminated_block_is_dropped():
+    text = "```python:a.py\nx = 1\n```python:b.py\ny = 2\n"
+
+    assert _parse([text]) == [('a.py', 'x = 1')]
+
+
+def test_paths_outside_the_repository_are_unnamed():
+    text = "```python:../../evil.py\nx = 1\n```\n```python:/tmp/evil.py\ny = 2\n```\n"
+
+    assert _parse([text]) == [(None, 'x = 1'), (None, 'y = 2')]
+
+
+def test_check_syntax():
+    assert check_syntax('ok.py', 'x = 1\n') is None
+    assert check_syntax('bad.py', 'def f(:\n').startswith('bad.py:1:')
@@ -0,0 +1,56 @@
+from code_generation_agent import FeatureImplementer
+
+
+def _implementer(tmp_path, **options):
+    return FeatureImplementer('file:///unused', 'feature', 'key', repo_path=tmp_path, **options)
+
+
+def test_patch_edits_outside_the_checkout_are_ignored(tmp_path):
+    repo = tmp_path / 'repo'
+    repo.mkdir()
+    (repo / 'mod.py').write_text('a = 1\n')
+    outside = tmp_path / 'evil.py'
+    outside.write_text('a = 1\n')
+    response = (
+        f"{outside}\n<<<<<<< SEARCH\na = 1\n=======\na = 2\n>>>>>>> REPLACE\n"
+        "../evil.py\n<<<<<<< SEARCH\na = 1\n=======\na = 3\n>>>>>>> REPLACE\n"
+        "mod.py\n<<<<<<< SEARCH\na = 1\n=======\na = 4\n>>>>>>> REPLACE\n"
+    )
+
+    written = _implementer(repo, edit_format='patch').apply_implementation_edits(repo, 'prompt', response)
+
+    assert written == [(repo / 'mod.py').resolve()]
+    assert (repo / 'mod.py').read_text() == 'a = 4\n'
+    assert outside.read_text() == 'a = 1\n'
+
+
+def test_full_mode_skips_files_outside_the_checkout_and_repeated_paths(tmp_path):
+    repo = tmp_path / 'repo'
+    repo.mkdir()
+    (repo / 'link').symlink_to(tmp_path, target_is_directory=True)
+    response = (
+        "```python:mod.py\nx = 1\n```\n"
+        "```python:../../evil.py\nx = 2\n```\n"
+        "```python:link/evil.py\nx = 2\n```\n"
+        "```python:mod.py\nx = 3\n```\n"
+        "```python:broken.py\ndef f(:\n```\n"
+    )
+    implementer = _implementer(repo)
+
+    written = implementer.write_implementation_files(repo, iter(response[i:i + 7] for i in range(0, len(response), 7)))
+
+    assert sorted(path.name for path in written) == ['new_broken.py', 'new_mod.py']
+    assert (repo / 'new_mod.py').read_text() == 'x = 3'
+    assert not (tmp_path / 'evil.py').exists() and not (repo / 'new_link').exists()
+    assert [error.split(':')[0] for error in implementer.syntax_errors] == ['new_broken.py']
+
+
+def test_streamed_output_tokens_match_the_whole_response_estimate(tmp_path):
+    from context_selector import estimate_tokens
+
+    response = "```python:mod.py\n" + "x = 1\n" * 101 + "```\n"
+    implementer = _implementer(tmp_path)
+
+    implementer.write_implementation_files(tmp_path, iter(response[i:i + 5] for i in range(0, len(response), 5)))
+
+    assert implementer.output_tokens == {'full': estimate_tokens(response)}
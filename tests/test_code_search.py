@@ -0,0 +1,92 @@
+import code_search
+from code_search import CodeSearchIndex
+
+FILES = {
+    'pkg/config.py': (
+        'def parse_config(path):\n'
+        '    """Parse the config file into settings"""\n'
+        '    return load_settings(path)\n'
+        '\n\n'
+        'def load_settings(path):\n'
+        '    return open(path).read()\n'
+    ),
+    'pkg/report.py': (
+        'class ReportWriter:\n'
+        '    def write_table(self, rows):\n'
+        '        return "\\n".join(rows)\n'
+    ),
+}
+
+
+def _entries(files, shas=None):
+    return [
+        {'path': path, 'sha256': (shas or {}).get(path, f"sha-{path}"), 'content': content}
+        for path, content in files.items()
+    ]
+
+
+def _record_chunking(monkeypatch):
+    chunked = []
+    real_chunk_source = code_search.chunk_source
+
+    def chunk_source(path, source):
+        chunked.append(path)
+        return real_chunk_source(path, source)
+
+    monkeypatch.setattr(code_search, 'chunk_source', chunk_source)
+    return chunked
+
+
+def test_search_ranks_the_matching_chunk_first(tmp_path):
+    index = CodeSearchIndex(tmp_path)
+    index.update(_entries(FILES))
+
+    hits = index.search('parse config settings')
+    assert (hits[0]['path'], hits[0]['name'], hits[0]['kind']) == ('pkg/config.py', 'parse_config', 'function')
+    assert [hit['score'] for hit in hits] == sorted((hit['score'] for hit in hits), reverse=True)
+
+    assert index.search('write table rows')[0]['name'] == 'ReportWriter'
+    assert index.search('unrelated words') == []
+
+
+def test_update_rechunks_only_files_whose_hash_changed(tmp_path, monkeypatch):
+    index = CodeSearchIndex(tmp_path)
+    chunked = _record_chunking(monkeypatch)
+    assert index.update(_entries(FILES)) == 2
+
+    chunked.clear()
+    files = dict(FILES, **{'pkg/report.py': 'def export_csv(rows):\n    return rows\n'})
+    assert index.update(_entries(files, {'pkg/report.py': 'sha-new'})) == 1
+
+    assert chunked == ['pkg/report.py']
+    assert index.search('export csv')[0]['name'] == 'export_csv'
+    assert index.search('write table') == []
+
+
+def test_removed_files_drop_out_of_the_index(tmp_path):
+    index = CodeSearchIndex(tmp_path)
+    index.update(_entries(FILES))
+
+    assert index.update(_entries({'pkg/config.py': FILES['pkg/config.py']})) == 0
+    assert {hit['path'] for hit in index.search('parse config write table')} == {'pkg/config.py'}
+
+
+def test_index_round_trips_through_disk(tmp_path, monkeypatch):
+    first = CodeSearchIndex(tmp_path)
+    first.update(_entries(FILES))
+    expected = first.search('parse config')
+
+    chunked = _record_chunking(monkeypatch)
+    reloaded = CodeSearchIndex(tmp_path)
+    assert reloaded.search('parse config') == []  # not built until the first update
+
+    assert reloaded.update(_entries(FILES)) == 0
+    assert chunked == []
+    assert reloaded.search('parse config') == expected
+
+
+def test_oversized_files_are_left_out(tmp_path):
+    index = CodeSearchIndex(tmp_path)
+    index.update(_entries(FILES), max_file_bytes=len(FILES['pkg/report.py']))
+
+    assert {hit['path'] for hit in index.search('parse config write table')} == {'pkg/report.py'}
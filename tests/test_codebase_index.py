@@ -0,0 +1,121 @@
+import os
+
+import codebase_index
+from codebase_index import CodebaseIndex, GitIgnore, source_size
+
+
+def _write(root, rel, text='x = 1\n'):
+    path = root / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding='utf-8')
+    return path
+
+
+def _paths(files):
+    return sorted(file['path'] for file in files)
+
+
+def _record_hashes(monkeypatch):
+    hashed = []
+    real_hash = codebase_index._hash_file
+
+    def hash_file(path):
+        hashed.append(path.name)
+        return real_hash(path)
+
+    monkeypatch.setattr(codebase_index, '_hash_file', hash_file)
+    return hashed
+
+
+def test_rescan_only_rereads_changed_files(tmp_path, monkeypatch):
+    _write(tmp_path, 'a.py')
+    _write(tmp_path, 'b.py')
+    CodebaseIndex(tmp_path).scan()
+    hashed = _record_hashes(monkeypatch)
+
+    stat = os.stat(tmp_path / 'b.py')
+    _write(tmp_path, 'b.py', 'x = 22\n')
+    os.utime(tmp_path / 'b.py', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    _write(tmp_path, 'c.py')
+    index = CodebaseIndex(tmp_path)  # reloads the persisted index
+    files = index.scan()
+
+    assert sorted(hashed) == ['b.py', 'c.py']
+    assert sorted(index.changed) == ['b.py', 'c.py']
+    assert _paths(files) == ['a.py', 'b.py', 'c.py']
+
+    hashed.clear()
+    (tmp_path / 'a.py').unlink()
+    index.scan()
+    assert hashed == []
+    assert index.removed == ['a.py']
+
+
+def test_touched_but_identical_file_is_not_reported_changed(tmp_path):
+    _write(tmp_path, 'a.py')
+    index = CodebaseIndex(tmp_path)
+    index.scan()
+    os.utime(tmp_path / 'a.py', ns=(0, 10 ** 9))
+
+    index.scan()
+
+    assert index.changed == []
+
+
+def test_scan_skips_vendored_and_virtualenv_dirs(tmp_path):
+    _write(tmp_path, 'pkg/core.py')
+    _write(tmp_path, 'node_modules/lib.py')
+    _write(tmp_path, '.venv/lib/site.py')
+    _write(tmp_path, 'build/lib/pkg/core.py')
+    _write(tmp_path, 'pkg.egg-info/setup.py')
+    _write(tmp_path, 'myenv/pyvenv.cfg', 'home = /usr\n')
+    _write(tmp_path, 'myenv/lib/mod.py')
+
+    assert _paths(CodebaseIndex(tmp_path).scan()) == ['pkg/core.py']
+
+
+def test_scan_honors_nested_gitignores(tmp_path):
+    _write(tmp_path, '.gitignore', 'generated/\n*_pb2.py\n')
+    _write(tmp_path, 'pkg/.gitignore', '/local.py\n')
+    _write(tmp_path, 'pkg/core.py')
+    _write(tmp_path, 'pkg/local.py')
+    _write(tmp_path, 'pkg/sub/local.py')
+    _write(tmp_path, 'pkg/msg_pb2.py')
+    _write(tmp_path, 'generated/api.py')
+
+    assert _paths(CodebaseIndex(tmp_path).scan()) == ['pkg/core.py', 'pkg/sub/local.py']
+
+
+def test_gitignore_subset(tmp_path):
+    (tmp_path / '.gitignore').write_text(
+        '# comment\n'
+        '*.log\n'
+        '!keep.log\n'
+        'docs/**/draft.py\n'
+        'cache/\n'
+        'data?.py\n',
+        encoding='utf-8',
+    )
+    ignore = GitIgnore()
+    ignore.load(tmp_path / '.gitignore', '')
+
+    assert ignore.is_ignored('logs/run.log', is_dir=False)
+    assert not ignore.is_ignored('logs/keep.log', is_dir=False)
+    assert ignore.is_ignored('docs/draft.py', is_dir=False)
+    assert ignore.is_ignored('docs/a/b/draft.py', is_dir=False)
+    assert not ignore.is_ignored('src/docs/draft.py', is_dir=False)
+    assert ignore.is_ignored('cache', is_dir=True)
+    assert not ignore.is_ignored('cache', is_dir=False)
+    assert ignore.is_ignored('data1.py', is_dir=False)
+    assert not ignore.is_ignored('data12.py', is_dir=False)
+
+
+def test_oversized_files_are_indexed_with_their_size(tmp_path):
+    _write(tmp_path, 'huge.py', '# generated\n' * 100000)
+    size = (tmp_path / 'huge.py').stat().st_size
+
+    [entry] = CodebaseIndex(tmp_path).scan()
+    (tmp_path / 'huge.py').unlink()
+
+    assert size > codebase_index.MAX_SOURCE_FILE_BYTES
+    assert source_size(entry) == size  # answered from the index without reading the file
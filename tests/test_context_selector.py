@@ -0,0 +1,93 @@
+from context_selector import ContextBuilder, ContextSelector, estimate_tokens
+
+BIG_BODY = ''.join(f"    total += {i}\n" for i in range(200))
+
+REPO = {
+    'pkg/__init__.py': '',
+    'pkg/core.py': 'from pkg.util import helper\n\n\ndef run():\n    return helper(1)\n',
+    'pkg/util.py': 'def helper(x: int) -> int:\n    return x + 1\n',
+    'pkg/reports.py': (
+        'def render(rows) -> str:\n'
+        '    """Render rows as a table"""\n'
+        '    total = 0\n' + BIG_BODY + '    return str(total)\n'
+        '\n\n'
+        'def export(rows):\n'
+        '    total = 0\n' + BIG_BODY + '    return total\n'
+    ),
+}
+
+
+def _select(token_budget, test_source):
+    files = [{'path': path, 'content': content} for path, content in REPO.items()]
+    sections, report = ContextSelector(files, token_budget=token_budget).select(test_source=test_source)
+    return {s['path']: s for s in sections}, report
+
+
+def _file_block(context):
+    return context.split('```python\n', 1)[1].rsplit('\n```', 1)[0]
+
+
+def test_file_cap_counts_utf8_bytes():
+    line = 'ñ = "é"  # ü\n'  # 13 characters, 17 bytes
+    content = line * 100
+    builder = ContextBuilder(max_total_chars=100000, max_file_bytes=1000)
+
+    assert builder.add_file('mod.py', content)
+    block = _file_block(builder.build())
+    assert len(block.encode('utf-8')) <= 1000
+    assert '# ... truncated' in block
+    assert builder.report()['truncated_files'] == ['mod.py']
+
+
+def test_file_under_the_byte_cap_is_kept_whole():
+    content = 'x = "é"\n' * 50
+    builder = ContextBuilder(max_total_chars=100000, max_file_bytes=len(content.encode('utf-8')))
+
+    assert builder.add_file('mod.py', content)
+    assert _file_block(builder.build()) == content
+    assert builder.report()['truncated_files'] == []
+
+
+def test_files_past_the_total_cap_are_skipped():
+    builder = ContextBuilder(max_total_chars=1000, max_file_bytes=100000)
+
+    assert builder.add_file('a.py', 'a = 1\n' * 140)
+    assert not builder.add_file('b.py', 'b = 1\n' * 100)
+    assert builder.report()['skipped_files'] == ['b.py']
+    assert len(builder.build()) <= 1000
+
+
+def test_selector_pulls_in_modules_imported_by_the_seed():
+    sections, _ = _select(10000, 'from pkg.core import run\n')
+
+    assert sections['pkg/core.py']['kind'] == 'full'
+    assert sections['pkg/util.py']['kind'] == 'full'  # imported by core, never named by the test
+    assert sections['pkg/reports.py']['kind'] == 'stub'  # unrelated, signatures only
+
+
+def test_selector_stubs_replace_bodies_of_files_that_do_not_fit():
+    sections, _ = _select(300, 'from pkg.core import run\n')
+    stub = sections['pkg/reports.py']['content']
+
+    assert 'def render(rows) -> str:\n    """Render rows as a table"""\n    ...' in stub
+    assert 'def export(rows):\n    ...' in stub
+    assert 'total' not in stub
+
+
+def test_selector_sends_only_referenced_symbols_of_a_large_seed():
+    sections, _ = _select(1500, 'from pkg.reports import render\n')
+    section = sections['pkg/reports.py']
+
+    assert section['kind'] == 'partial'
+    assert section['content'].startswith('def render(rows) -> str:')
+    assert 'def export(rows):\n    ...' in section['content']
+    assert section['content'].count('total += 1\n') == 1
+
+
+def test_selector_respects_the_token_budget():
+    for budget in (20, 300, 1500, 10000):
+        sections, report = _select(budget, 'from pkg.reports import render\n')
+
+        assert report['included_tokens'] == sum(s['tokens'] for s in sections.values())
+        assert report['included_tokens'] <= budget
+        assert all(s['tokens'] == estimate_tokens(s['content']) for s in sections.values())
@@ -0,0 +1,95 @@
+from edit_blocks import EditBlock, apply_edit, apply_edits, contained_path, parse_edit_response
+
+
+def _block(search, replace):
+    return f"<<<<<<< SEARCH\n{search}\n=======\n{replace}\n>>>>>>> REPLACE\n"
+
+
+def test_path_comes_from_the_line_before_the_block():
+    text = "pkg/mod.py\n" + _block("a = 1", "a = 2")
+
+    edits, _ = parse_edit_response(text)
+    assert [(e.path, e.search, e.replace) for e in edits] == [('pkg/mod.py', 'a = 1', 'a = 2')]
+
+
+def test_path_before_an_opening_fence():
+    text = "pkg/mod.py\n```python\n" + _block("a = 1", "a = 2") + "```\n"
+
+    assert [e.path for e in parse_edit_response(text)[0]] == ['pkg/mod.py']
+
+
+def test_dotted_words_in_prose_are_not_paths():
+    text = "Done. Bumped to v1.2 as requested.\n" + _block("a = 1", "a = 2")
+
+    assert parse_edit_response(text)[0] == []
+
+
+def test_prose_between_path_and_block_drops_the_block():
+    text = "pkg/mod.py\nThis changes the constant, see v1.2.\n" + _block("a = 1", "a = 2")
+
+    assert parse_edit_response(text)[0] == []
+
+
+def test_non_python_path_must_exist(tmp_path):
+    (tmp_path / 'setup.cfg').write_text('[metadata]\n')
+    text = "setup.cfg\n" + _block("[metadata]", "[metadata]\nname = x") + "notes.txt\n" + _block("", "x")
+
+    edits, _ = parse_edit_response(text, tmp_path)
+    assert [e.path for e in edits] == ['setup.cfg']
+
+
+def test_consecutive_blocks_keep_the_path():
+    text = "mod.py\n" + _block("a = 1", "a = 2") + "\n" + _block("b = 1", "b = 2")
+
+    assert [e.path for e in parse_edit_response(text)[0]] == ['mod.py', 'mod.py']
+
+
+def test_ambiguous_search_is_rejected():
+    content = "def f():\n    return 1\n\ndef g():\n    return 1\n"
+
+    new, kind = apply_edit(content, EditBlock('mod.py', '    return 1', '    return 2'))
+    assert (new, kind) == (None, 'ambiguous')
+
+    new, kind = apply_edit(content, EditBlock('mod.py', 'def g():\n    return 1', 'def g():\n    return 2'))
+    assert kind == 'exact'
+    assert new == "def f():\n    return 1\n\ndef g():\n    return 2\n"
+
+
+def test_whitespace_match_reindents_the_replacement():
+    content = "class A:\n    def f(self):\n        return 1\n"
+
+    new, kind = apply_edit(content, EditBlock('mod.py', 'def f(self):\n    return 1', 'def f(self):\n    return 2'))
+    assert kind == 'whitespace'
+    assert new == "class A:\n    def f(self):\n        return 2\n"
+
+
+def test_failed_edits_leave_the_file_out(tmp_path):
+    (tmp_path / 'mod.py').write_text("x = 1\nx = 1\n")
+
+    updated, failed = apply_edits(tmp_path, [EditBlock('mod.py', 'x = 1', 'x = 2')])
+    assert updated == {}
+    assert list(failed) == ['mod.py']
+
+
+def test_edits_outside_the_checkout_fail_without_being_read(tmp_path):
+    repo = tmp_path / 'repo'
+    repo.mkdir()
+    outside = tmp_path / 'x.py'
+    outside.write_text('a = 1\n')
+    edits = [
+        EditBlock(str(outside), 'a = 1', 'a = 2'),
+        EditBlock('../x.py', 'a = 1', 'a = 2'),
+        EditBlock('pkg/../../x.py', 'a = 1', 'a = 2'),
+    ]
+
+    updated, failed = apply_edits(repo, edits)
+    assert updated == {}
+    assert sorted(failed) == sorted([str(outside), '../x.py', 'pkg/../../x.py'])
+    assert outside.read_text() == 'a = 1\n'
+
+
+def test_contained_path(tmp_path):
+    assert contained_path(tmp_path, 'pkg/mod.py') == (tmp_path / 'pkg' / 'mod.py').resolve()
+    assert contained_path(tmp_path, '/etc/hostname.py') is None
+    assert contained_path(tmp_path, '../mod.py') is None
+    assert contained_path(tmp_path, '.') is None
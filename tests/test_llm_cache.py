@@ -0,0 +1,119 @@
+import os
+import time
+
+import pytest
+
+from llm_cache import CompletionCache, DiskStore
+
+
+def _age(store, key, seconds):
+    path = store._entry_path(key)
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def _cache(tmp_path, mode):
+    return CompletionCache(cache_dir=str(tmp_path), mode=mode)
+
+
+def _stream(pieces, calls):
+    calls.append(1)
+    yield from pieces
+
+
+def test_disk_store_evicts_least_recently_used_entries_over_size(tmp_path):
+    store = DiskStore(str(tmp_path), max_bytes=0, max_age_seconds=0)
+    for key in ('aa1', 'bb2', 'cc3'):
+        store.put(key, {'completion': 'x' * 100})
+    _age(store, 'aa1', 30)
+    _age(store, 'bb2', 20)
+    _age(store, 'cc3', 10)
+    assert store.get('aa1') is not None  # touching it makes bb2 the oldest
+    entry_size = store._entry_path('cc3').stat().st_size
+
+    store.max_bytes = 3 * entry_size
+    store.put('dd4', {'completion': 'x' * 100})
+
+    assert store.get('bb2') is None
+    assert all(store.get(key) is not None for key in ('aa1', 'cc3', 'dd4'))
+
+
+def test_disk_store_drops_expired_entries(tmp_path):
+    store = DiskStore(str(tmp_path), max_age_seconds=60)
+    store.put('old', {'completion': 'stale'})
+    store.put('new', {'completion': 'fresh'})
+    _age(store, 'old', 120)
+
+    assert store.get('old') is None
+    assert not store._entry_path('old').exists()
+    assert store.get('new') == {'completion': 'fresh'}
+
+    _age(store, 'new', 120)
+    assert store.evict() == 1
+
+
+def test_use_mode_computes_once_then_hits(tmp_path):
+    cache = _cache(tmp_path, 'use')
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return 'answer'
+
+    for _ in range(2):
+        assert cache.get_or_compute('model', 'prompt', 100, None, compute) == 'answer'
+
+    assert len(calls) == 1
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 1)
+
+
+def test_refresh_mode_recomputes_and_stores(tmp_path):
+    _cache(tmp_path, 'use').get_or_compute('model', 'prompt', 100, None, lambda: 'old')
+
+    refresh = _cache(tmp_path, 'refresh')
+    assert refresh.get_or_compute('model', 'prompt', 100, None, lambda: 'new') == 'new'
+
+    assert _cache(tmp_path, 'use').get_or_compute('model', 'prompt', 100, None, lambda: 'unused') == 'new'
+
+
+def test_bypass_mode_neither_reads_nor_writes(tmp_path):
+    _cache(tmp_path, 'use').get_or_compute('model', 'prompt', 100, None, lambda: 'cached')
+
+    bypass = _cache(tmp_path, 'bypass')
+    assert bypass.get_or_compute('model', 'prompt', 100, None, lambda: 'live') == 'live'
+    bypass.get_or_compute('model', 'other prompt', 100, None, lambda: 'live')
+
+    assert _cache(tmp_path, 'use').store.get(
+        CompletionCache.make_key('model', 'other prompt', 100, None)) is None
+
+
+def test_unknown_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        _cache(tmp_path, 'sometimes')
+
+
+def test_stream_tees_deltas_then_replays_the_joined_completion(tmp_path):
+    cache = _cache(tmp_path, 'use')
+    calls = []
+
+    first = list(cache.stream_or_compute('model', 'prompt', 100, None,
+                                         lambda: _stream(['def ', 'f():', ' pass'], calls)))
+    replay = list(cache.stream_or_compute('model', 'prompt', 100, None,
+                                          lambda: _stream(['unused'], calls)))
+
+    assert first == ['def ', 'f():', ' pass']
+    assert replay == ['def f(): pass']
+    assert len(calls) == 1
+
+
+def test_stream_closed_early_stores_nothing(tmp_path):
+    cache = _cache(tmp_path, 'use')
+    calls = []
+
+    stream = cache.stream_or_compute('model', 'prompt', 100, None, lambda: _stream(['a', 'b', 'c'], calls))
+    assert next(stream) == 'a'
+    stream.close()
+
+    assert list(cache.stream_or_compute('model', 'prompt', 100, None,
+                                        lambda: _stream(['a', 'b', 'c'], calls))) == ['a', 'b', 'c']
+    assert len(calls) == 2
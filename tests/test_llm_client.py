@@ -0,0 +1,92 @@
+import sys
+import time
+
+import pytest
+
+pytest.importorskip('httpx')
+
+from fake_llm_server import FakeLLMServer
+from llm_client import LLMClient, LLMError
+
+MODEL = 'test-model'
+
+
+@pytest.fixture
+def server():
+    with FakeLLMServer(rules=[('ping', 'pong')]) as server:
+        yield server
+
+
+@pytest.fixture
+def client(server):
+    client = LLMClient(base_url=server.base_url, requests_per_second=100, max_retries=2,
+                       backoff_base=0.01, backoff_cap=0.05)
+    yield client
+    client.close()
+
+
+def test_complete_returns_text_and_usage(server, client):
+    completion = client.complete(MODEL, 'ping')
+
+    assert completion.text == 'pong'
+    assert completion.finish_reason == 'stop'
+    assert completion.prompt_tokens and completion.completion_tokens
+    assert client.usage['requests'] == 1
+
+
+def test_retries_server_errors(server, client):
+    server.fail_next(503, times=2)
+
+    assert client.complete(MODEL, 'ping').text == 'pong'
+    assert [r['status'] for r in server.requests] == [503, 503, 200]
+    assert client.usage['retries'] == 2
+
+
+def test_gives_up_after_max_retries(server, client):
+    server.fail_next(500, times=3)
+
+    with pytest.raises(LLMError) as excinfo:
+        client.complete(MODEL, 'ping')
+    assert excinfo.value.status_code == 500
+    assert len(server.requests) == 3
+
+
+def test_does_not_retry_client_errors(server, client):
+    server.fail_next(400)
+
+    with pytest.raises(LLMError) as excinfo:
+        client.complete(MODEL, 'ping')
+    assert excinfo.value.status_code == 400
+    assert len(server.requests) == 1
+
+
+def test_throttling_honours_retry_after_and_slows_down(server, client):
+    server.fail_next(429, retry_after='0.3')
+
+    start = time.monotonic()
+    assert client.complete(MODEL, 'ping').text == 'pong'
+    assert time.monotonic() - start >= 0.3
+    assert client.usage['throttled'] == 1
+    assert client._bucket.rate < client._bucket.max_rate
+
+
+def test_stream_yields_the_whole_response(server, client):
+    server.chunk_chars = 2
+    stream = client.stream(MODEL, 'ping please')
+
+    assert ''.join(stream) == 'pong'
+    assert stream.finish_reason == 'stop'
+
+
+def test_stream_retries_before_the_first_token(server, client):
+    server.fail_next(502)
+
+    assert ''.join(client.stream(MODEL, 'ping')) == 'pong'
+    assert [r['status'] for r in server.requests] == [502, 200]
+
+
+def test_missing_httpx_raises_instead_of_hanging(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'httpx', None)
+
+    with pytest.raises(ImportError):
+        LLMClient().complete(MODEL, 'ping')
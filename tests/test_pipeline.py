@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+
+from pipeline import StageGraph, StopPipeline, fingerprint, load_stage_output
+
+
+def _graph(checkpoint_path, calls, prompt='prompt', is_valid=None):
+    def record(name, value):
+        calls.append(name)
+        return value
+
+    graph = StageGraph('test', checkpoint_path=checkpoint_path)
+    graph.add('prompt', lambda: record('prompt', prompt))
+    graph.add('think', lambda p: record('think', f"thought about {p}"), deps=['prompt'],
+              key=lambda p: fingerprint('think', p), is_valid=is_valid)
+    graph.add('generate', lambda p, t: record('generate', f"{t} -> tests"), deps=['prompt', 'think'],
+              key=lambda p, t: fingerprint('generate', p, t))
+    return graph
+
+
+def test_stage_with_unchanged_key_is_skipped(tmp_path):
+    checkpoint = tmp_path / 'checkpoint.json'
+    first_calls, second_calls = [], []
+
+    first = _graph(checkpoint, first_calls).run()
+    graph = _graph(checkpoint, second_calls)
+    second = graph.run()
+
+    assert first_calls == ['prompt', 'think', 'generate']
+    assert second_calls == ['prompt']  # keyless stages always run
+    assert second == first
+    assert sorted(graph.skipped) == ['generate', 'think']
+    assert load_stage_output(checkpoint, 'generate') == 'thought about prompt -> tests'
+
+
+def test_changed_input_reruns_dependent_stages(tmp_path):
+    checkpoint = tmp_path / 'checkpoint.json'
+    _graph(checkpoint, []).run()
+    calls = []
+
+    results = _graph(checkpoint, calls, prompt='other prompt').run()
+
+    assert calls == ['prompt', 'think', 'generate']
+    assert results['generate'] == 'thought about other prompt -> tests'
+
+
+def test_is_valid_rejecting_the_checkpoint_forces_a_rerun(tmp_path):
+    checkpoint = tmp_path / 'checkpoint.json'
+    _graph(checkpoint, []).run()
+    calls = []
+
+    _graph(checkpoint, calls, is_valid=lambda output: False).run()
+
+    # think reran with the same output, so generate's key still matches
+    assert calls == ['prompt', 'think']
+
+
+def test_independent_stages_run_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+
+    def meet(name):
+        barrier.wait()  # raises BrokenBarrierError if the stages ran one after the other
+        return name
+
+    graph = StageGraph('test', max_workers=2)
+    graph.add('left', lambda: meet('left'))
+    graph.add('right', lambda: meet('right'))
+    graph.add('join', lambda left, right: left + right, deps=['left', 'right'])
+
+    assert graph.run()['join'] == 'leftright'
+
+
+def test_stop_pipeline_returns_outputs_so_far():
+    def stop(value):
+        raise StopPipeline('nothing to do')
+
+    graph = StageGraph('test')
+    graph.add('first', lambda: 1)
+    graph.add('stop', stop, deps=['first'])
+    graph.add('never', lambda value: pytest.fail('ran after StopPipeline'), deps=['stop'])
+
+    assert graph.run() == {'first': 1}
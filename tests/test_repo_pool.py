@@ -0,0 +1,158 @@
+import json
+import argparse
+import subprocess
+import threading
+
+import pytest
+
+pytest.importorskip('git')
+
+import cli
+import test_generation_agent
+from repo_pool import KEEP_ON_RESET, RepoPool
+
+
+def _git(cwd, *args):
+    return subprocess.run(
+        ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com', *args],
+        cwd=cwd, check=True, capture_output=True, text=True,
+    ).stdout.strip()
+
+
+@pytest.fixture
+def repo_url(tmp_path):
+    """file:// URL of a bare repository with one commit"""
+    source = tmp_path / 'source'
+    source.mkdir()
+    _git(source, 'init', '-q')
+    (source / 'module.py').write_text('VALUE = 1\n')
+    _git(source, 'add', 'module.py')
+    _git(source, 'commit', '-q', '-m', 'initial')
+    bare = tmp_path / 'remote.git'
+    _git(tmp_path, 'clone', '-q', '--bare', str(source), str(bare))
+    return bare.as_uri()
+
+
+@pytest.fixture
+def pool(tmp_path):
+    return RepoPool(root=str(tmp_path / 'pool'))
+
+
+def _states(pool, repo_url):
+    return sorted(meta['state'] for meta in pool._worktrees(repo_url))
+
+
+def test_lease_checks_out_remote_head(pool, repo_url):
+    with pool.lease(repo_url) as lease:
+        assert (lease.path / 'module.py').read_text() == 'VALUE = 1\n'
+        assert _git(lease.path, 'rev-parse', 'HEAD') == lease.commit
+        assert _states(pool, repo_url) == ['leased']
+    assert _states(pool, repo_url) == ['idle']
+
+
+def test_released_worktree_is_reset_and_reused(pool, repo_url):
+    with pool.lease(repo_url) as lease:
+        first = lease.path
+        (first / 'module.py').write_text('VALUE = 2\n')
+        (first / 'generated.py').write_text('')
+        (first / KEEP_ON_RESET).mkdir()
+        (first / KEEP_ON_RESET / 'state').write_text('kept')
+
+    with pool.lease(repo_url) as lease:
+        assert lease.path == first
+        assert (first / 'module.py').read_text() == 'VALUE = 1\n'
+        assert not (first / 'generated.py').exists()
+        assert (first / KEEP_ON_RESET / 'state').read_text() == 'kept'
+
+
+def test_concurrent_leases_get_separate_worktrees(tmp_path, repo_url):
+    # Separate pools share nothing in memory, so only the file lock keeps them apart
+    pools = [RepoPool(root=str(tmp_path / 'pool')) for _ in range(4)]
+    leases = [None] * len(pools)
+
+    def lease(i):
+        leases[i] = pools[i].lease(repo_url)
+
+    threads = [threading.Thread(target=lease, args=(i,)) for i in range(len(pools))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({lease.path for lease in leases}) == len(pools)
+    assert _states(pools[0], repo_url) == ['leased'] * len(pools)
+
+
+def test_worktree_of_dead_process_is_not_reused(pool, repo_url):
+    lease = pool.lease(repo_url)
+    meta_path = lease.path.with_suffix('.json')
+    meta = json.loads(meta_path.read_text())
+    meta['pid'] = 2 ** 22 + 1  # above pid_max, never a live process
+    meta_path.write_text(json.dumps(meta))
+
+    with pool.lease(repo_url) as second:
+        assert second.path != lease.path
+    assert lease.path.exists()
+
+
+def test_gc_removes_idle_worktrees_over_the_cap(tmp_path, repo_url):
+    pool = RepoPool(root=str(tmp_path / 'pool'), max_worktrees=1)
+    leases = [pool.lease(repo_url) for _ in range(3)]
+    for lease in leases:
+        lease.release()
+
+    assert pool.gc(repo_url) == 2
+    assert pool.worktree_paths(repo_url) == [leases[-1].path]
+
+
+def test_generate_tests_command_releases_its_lease(monkeypatch, pool, repo_url):
+    class FailingGenerator:
+        def __init__(self, repo_url, feature_description, api_key, **options):
+            self.repo_url = repo_url
+            self.lease = None
+
+        def generate_and_run_tests(self):
+            self.lease = pool.lease(self.repo_url)
+            raise RuntimeError("generation failed")
+
+    monkeypatch.setattr(test_generation_agent, 'TestCaseGenerator', FailingGenerator)
+    monkeypatch.setenv('TOGETHER_API_KEY', 'test')
+    args = argparse.Namespace(repo_url=repo_url, feature_description='feature', repo_path=None,
+                              context_budget=None, test_workers=None, test_timeout=None, static_repairs=None)
+
+    with pytest.raises(RuntimeError):
+        cli.generate_tests(args)
+    assert _states(pool, repo_url) == ['idle']
+
+
+def test_latest_skips_worktrees_leased_by_another_job(pool, repo_url):
+    first = pool.lease(repo_url)
+    first.release()
+    second = pool.lease(repo_url)
+    assert second.path == first.path
+
+    assert pool.latest(repo_url) is None
+    second.release()
+    assert pool.latest(repo_url) == first.path
+
+
+def test_implementer_uses_the_checkout_in_the_generators_checkpoint(monkeypatch, tmp_path, pool, repo_url):
+    from code_generation_agent import FeatureImplementer
+    from pipeline import default_checkpoint_path
+
+    monkeypatch.setenv('STAGE_CHECKPOINT_DIR', str(tmp_path / 'stages'))
+    implementer = FeatureImplementer(repo_url, 'feature', 'key', repo_pool=pool)
+    assert implementer.generator_checkout() is None
+
+    with pool.lease(repo_url) as lease:
+        test_file = lease.path / 'generated_test_cases.py'
+        test_file.write_text('def test_x():\n    pass\n')
+        checkpoint = default_checkpoint_path('generate_tests', repo_url, 'feature')
+        checkpoint.parent.mkdir(parents=True)
+        checkpoint.write_text(json.dumps({'generate': {'key': 'k', 'output': {
+            'test_file': str(test_file), 'checkout': str(lease.path)}}}))
+        assert implementer.generator_checkout() == lease.path
+
+    # A later lease resets the worktree and deletes the generated tests
+    pool.lease(repo_url).release()
+    assert implementer.generator_checkout() is None
@@ -0,0 +1,62 @@
+import json
+import threading
+
+from speculative import MAX_CANDIDATES, SpeculativeSearch, candidate_settings
+from test_impact import TestImpactMap
+
+TEST_FILE = 'generated_test_cases.py'
+PASSING = "```python:calc.py\ndef add(a, b):\n    return a + b\n```\n"
+FAILING = "```python:calc.py\ndef add(a, b):\n    return a - b\n```\n"
+
+
+def _repo(tmp_path):
+    repo = tmp_path / 'repo'
+    repo.mkdir()
+    (repo / 'calc.py').write_text('def add(a, b):\n    raise NotImplementedError\n')
+    (repo / TEST_FILE).write_text('from calc import add\n\ndef test_add():\n    assert add(2, 3) == 5\n')
+    return repo
+
+
+def test_candidate_settings_never_repeat():
+    pairs = [candidate_settings(i) for i in range(MAX_CANDIDATES)]
+    assert len(set(pairs)) == MAX_CANDIDATES
+    # The first three keep the diagonal pairing
+    assert [variant for _, variant in pairs[:3]] == [0, 1, 2]
+
+
+def test_candidates_are_capped_at_distinct_pairs(tmp_path):
+    search = SpeculativeSearch(tmp_path, TEST_FILE, lambda prompt, temperature: iter(()),
+                               candidates=MAX_CANDIDATES + 3)
+    assert len(search.candidates) == MAX_CANDIDATES
+
+
+def test_first_passing_candidate_wins(tmp_path):
+    repo = _repo(tmp_path)
+    lock = threading.Lock()
+    calls = []
+
+    def generate(prompt, temperature):
+        with lock:
+            calls.append(temperature)
+        return iter([PASSING if temperature == 1.0 else FAILING])
+
+    best = SpeculativeSearch(repo, TEST_FILE, generate, candidates=3, max_repairs=0).run('implement add')
+
+    assert best is not None and best.passed
+    assert best.temperature == 1.0
+    assert best.files == {'calc.py': 'def add(a, b):\n    return a + b'}
+
+
+def test_candidates_do_not_record_into_the_checkouts_impact_map(tmp_path):
+    repo = _repo(tmp_path)
+    impact = TestImpactMap(repo)
+    impact._data = {'version': 1, 'fingerprint': None, 'tests': {}}
+    before = json.dumps(impact._data, sort_keys=True)
+
+    search = SpeculativeSearch(repo, TEST_FILE, lambda prompt, temperature: iter([FAILING]),
+                               candidates=2, max_repairs=0, impact=impact)
+    best = search.run('implement add')
+
+    assert best is not None and not best.passed
+    assert json.dumps(impact._data, sort_keys=True) == before
+    assert not impact.path.exists()
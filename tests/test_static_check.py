@@ -0,0 +1,45 @@
+from static_check import StaticChecker, StaticIssue, blocking_issues
+
+REPO_FILES = [{'path': 'pkg/__init__.py'}, {'path': 'pkg/core.py'}]
+
+
+def _check(tmp_path, source):
+    return StaticChecker(tmp_path, REPO_FILES).check_files({'tests/test_feature.py': source})
+
+
+def test_syntax_error_blocks(tmp_path):
+    issues = _check(tmp_path, 'def test_x(:\n    pass\n')
+
+    assert [issue.kind for issue in blocking_issues(issues)] == ['syntax']
+
+
+def test_undefined_name_blocks(tmp_path):
+    issues = _check(tmp_path, 'def test_x():\n    assert helper() == 1\n')
+
+    assert [(issue.kind, issue.blocking) for issue in issues] == [('undefined-name', True)]
+
+
+def test_imports_of_modules_the_feature_will_add_only_warn(tmp_path):
+    source = (
+        'from pkg.core import run\n'
+        'from pkg.exporter import export\n'
+        'import new_module\n'
+        '\n'
+        'def test_export():\n'
+        '    assert export(run()) == new_module.VALUE\n'
+    )
+    issues = _check(tmp_path, source)
+
+    assert [(issue.kind, issue.severity) for issue in issues] == [('import', 'warning'), ('import', 'warning')]
+    assert blocking_issues(issues) == []
+    assert '[import warning]' in issues[0].format()
+
+
+def test_installed_and_stdlib_imports_resolve(tmp_path):
+    assert _check(tmp_path, 'import os\nimport pytest\nfrom pkg import core\n') == []
+
+
+def test_issue_round_trips_through_a_checkpoint():
+    old = StaticIssue(**{'path': 'a.py', 'line': 1, 'column': 1, 'kind': 'import', 'message': 'missing'})
+    assert not old.blocking
+    assert StaticIssue(**old.to_dict()).severity == 'warning'
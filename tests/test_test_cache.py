@@ -0,0 +1,98 @@
+import shutil
+
+import test_cache
+from test_cache import TestResultCache
+from test_impact import TestImpactMap
+from test_runner import ShardedTestRunner, TestReport
+
+TEST_FILE = 'from pkg import VALUE\n\n\ndef test_value():\n    assert VALUE == 1\n'
+
+
+def _checkout(root):
+    (root / 'pkg').mkdir(parents=True)
+    (root / 'pkg' / '__init__.py').write_text('VALUE = 1\n', encoding='utf-8')
+    (root / 'test_feature.py').write_text(TEST_FILE, encoding='utf-8')
+    return root
+
+
+def _key(cache, repo, options=None):
+    return cache.make_key(repo, repo / 'test_feature.py', None, options or {'per_test_timeout': 60})
+
+
+def _report():
+    return TestReport([{'nodeid': 'test_feature.py::test_value', 'outcome': 'passed'}], 'output', 2.0, 1)
+
+
+def test_stored_report_is_returned_for_an_unchanged_checkout(tmp_path):
+    repo = _checkout(tmp_path / 'repo')
+    cache = TestResultCache(cache_dir=str(tmp_path / 'cache'), mode='use')
+    key = _key(cache, repo)
+
+    assert cache.get(key) is None
+    cache.put(key, _report())
+
+    assert _key(cache, repo) == key
+    assert cache.get(key).tests == _report().tests
+    assert cache.stats()['hits'] == 1
+
+
+def test_key_ignores_the_checkout_location(tmp_path):
+    repo = _checkout(tmp_path / 'repo')
+    copy = tmp_path / 'copy'
+    shutil.copytree(repo, copy)
+    cache = TestResultCache(cache_dir=str(tmp_path / 'cache'))
+
+    assert _key(cache, copy) == _key(cache, repo)
+
+
+def test_changing_a_file_invalidates_the_entry(tmp_path):
+    repo = _checkout(tmp_path / 'repo')
+    cache = TestResultCache(cache_dir=str(tmp_path / 'cache'))
+    key = _key(cache, repo)
+    cache.put(key, _report())
+
+    (repo / 'pkg' / '__init__.py').write_text('VALUE = 2\n', encoding='utf-8')
+    assert _key(cache, repo) != key
+
+    (repo / 'pkg' / 'extra.py').write_text('', encoding='utf-8')
+    (repo / 'pkg' / '__init__.py').write_text('VALUE = 1\n', encoding='utf-8')
+    assert _key(cache, repo) != key
+
+
+def test_ignored_files_do_not_affect_the_key(tmp_path):
+    repo = _checkout(tmp_path / 'repo')
+    (repo / '.gitignore').write_text('*.log\n', encoding='utf-8')
+    cache = TestResultCache(cache_dir=str(tmp_path / 'cache'))
+    key = _key(cache, repo)
+
+    (repo / 'run.log').write_text('noise', encoding='utf-8')
+    (repo / '__pycache__').mkdir()
+    (repo / '__pycache__' / 'x.pyc').write_bytes(b'\0')
+
+    assert _key(cache, repo) == key
+
+
+def test_environment_change_invalidates_the_entry(tmp_path, monkeypatch):
+    repo = _checkout(tmp_path / 'repo')
+    cache = TestResultCache(cache_dir=str(tmp_path / 'cache'))
+    key = _key(cache, repo)
+
+    monkeypatch.setattr(test_cache, 'environment_fingerprint', lambda: 'other interpreter')
+
+    assert _key(cache, repo) != key
+
+
+def test_cached_report_without_coverage_is_not_served_to_an_impact_run(tmp_path):
+    repo = _checkout(tmp_path / 'repo')
+    cache = TestResultCache(cache_dir=str(tmp_path / 'cache'))
+    impact = TestImpactMap(repo)
+
+    for _ in range(2):
+        ShardedTestRunner(repo, workers=1, cache=cache).run(repo / 'test_feature.py')
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    report = ShardedTestRunner(repo, workers=1, cache=cache, impact=impact).run(repo / 'test_feature.py')
+
+    assert report.passed
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert list(impact._data['tests']) == ['test_feature.py::test_value']
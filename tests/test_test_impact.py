@@ -0,0 +1,107 @@
+from test_impact import TestImpactMap
+from test_runner import ShardedTestRunner
+
+TEST_FILE = (
+    'from pkg.a import double\n'
+    'from pkg.b import triple\n'
+    '\n\n'
+    'def test_double():\n'
+    '    assert double(2) == 4\n'
+    '\n\n'
+    'def test_triple():\n'
+    '    assert triple(2) == 6\n'
+)
+IDS = ['test_feature.py::test_double', 'test_feature.py::test_triple']
+
+
+def _checkout(root):
+    (root / 'pkg').mkdir(parents=True)
+    (root / 'pkg' / '__init__.py').write_text('', encoding='utf-8')
+    (root / 'pkg' / 'a.py').write_text('def double(x):\n    return 2 * x\n', encoding='utf-8')
+    (root / 'pkg' / 'b.py').write_text('def triple(x):\n    return 3 * x\n', encoding='utf-8')
+    (root / 'test_feature.py').write_text(TEST_FILE, encoding='utf-8')
+    return root
+
+
+def _result(node_id, covered, outcome='passed'):
+    test = {'nodeid': node_id, 'outcome': outcome, 'duration': 0.1}
+    if covered is not None:
+        test['coverage'] = {rel: [1, 2] for rel in covered}
+    return test
+
+
+def _recorded(tmp_path, results):
+    repo = _checkout(tmp_path / 'repo')
+    impact = TestImpactMap(repo)
+    assert impact.select(repo, repo / 'test_feature.py', IDS) == (IDS, [])
+    impact.update(repo, results)
+    return repo, impact
+
+
+def _select(impact, repo, node_ids=IDS, force_full=False):
+    selected, reused = impact.select(repo, repo / 'test_feature.py', node_ids, force_full)
+    return selected, [test['nodeid'] for test in reused]
+
+
+def test_map_without_data_runs_every_test(tmp_path):
+    repo = _checkout(tmp_path / 'repo')
+
+    assert _select(TestImpactMap(repo), repo) == (IDS, [])
+
+
+def test_only_tests_covering_a_changed_file_run(tmp_path):
+    repo, impact = _recorded(tmp_path, [_result(IDS[0], ['pkg/a.py']), _result(IDS[1], ['pkg/b.py'])])
+
+    assert _select(impact, repo) == ([], IDS)
+
+    (repo / 'pkg' / 'b.py').write_text('def triple(x):\n    return x * 3\n', encoding='utf-8')
+    assert _select(impact, repo) == ([IDS[1]], [IDS[0]])
+
+
+def test_new_failed_and_unrecorded_tests_run(tmp_path):
+    repo, impact = _recorded(tmp_path, [
+        _result(IDS[0], ['pkg/a.py'], outcome='failed'),
+        _result(IDS[1], None),  # killed before it reported coverage
+    ])
+    new_id = 'test_feature.py::test_new'
+
+    assert _select(impact, repo, IDS + [new_id]) == (IDS + [new_id], [])
+
+
+def test_reused_results_are_the_recorded_ones(tmp_path):
+    repo, impact = _recorded(tmp_path, [_result(IDS[0], ['pkg/a.py']), _result(IDS[1], ['pkg/b.py'])])
+
+    _, reused = impact.select(repo, repo / 'test_feature.py', IDS)
+
+    assert [(test['outcome'], test['reused']) for test in reused] == [('passed', True), ('passed', True)]
+    assert all('coverage' not in test for test in reused)
+
+
+def test_test_file_change_or_force_full_runs_everything(tmp_path):
+    repo, impact = _recorded(tmp_path, [_result(IDS[0], ['pkg/a.py']), _result(IDS[1], ['pkg/b.py'])])
+
+    assert _select(impact, repo, force_full=True) == (IDS, [])
+
+    repo, impact = _recorded(tmp_path / 'second', [_result(IDS[0], ['pkg/a.py']), _result(IDS[1], ['pkg/b.py'])])
+    (repo / 'test_feature.py').write_text(TEST_FILE + '\n', encoding='utf-8')
+    assert _select(impact, repo) == (IDS, [])
+
+
+def test_map_survives_a_reload(tmp_path):
+    repo, _ = _recorded(tmp_path, [_result(IDS[0], ['pkg/a.py']), _result(IDS[1], ['pkg/b.py'])])
+
+    assert _select(TestImpactMap(repo), repo) == ([], IDS)
+
+
+def test_runner_records_coverage_only_with_an_impact_map(tmp_path):
+    repo = _checkout(tmp_path / 'repo')
+
+    plain = ShardedTestRunner(repo, workers=1).run(repo / 'test_feature.py')
+    assert plain.passed
+    assert all('coverage' not in test for test in plain.tests)
+
+    impact = TestImpactMap(repo)
+    ShardedTestRunner(repo, workers=1, impact=impact).run(repo / 'test_feature.py')
+    recorded = impact._data['tests']
+    assert sorted(recorded) == IDS
+    assert 'pkg/a.py' in recorded[IDS[0]]['files'] and 'pkg/b.py' not in recorded[IDS[0]]['files']
@@ -0,0 +1,40 @@
+import textwrap
+
+from test_runner import ShardedTestRunner
+
+TEST_FILE = textwrap.dedent('''
+    import pytest
+
+    @pytest.mark.parametrize('value', ['a', 'hello world'])
+    def test_param(value):
+        assert value
+
+    def test_fail():
+        assert False
+''')
+
+
+def test_collect_keeps_node_ids_with_spaces(tmp_path):
+    test_file = tmp_path / 'test_sample.py'
+    test_file.write_text(TEST_FILE)
+    runner = ShardedTestRunner(tmp_path, workers=2)
+
+    assert runner.collect(test_file) == [
+        'test_sample.py::test_param[a]',
+        'test_sample.py::test_param[hello world]',
+        'test_sample.py::test_fail',
+    ]
+
+
+def test_run_reports_every_collected_test(tmp_path):
+    test_file = tmp_path / 'test_sample.py'
+    test_file.write_text(TEST_FILE)
+    report = ShardedTestRunner(tmp_path, workers=2).run(test_file)
+
+    outcomes = {test['nodeid']: test['outcome'] for test in report.tests}
+    assert outcomes == {
+        'test_sample.py::test_param[a]': 'passed',
+        'test_sample.py::test_param[hello world]': 'passed',
+        'test_sample.py::test_fail': 'failed',
+    }
+    assert not report.passed
@@ -0,0 +1,80 @@
+from context_selector import estimate_tokens
+from test_runner import TestReport
+from test_summary import summarize_failures
+
+FRAMES = [
+    {'path': 'tests/test_stats.py', 'line': 12, 'function': 'test_mean', 'code': 'assert mean(values) == 2'},
+    {'path': 'pkg/stats.py', 'line': 4, 'function': 'mean', 'code': 'return sum(values) / len(values)'},
+]
+
+
+def _failure(nodeid, value, frames=FRAMES, exception='ZeroDivisionError'):
+    return {
+        'nodeid': nodeid, 'outcome': 'failed', 'when': 'call', 'exception': exception,
+        'longrepr': f"    def test():\n>       run()\nE       {exception}: division by zero at {value}\n",
+        'frames': frames,
+    }
+
+
+def _report(tests, output=''):
+    return TestReport(tests, output, duration=1.5, shards=2)
+
+
+def test_identical_tracebacks_are_reported_once():
+    tests = [_failure(f"tests/test_stats.py::test_mean[{i}]", hex(0x1000 + i)) for i in range(8)]
+    tests.append({'nodeid': 'tests/test_stats.py::test_ok', 'outcome': 'passed'})
+
+    digest = summarize_failures(_report(tests))
+
+    assert digest.startswith('Test results: 1 passed, 8 failed\n')
+    assert digest.count('[failed]') == 1
+    assert '(8 tests)' in digest
+    assert '... 3 more' in digest  # only the first few test ids are listed
+    assert digest.count('pkg/stats.py:4 in mean') == 1
+    assert 'test_ok' not in digest
+
+
+def test_different_innermost_frames_are_separate_groups():
+    other_frames = FRAMES[:1] + [dict(FRAMES[1], function='median')]
+    tests = [
+        _failure('tests/test_stats.py::test_mean', 1),
+        _failure('tests/test_stats.py::test_median', 1, frames=other_frames),
+    ]
+
+    assert summarize_failures(_report(tests)).count('[failed]') == 2
+
+
+def test_collection_errors_come_first():
+    collect_error = {
+        'nodeid': 'tests/test_new.py', 'outcome': 'error', 'when': 'collect',
+        'exception': 'ImportError', 'message': 'ImportError: cannot import name export',
+    }
+    digest = summarize_failures(_report([_failure('tests/test_stats.py::test_mean', 1), collect_error]))
+
+    assert digest.index('[collection error]') < digest.index('[failed]')
+
+
+def test_digest_stays_within_the_token_cap():
+    tests = [
+        _failure(f"tests/test_{i}.py::test_case", i, exception=f"Error{i}",
+                 frames=[dict(FRAMES[1], function=f"func_{i}")])
+        for i in range(40)
+    ]
+
+    full = summarize_failures(_report(tests), max_tokens=100000)
+    capped = summarize_failures(_report(tests), max_tokens=200)
+
+    assert full.count('[failed]') == 40
+    assert estimate_tokens(capped) <= 200
+    assert 'more distinct failures omitted' in capped
+    assert summarize_failures(_report(tests), max_tokens=200) == capped
+
+
+def test_run_without_results_falls_back_to_the_output_tail():
+    output = 'noise\n' * 1000 + 'ERROR: file or directory not found: tests/test_feature.py\n'
+
+    digest = summarize_failures(_report([], output), max_tokens=50)
+
+    assert digest.startswith('Test results: no tests ran\n\n')
+    assert digest.endswith('not found: tests/test_feature.py')
+    assert estimate_tokens(digest) <= 50
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import subprocess
+import textwrap
+from pathlib import Path
+
+import pytest
+
+from test_worker import WarmTestWorker
+
+AGENT_DIR = str(Path(__file__).resolve().parent.parent)
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason="the warm worker needs os.fork")
+
+
+def _running(pid):
+    """True while pid exists and is not a zombie"""
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except OSError:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        return True
+
+
+@pytest.fixture
+def worker(tmp_path):
+    worker = WarmTestWorker(tmp_path, dependencies=[])
+    yield worker
+    worker.close()
+
+
+def test_run_pytest_returns_exit_code_and_output(tmp_path, worker):
+    (tmp_path / 'test_ok.py').write_text('def test_ok():\n    print("ran ok")\n')
+    output = tmp_path / 'out.log'
+
+    assert worker.run_pytest(['-q', '-s', 'test_ok.py'], str(output), timeout=60) == 0
+    assert 'ran ok' in output.read_text()
+
+
+def test_timeout_kills_the_run_and_its_processes(tmp_path, worker):
+    pid_file = tmp_path / 'sleeper.pid'
+    (tmp_path / 'test_hang.py').write_text(textwrap.dedent(f'''
+        import subprocess, sys, time
+
+        def test_hang():
+            sleeper = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+            open({str(pid_file)!r}, 'w').write(str(sleeper.pid))
+            time.sleep(60)
+    '''))
+
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        worker.run_pytest(['-q', 'test_hang.py'], str(tmp_path / 'out.log'), timeout=3)
+    assert time.monotonic() - start < 30
+    sleeper = int(pid_file.read_text())
+    deadline = time.monotonic() + 5
+    while _running(sleeper) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not _running(sleeper)
+
+
+def test_worker_exits_when_its_parent_dies(tmp_path):
+    # The parent starts a worker, reports its pid and exits without any cleanup
+    script = textwrap.dedent(f'''
+        import os, sys
+        sys.path.insert(0, {AGENT_DIR!r})
+        from test_worker import WarmTestWorker
+        worker = WarmTestWorker({str(tmp_path)!r}, dependencies=[])
+        worker.start()
+        print(worker._process.pid, flush=True)
+        os._exit(0)
+    ''')
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, timeout=120, check=True)
+    worker_pid = int(result.stdout.split()[-1])
+
+    deadline = time.monotonic() + 10
+    while _running(worker_pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not _running(worker_pid)
@@ -0,0 +1,83 @@
+import json
+import logging
+import threading
+import contextvars
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture
+def trace_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, '_tracer', tracing._tracer)  # restored after the test
+    path = tmp_path / 'trace.jsonl'
+    tracing.configure_tracing(str(path), summary=True)
+    return path
+
+
+def _spans(path):
+    spans = []
+    for line in path.read_text(encoding='utf-8').splitlines():
+        for resource in json.loads(line)['resourceSpans']:
+            for scope in resource['scopeSpans']:
+                spans.extend(scope['spans'])
+    return {span['name']: span for span in spans}
+
+
+def _attributes(span):
+    return {attribute['key']: list(attribute['value'].values())[0] for attribute in span['attributes']}
+
+
+def _run_stage():
+    with tracing.span('stage.run'):
+        pass
+
+
+def test_spans_are_exported_with_parent_and_child_ids(trace_file):
+    with tracing.span('pipeline', {'pipeline.name': 'generate_tests'}):
+        with tracing.span('stage.think'):
+            tracing.add_counts({'llm.prompt_tokens': 10})
+        # A worker thread started with a copy of the context is still a child
+        context = contextvars.copy_context()
+        worker = threading.Thread(target=context.run, args=(_run_stage,))
+        worker.start()
+        worker.join()
+        with pytest.raises(ValueError), tracing.span('stage.fail'):
+            raise ValueError('boom')
+
+    spans = _spans(trace_file)
+    root = spans['pipeline']
+
+    assert set(spans) == {'pipeline', 'stage.think', 'stage.run', 'stage.fail'}
+    assert 'parentSpanId' not in root
+    for name in ('stage.think', 'stage.run', 'stage.fail'):
+        assert spans[name]['parentSpanId'] == root['spanId']
+        assert spans[name]['traceId'] == root['traceId']
+    assert len({span['spanId'] for span in spans.values()}) == 4
+    assert _attributes(root)['llm.prompt_tokens'] == '10'  # counters roll up to ancestors
+    assert spans['stage.fail']['status'] == {'code': tracing.STATUS_ERROR, 'message': 'ValueError: boom'}
+    assert int(root['endTimeUnixNano']) >= int(spans['stage.think']['endTimeUnixNano'])
+
+
+def test_summary_table_is_logged_when_the_root_span_ends(trace_file, caplog):
+    with caplog.at_level(logging.INFO, logger='tracing'):
+        with tracing.span('pipeline'):
+            with tracing.span('stage.run') as stage:
+                stage.add('tests.total', 3)
+                stage.set_attribute('stage.skipped', True)
+
+    [summary] = [record.getMessage() for record in caplog.records if record.getMessage().startswith('Trace summary')]
+    lines = summary.splitlines()
+    assert lines[1].split()[:2] == ['span', 'ms']
+    assert lines[2].startswith('pipeline ')
+    assert lines[3].startswith('  stage.run ')
+    assert lines[2].split()[2:] == ['3']  # the tests column, rolled up from the stage
+    assert lines[3].split()[2:] == ['3', 'skipped']
+
+
+def test_spans_are_noops_while_tracing_is_off(monkeypatch):
+    monkeypatch.setattr(tracing, '_tracer', None)
+
+    assert tracing.span('anything') is tracing.NOOP_SPAN
+    assert not tracing.tracing_enabled()
@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from typing import Any, Dict, List, Optional
+
+SERVICE_NAME = 'code_generation_agent'
+# OTLP status codes
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+# Counters shown in the per-run summary table, with their column titles
+SUMMARY_COLUMNS = (
+    ('llm.prompt_tokens', 'prompt tok'),
+    ('llm.completion_tokens', 'compl tok'),
+    ('llm.prompt_bytes', 'prompt B'),
+    ('files.scanned', 'files'),
+    ('tests.total', 'tests'),
+    ('tests.failed', 'failed'),
+    ('tests.duration_s', 'test s'),
+)
+
+
+def _otlp_value(value: Any) -> Dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        # proto3 JSON encodes int64 as a string
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    if isinstance(value, (list, tuple)):
+        return {'arrayValue': {'values': [_otlp_value(v) for v in value]}}
+    return {'stringValue': str(value)}
+
+
+class Span:
+    """
+    A timed operation with attributes, exported as one OTLP/JSON line when it ends.
+
+    Use it as a context manager to make it the current span of the calling context
+    (threads started through contextvars.copy_context() inherit it). Counters added
+    with add() also accumulate on every ancestor, so a stage span carries the token
+    and test totals of the LLM requests and test runs made inside it.
+    """
+
+    def __init__(self, tracer: 'Tracer', name: str, parent: Optional['Span'] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status_code = STATUS_UNSET
+        self.status_message = ''
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self._token = None
+
+    @property
+    def duration(self) -> float:
+        """Seconds from start to end (or to now, while running)"""
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def set_attribute(self, key: str, value: Any):
+        with self.tracer.lock:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        with self.tracer.lock:
+            self.attributes.update(attributes)
+
+    def add(self, key: str, value: float = 1):
+        """Add to a counter on this span and all of its ancestors"""
+        with self.tracer.lock:
+            span = self
+            while span is not None:
+                span.attributes[key] = span.attributes.get(key, 0) + value
+                span = span.parent
+
+    def record_error(self, error: BaseException):
+        self.status_code = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {str(error)[:500]}"
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self.status_code == STATUS_UNSET:
+            self.status_code = STATUS_OK
+        self.tracer.export(self)
+
+    def __enter__(self) -> 'Span':
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        if exc is not None:
+            self.record_error(exc)
+        self.end()
+        return False
+
+    def to_otlp(self) -> Dict:
+        """The span in the OTLP/JSON encoding, without its resource wrapper"""
+        with self.tracer.lock:
+            attributes = [{'key': k, 'value': _otlp_value(v)} for k, v in self.attributes.items()]
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,  # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': attributes,
+            'status': {'code': self.status_code},
+        }
+        if self.parent is not None:
+            span['parentSpanId'] = self.parent.span_id
+        if self.status_message:
+            span['status']['message'] = self.status_message
+        return span
+
+
+class _NoopSpan:
+    """Stand-in returned while tracing is off, so call sites never check"""
+
+    name = ''
+    attributes: Dict[str, Any] = {}
+    duration = 0.0
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def add(self, key, value=1):
+        pass
+
+    def record_error(self, error):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('agent_current_span', default=None)
+
+
+class Tracer:
+    """
+    Exports finished spans as JSON lines to trace_path (one OTLP ExportTraceServiceRequest
+    per line, as the OpenTelemetry collector's file exporter writes them) and, with
+    summary, logs a table of every span of a run once its root span ends.
+    """
+
+    def __init__(self, trace_path: Optional[str] = None, summary: bool = False):
+        self.trace_path = trace_path
+        self.summary = summary
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        self._write_lock = threading.Lock()
+        # Finished spans of runs whose root is still open, kept only for the summary table
+        self._open_traces: Dict[str, List[Span]] = {}
+
+    def start_span(self, name: str, attributes: Optional[Dict[str, Any]] = None,
+                   parent: Optional[Span] = None) -> Span:
+        parent = parent if parent is not None else _current.get()
+        span = Span(self, name, parent, attributes)
+        if parent is None and self.summary:
+            with self.lock:
+                self._open_traces[span.trace_id] = []
+        return span
+
+    def export(self, span: Span):
+        if self.trace_path:
+            line = json.dumps({'resourceSpans': [{
+                'resource': {'attributes': [
+                    {'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}},
+                    {'key': 'process.pid', 'value': {'intValue': str(os.getpid())}},
+                ]},
+                'scopeSpans': [{'scope': {'name': __name__}, 'spans': [span.to_otlp()]}],
+            }]})
+            with self._write_lock:
+                try:
+                    with open(self.trace_path, 'a', encoding='utf-8') as f:
+                        f.write(line + '\n')
+                except OSError as e:
+                    self.logger.warning(f"Could not write span to {self.trace_path}: {str(e)}")
+        if self.summary:
+            with self.lock:
+                spans = self._open_traces.get(span.trace_id)
+                if spans is not None:
+                    spans.append(span)
+                if span.parent is None:
+                    spans = self._open_traces.pop(span.trace_id, None)
+            if span.parent is None and spans is not None:
+                self.logger.info(format_summary(spans))
+
+
+def format_summary(spans: List[Span]) -> str:
+    """Table of a run's spans in start order, children indented under their parents"""
+    by_parent: Dict[Optional[str], List[Span]] = {}
+    span_ids = {span.span_id for span in spans}
+    for span in spans:
+        parent_id = span.parent.span_id if span.parent is not None and span.parent.span_id in span_ids else None
+        by_parent.setdefault(parent_id, []).append(span)
+
+    rows = []
+
+    def visit(parent_id: Optional[str], depth: int):
+        for span in sorted(by_parent.get(parent_id, []), key=lambda s: s.start_ns):
+            values = []
+            for key, _ in SUMMARY_COLUMNS:
+                value = span.attributes.get(key)
+                values.append('' if value is None else f"{value:.2f}" if isinstance(value, float) else str(value))
+            status = 'error' if span.status_code == STATUS_ERROR else 'skipped' if span.attributes.get('stage.skipped') else ''
+            rows.append(['  ' * depth + span.name, f"{span.duration * 1000:.0f}"] + values + [status])
+            visit(span.span_id, depth + 1)
+
+    visit(None, 0)
+    header = ['span', 'ms'] + [title for _, title in SUMMARY_COLUMNS] + ['status']
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    lines = ['Trace summary:']
+    for row in [header] + rows:
+        cells = [row[0].ljust(widths[0])] + [cell.rjust(width) for cell, width in zip(row[1:-1], widths[1:-1])]
+        lines.append('  '.join(cells + [row[-1]]).rstrip())
+    return '\n'.join(lines)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def configure_tracing(trace_path: Optional[str] = None, summary: bool = False) -> Optional[Tracer]:
+    """
+    Turn tracing on (with a JSONL file, a per-run summary table, or both) or, with
+    neither, off. Only the arguments count: AGENT_TRACE_FILE and AGENT_TRACE_SUMMARY
+    are applied once, by the call at the end of this module when it is first imported.
+    """
+    global _tracer
+    _tracer = Tracer(trace_path, summary) if trace_path or summary else None
+    return _tracer
+
+
+def tracing_enabled() -> bool:
+    return _tracer is not None
+
+
+def span(name: str, attributes: Optional[Dict[str, Any]] = None):
+    """Context manager for a child of the current span; a shared no-op while tracing is off"""
+    if _tracer is None:
+        return NOOP_SPAN
+    return _tracer.start_span(name, attributes)
+
+
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None):
+    """A span ended explicitly with end(), e.g. by another thread; not made current"""
+    if _tracer is None:
+        return NOOP_SPAN
+    return _tracer.start_span(name, attributes)
+
+
+def current_span():
+    if _tracer is None:
+        return NOOP_SPAN
+    return _current.get() or NOOP_SPAN
+
+
+def add_counts(counts: Dict[str, float]):
+    """Add counters to the current span and its ancestors"""
+    if _tracer is None:
+        return
+    current = _current.get()
+    if current is not None:
+        for key, value in counts.items():
+            current.add(key, value)
+
+
+configure_tracing(os.environ.get("AGENT_TRACE_FILE"),
+                  os.environ.get("AGENT_TRACE_SUMMARY", "").lower() in ('1', 'true', 'yes'))